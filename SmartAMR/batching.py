@@ -0,0 +1,161 @@
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Callable, Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+# Sequences -> (len(sequences), dim) embeddings
+Embedder = Callable[[Sequence[str]], np.ndarray]
+
+
+@dataclass
+class BatchStats:
+    """Padding and throughput of scheduled embedding runs, added up with +."""
+
+    n_sequences: int = 0
+    n_windows: int = 0
+    n_batches: int = 0
+    tokens: int = 0
+    padded_tokens: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def padding_efficiency(self) -> float:
+        """Share of the computed positions holding a residue (1.0 = no padding)."""
+
+        return self.tokens / self.padded_tokens if self.padded_tokens else 1.0
+
+    @property
+    def tokens_per_s(self) -> float:
+        return self.tokens / self.elapsed if self.elapsed else 0.0
+
+    def __add__(self, other: "BatchStats") -> "BatchStats":
+        return BatchStats(self.n_sequences + other.n_sequences, self.n_windows + other.n_windows, self.n_batches + other.n_batches,
+                          self.tokens + other.tokens, self.padded_tokens + other.padded_tokens, self.elapsed + other.elapsed)
+
+    def __str__(self) -> str:
+        return (f"{self.n_sequences} sequences ({self.n_windows} windows) in {self.n_batches} batches, "
+                f"padding efficiency {self.padding_efficiency:.1%}, {self.tokens_per_s:,.0f} tokens/s")
+
+
+def length_batches(lengths: Sequence[int], max_tokens: int = 16384, max_batch: int = 64) -> Iterator[np.ndarray]:
+    """
+    Group sequences of similar length: indices sorted by length, cut so that a batch padded
+    to its longest sequence holds at most max_tokens residues (a longer sequence is alone).
+    """
+
+    order: np.ndarray = np.argsort(lengths, kind = 'stable')
+    batch: List[int] = []
+    longest: int = 0
+
+    for i in order:
+        length: int = lengths[i]
+        if batch and (len(batch) == max_batch or max(longest, length) * (len(batch) + 1) > max_tokens):
+            yield np.array(batch)
+            batch, longest = [], 0
+        batch.append(i)
+        longest = max(longest, length)
+
+    if batch:
+        yield np.array(batch)
+
+
+def split_windows(length: int, max_length: int, overlap: int = 0) -> List[Tuple[int, int]]:
+    """(start, end) windows of max_length residues covering a sequence, consecutive windows sharing at least overlap residues."""
+
+    if max_length is None or length <= max_length:
+        return [(0, length)]
+    if not 0 <= overlap < max_length:
+        raise ValueError(f"overlap must be in [0, {max_length}), got {overlap}")
+
+    # Fewest full length windows sharing at least overlap residues, spread evenly
+    n_windows: int = -(-(length - overlap) // (max_length - overlap))
+    starts: np.ndarray = np.linspace(0, length - max_length, n_windows).round().astype(int)
+
+    return [(int(start), int(start) + max_length) for start in starts]
+
+
+class BatchScheduler:
+    def __init__(self, max_tokens: int = 16384, max_batch: int = 64, max_length: int = None, overlap: int = 64) -> None:
+        """
+        Length-bucketed dynamic batching of sequences for an embedder.
+
+        Sequences longer than max_length are split into overlapping windows, the windows
+        of all the sequences are sorted by length and cut into batches holding at most
+        max_tokens residues once padded to their longest window. The window embeddings
+        are pooled back into one embedding per sequence (mean weighted by window length),
+        in the input order.
+
+        Parameters
+        ----------
+        max_tokens : int, optional
+            Padded residues per embedder call, by default 16384
+        max_batch : int, optional
+            Sequences per embedder call, by default 64
+        max_length : int, optional
+            Longest window given to the embedder, e.g. the model context, by default None (no split)
+        overlap : int, optional
+            Residues shared by consecutive windows, by default 64
+        """
+
+        self.max_tokens: int = max_tokens
+        self.max_batch: int = max_batch
+        self.max_length: int = max_length
+        self.overlap: int = overlap
+        self.stats = BatchStats()
+
+    def plan(self, lengths: Sequence[int]) -> Tuple[np.ndarray, np.ndarray, List[np.ndarray]]:
+        """
+        Windows and batches of sequences of the given lengths.
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray, List[np.ndarray]]
+            (n_windows, 3) windows as (sequence, start, end), weight of each window, batches of window indices
+        """
+
+        windows: np.ndarray = np.array([(i, start, end) for i, length in enumerate(lengths)
+                                        for start, end in split_windows(int(length), self.max_length, self.overlap)],
+                                       dtype = np.int64).reshape(-1, 3)
+        window_lengths: np.ndarray = windows[:, 2] - windows[:, 1]
+        batches: List[np.ndarray] = list(length_batches(window_lengths, self.max_tokens, self.max_batch))
+
+        return windows, window_lengths.astype(np.float64), batches
+
+    def run(self, sequences: Sequence[str], embedder: Embedder) -> np.ndarray:
+        """
+        Embed sequences through the scheduled batches, the statistics are added to self.stats.
+
+        Returns
+        -------
+        np.ndarray
+            (len(sequences), dim) float32 embeddings, in the order of sequences
+        """
+
+        start: float = perf_counter()
+        windows, weights, batches = self.plan([len(sequence) for sequence in sequences])
+
+        pooled: np.ndarray = None
+        stats = BatchStats(n_sequences = len(sequences), n_windows = len(windows), n_batches = len(batches))
+
+        for batch in batches:
+            chunks: List[str] = [sequences[i][s:e] for i, s, e in windows[batch]]
+            embedded: np.ndarray = np.asarray(embedder(chunks), dtype = np.float32)
+            if pooled is None:
+                pooled = np.zeros((len(sequences), embedded.shape[1]), dtype = np.float64)
+            np.add.at(pooled, windows[batch, 0], embedded * weights[batch, None])
+
+            lengths: np.ndarray = windows[batch, 2] - windows[batch, 1]
+            stats.tokens += int(lengths.sum())
+            stats.padded_tokens += int(lengths.max(initial = 0)) * len(batch)
+
+        if pooled is None:
+            return np.empty((len(sequences), 0), dtype = np.float32)
+
+        totals: np.ndarray = np.bincount(windows[:, 0], weights = weights, minlength = len(sequences))
+        pooled /= np.where(totals > 0, totals, 1)[:, None]
+
+        stats.elapsed = perf_counter() - start
+        self.stats += stats
+
+        return pooled.astype(np.float32)
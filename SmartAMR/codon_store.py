@@ -0,0 +1,250 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+from SmartAMR.encoding import CODONS
+from SmartAMR.scrapper import KAZUSA_URL, CodonTable
+
+STORE_FILENAME = 'codon_tables.npz'
+
+_CODON_INDEX: Dict[str, int] = {codon: i for i, codon in enumerate(CODONS)}
+
+
+def usage_vector(table: Dict[str, float]) -> np.ndarray:
+    """(64,) float32 usage vector in CODONS order of a codon -> usage dict (RNA or DNA codons), NaN for the absent codons."""
+
+    vector: np.ndarray = np.full(len(CODONS), np.nan, dtype = np.float32)
+    for codon, value in table.items():
+        vector[_CODON_INDEX[codon.replace('U', 'T')]] = value
+
+    return vector
+
+
+class CodonTableStore:
+    def __init__(self, path: str | Path, cache_size: int = 256) -> None:
+        """
+        Codon usage tables of many taxa in a single file.
+
+        The tables are kept as a (n_taxa, 64) float32 array (Kazusa frequencies per
+        thousand, codons in CODONS order, NaN if absent) indexed by taxon_id, saved in one
+        .npz file. Tables are added from CodonTable objects, from saved Kazusa pages
+        (no request) or fetched once from Kazusa, and read back either as a dense array
+        for the generators or as codon -> usage dicts, the most recent ones kept in an LRU
+        cache.
+
+        Parameters
+        ----------
+        path : str | Path
+            Path of the .npz file, loaded if it exists
+        cache_size : int, optional
+            Number of codon -> usage dicts kept in memory, by default 256
+        """
+
+        self.path = Path(path)
+        self.cache_size: int = cache_size
+        self._lock = threading.Lock()
+        self._cache: OrderedDict = OrderedDict()
+        self._pending: Dict[str, np.ndarray] = {}
+
+        if self.path.exists():
+            with np.load(self.path, allow_pickle = False) as store:
+                taxon_ids: List[str] = [str(taxon_id) for taxon_id in store['taxon_ids']]
+                self._usage: np.ndarray = store['usage'].astype(np.float32, copy = False)
+        else:
+            taxon_ids = []
+            self._usage = np.empty((0, len(CODONS)), dtype = np.float32)
+
+        self._index: Dict[str, int] = {taxon_id: i for i, taxon_id in enumerate(taxon_ids)}
+
+    @classmethod
+    def in_directory(cls, outdir: str | Path, **kwargs) -> "CodonTableStore":
+        """Open the store of a directory."""
+
+        return cls(Path(outdir) / STORE_FILENAME, **kwargs)
+
+    def __contains__(self, taxon_id: str) -> bool:
+        return str(taxon_id) in self._index or str(taxon_id) in self._pending
+
+    def __len__(self) -> int:
+        return len(self.taxon_ids)
+
+    @property
+    def taxon_ids(self) -> List[str]:
+        return list(self._index) + [taxon_id for taxon_id in self._pending if taxon_id not in self._index]
+
+    def add(self, taxon_id: str, table: Dict[str, float] | CodonTable) -> None:
+        """Add or replace the table of a taxon, written on the next save."""
+
+        if isinstance(table, CodonTable):
+            table = table.table
+
+        if not table:
+            raise ValueError(f"Codon table of {taxon_id} is empty")
+
+        taxon_id = str(taxon_id)
+        with self._lock:
+            self._pending[taxon_id] = usage_vector(table)
+            self._cache.pop(taxon_id, None)
+
+    def add_html(self, taxon_id: str, html_content: str) -> None:
+        """Add the table of a taxon from a saved Kazusa page."""
+
+        codon_table = CodonTable(KAZUSA_URL)
+        codon_table.parse_html(str(taxon_id), html_content, replace_uracil = True)
+        self.add(taxon_id, codon_table)
+
+    def import_html(self, directory: str | Path, pattern: str = '*.html') -> Dict[str, str]:
+        """
+        Add the tables of a directory of saved Kazusa pages, named <taxon_id>.html.
+
+        Returns
+        -------
+        Dict[str, str]
+            Pages that could not be parsed, with the error message
+        """
+
+        errors: Dict[str, str] = {}
+        for page in sorted(Path(directory).glob(pattern)):
+            try:
+                self.add_html(page.stem, page.read_text(errors = 'replace'))
+            except Exception as e:
+                print(f"Error of parsing: {page} - {e}")
+                errors[page.stem] = str(e)
+
+        return errors
+
+    def fetch(self, taxon_ids: Iterable[str], base_url: str = KAZUSA_URL, wait: float = 1, html_dir: str | Path = None) -> Dict[str, str]:
+        """
+        Download from Kazusa the tables of the taxa missing from the store.
+
+        Parameters
+        ----------
+        taxon_ids : Iterable[str]
+            Taxa to fetch, those already in the store are skipped
+        base_url : str, optional
+            Kazusa URL the taxon_id is appended to, by default KAZUSA_URL
+        wait : float, optional
+            Delay in seconds between two requests, by default 1
+        html_dir : str | Path, optional
+            Existing directory where the pages are saved as <taxon_id>.html, by default None
+
+        Returns
+        -------
+        Dict[str, str]
+            Taxa that could not be fetched, with the error message
+        """
+
+        codon_table = CodonTable(base_url)
+        errors: Dict[str, str] = {}
+
+        for taxon_id in dict.fromkeys(str(taxon_id) for taxon_id in taxon_ids):
+            if taxon_id in self:
+                continue
+
+            try:
+                html_content: str = codon_table.fetch_html(taxon_id)
+                if html_dir is not None:
+                    Path(html_dir, f"{taxon_id}.html").write_text(html_content)
+                self.add_html(taxon_id, html_content)
+            except Exception as e:
+                print(f"Error of fetching: {taxon_id} - {e}")
+                errors[taxon_id] = str(e)
+
+            time.sleep(wait)
+
+        return errors
+
+    def _row(self, taxon_id: str) -> np.ndarray:
+        if taxon_id in self._pending:
+            return self._pending[taxon_id]
+        if taxon_id in self._index:
+            return self._usage[self._index[taxon_id]]
+
+        raise KeyError(f"No codon table for taxon {taxon_id}")
+
+    def get(self, taxon_id: str) -> Dict[str, float]:
+        """Codon -> usage (DNA codons) of a taxon, through the LRU cache."""
+
+        taxon_id = str(taxon_id)
+        with self._lock:
+            if taxon_id in self._cache:
+                self._cache.move_to_end(taxon_id)
+                return self._cache[taxon_id]
+
+            row: np.ndarray = self._row(taxon_id)
+            table: Dict[str, float] = {codon: float(value) for codon, value in zip(CODONS, row) if not np.isnan(value)}
+
+            self._cache[taxon_id] = table
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last = False)
+
+        return table
+
+    def codon_table(self, taxon_id: str) -> CodonTable:
+        """Table of a taxon as a CodonTable (DNA codons)."""
+
+        codon_table = CodonTable(KAZUSA_URL)
+        codon_table.taxon_id = str(taxon_id)
+        codon_table.table = dict(self.get(taxon_id))
+
+        return codon_table
+
+    def load_many(self, taxon_ids: Iterable[str]) -> np.ndarray:
+        """
+        Dense usage of many taxa.
+
+        Returns
+        -------
+        np.ndarray
+            (len(taxon_ids), 64) float32 array, codons in CODONS order, NaN if absent.
+            The rows reshaped to (16, 4) follow the codon_bias_table layout of SmartAMR.sampler.
+        """
+
+        taxon_ids = [str(taxon_id) for taxon_id in taxon_ids]
+        missing: List[str] = [taxon_id for taxon_id in taxon_ids if taxon_id not in self]
+        if missing:
+            raise KeyError(f"No codon table for taxa {', '.join(missing)}")
+
+        with self._lock:
+            stored: np.ndarray = np.array([self._index.get(taxon_id, -1) for taxon_id in taxon_ids], dtype = np.intp)
+            usage: np.ndarray = self._usage[np.maximum(stored, 0)] if len(self._usage) else np.empty((len(taxon_ids), len(CODONS)), np.float32)
+            for i, taxon_id in enumerate(taxon_ids):
+                if taxon_id in self._pending:
+                    usage[i] = self._pending[taxon_id]
+
+        return usage
+
+    def to_array(self) -> np.ndarray:
+        """(n_taxa, 64) float32 usage of the whole store, rows in taxon_ids order."""
+
+        return self.load_many(self.taxon_ids)
+
+    def save(self) -> None:
+        """Write the store, the pending tables included, replacing the file atomically."""
+
+        with self._lock:
+            taxon_ids: List[str] = list(self._index)
+            usage: np.ndarray = self._usage.copy()
+            new_rows: List[np.ndarray] = []
+            for taxon_id, row in self._pending.items():
+                if taxon_id in self._index:
+                    usage[self._index[taxon_id]] = row
+                else:
+                    taxon_ids.append(taxon_id)
+                    new_rows.append(row)
+
+            if new_rows:
+                usage = np.vstack([usage, np.stack(new_rows)])
+
+            tmp_path: Path = self.path.with_name(self.path.name + '.tmp.npz')
+            np.savez(tmp_path, taxon_ids = np.array(taxon_ids, dtype = str), usage = usage)
+            os.replace(tmp_path, self.path)
+
+            self._usage = usage
+            self._index = {taxon_id: i for i, taxon_id in enumerate(taxon_ids)}
+            self._pending = {}
@@ -0,0 +1,355 @@
+"""Embed proteomes (one FASTA file per genome or phage) into per-protein and per-proteome embeddings.
+
+Usage:
+    python -m SmartAMR.embedding_pipeline phages_proteoms/ embeddings/phages --embedder kmer --workers 8
+    python -m SmartAMR.embedding_pipeline bacteria_proteoms/ embeddings/bacteria --embedder esmc_300m --max-tokens 8192
+
+Each proteome is written to its own file of a shard directory, then recorded in a
+done-manifest, so a rerun skips the proteomes already embedded.
+"""
+import argparse
+import os
+import sqlite3
+import threading
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from time import perf_counter, time
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from SmartAMR.batching import BatchScheduler, BatchStats
+from SmartAMR.embedding_store import FASTA_PATTERNS, EmbeddingStore, read_fasta_records
+
+AMINO_ACIDS: str = 'ACDEFGHIKLMNPQRSTVWY'
+DONE_FILENAME = 'embedding_manifest.sqlite'
+PROTEOMES_DIRNAME = 'proteomes'
+SHARDS_DIRNAME = 'shards'
+
+
+class KmerEmbedder:
+    def __init__(self, k: int = 2, alphabet: str = AMINO_ACIDS) -> None:
+        """
+        Lightweight protein embedder: normalized k-mer composition, len(alphabet) ** k values.
+        K-mers with a residue outside the alphabet are not counted.
+        """
+
+        self.k: int = k
+        self.alphabet: str = alphabet
+        self.dim: int = len(alphabet) ** k
+
+        self._lookup: np.ndarray = np.full(256, -1, dtype = np.int64)
+        for code, residue in enumerate(alphabet):
+            self._lookup[ord(residue)] = self._lookup[ord(residue.lower())] = code
+
+    @property
+    def name(self) -> str:
+        """Name recorded in the done-manifest, make_embedder(name) builds the same embedder for the default alphabet."""
+
+        name: str = 'kmer' if self.k == 2 else f"kmer{self.k}"
+        return name if self.alphabet == AMINO_ACIDS else f"{name}:{self.alphabet}"
+
+    def __call__(self, sequences: Sequence[str]) -> np.ndarray:
+        out: np.ndarray = np.zeros((len(sequences), self.dim), dtype = np.float32)
+        size: int = len(self.alphabet)
+
+        for i, sequence in enumerate(sequences):
+            codes: np.ndarray = self._lookup[np.frombuffer(sequence.encode('ascii', errors = 'replace'), dtype = np.uint8)]
+            if len(codes) < self.k:
+                continue
+
+            windows: np.ndarray = np.lib.stride_tricks.sliding_window_view(codes, self.k)
+            windows = windows[(windows >= 0).all(axis = 1)]
+            kmers: np.ndarray = windows @ (size ** np.arange(self.k - 1, -1, -1))
+            counts: np.ndarray = np.bincount(kmers, minlength = self.dim)
+            out[i] = counts / max(counts.sum(), 1)
+
+        return out
+
+
+class ESMEmbedder:
+    def __init__(self, model_name: str = 'esmc_300m', device: str = 'cpu') -> None:
+        """
+        ESM-C embedder (needs the esm package and the model weights): mean over the residues
+        of the last layer embeddings. The model is loaded on the first call; embed_proteomes
+        builds one embedder per worker process, so the weights are loaded once per worker.
+        """
+
+        self.model_name: str = model_name
+        self.device: str = device
+        self._client = None
+
+    @property
+    def name(self) -> str:
+        return self.model_name
+
+    def __getstate__(self) -> dict:
+        return {'model_name': self.model_name, 'device': self.device, '_client': None}
+
+    def _load(self):
+        try:
+            from esm.models.esmc import ESMC
+        except ImportError as e:
+            raise ImportError("ESMEmbedder needs the esm package, use KmerEmbedder to run without model weights") from e
+
+        self._client = ESMC.from_pretrained(self.model_name).to(self.device).eval()
+
+    def __call__(self, sequences: Sequence[str]) -> np.ndarray:
+        import torch
+
+        if self._client is None:
+            self._load()
+
+        # One padded forward pass for the whole batch, the scheduler groups sequences of similar length
+        encoded = self._client.tokenizer(list(sequences), padding = True, return_tensors = 'pt', return_special_tokens_mask = True)
+        tokens = encoded['input_ids'].to(self.device)
+        # Residues only: neither the padding nor the BOS / EOS tokens
+        mask = (encoded['attention_mask'].bool() & ~encoded['special_tokens_mask'].bool()).to(self.device)
+
+        with torch.no_grad():
+            embeddings = self._client(sequence_tokens = tokens).embeddings.float()
+
+        mask = mask.unsqueeze(-1).to(embeddings.dtype)
+        pooled = (embeddings * mask).sum(dim = 1) / mask.sum(dim = 1).clamp(min = 1)
+
+        return pooled.cpu().numpy().astype(np.float32)
+
+
+def make_embedder(name: str):
+    """'kmer', 'kmer<k>' (e.g. kmer3) or the name of an ESM-C model (e.g. esmc_300m)."""
+
+    if name.startswith('kmer'):
+        return KmerEmbedder(k = int(name[4:] or 2))
+
+    return ESMEmbedder(name)
+
+
+def shard_of(proteome_id: str, n_shards: int) -> str:
+    """Shard directory of a proteome, stable across runs."""
+
+    return f"{zlib.crc32(proteome_id.encode()) % n_shards:03d}"
+
+
+# Embedder and scheduler of a worker process, built once by _init_worker
+_WORKER_EMBEDDER = None
+_WORKER_SCHEDULER: BatchScheduler = None
+
+
+def _init_worker(embedder_name: str, embedder, scheduler: BatchScheduler) -> None:
+    """Initializer of the embed_proteomes workers: the embedder (and its model) is built once per process."""
+
+    global _WORKER_EMBEDDER, _WORKER_SCHEDULER
+    _WORKER_EMBEDDER = make_embedder(embedder_name) if embedder is None else embedder
+    _WORKER_SCHEDULER = scheduler
+
+
+def _embed_proteome(args: Tuple[str, str, str]) -> Tuple[str, np.ndarray | None, int, str, float, BatchStats, str | None]:
+    """Worker of embed_proteomes: embed the proteins of one FASTA file and write them to the shard."""
+
+    fasta_path, proteome_id, out_path = args
+    embedder, scheduler = _WORKER_EMBEDDER, _WORKER_SCHEDULER
+    # Statistics of this proteome only, the scheduler lives as long as the worker
+    scheduler.stats = BatchStats()
+    start: float = perf_counter()
+
+    try:
+        names: List[str] = []
+        sequences: List[str] = []
+        for name, sequence in read_fasta_records(fasta_path):
+            names.append(name.split()[0] if name.strip() else name)
+            sequences.append(sequence.rstrip('*'))
+        if not sequences:
+            raise ValueError("no sequence")
+
+        embeddings: np.ndarray = scheduler.run(sequences, embedder)
+
+        out: Path = Path(out_path)
+        out.parent.mkdir(parents = True, exist_ok = True)
+        # Written under a temporary name, a killed worker never leaves a file that looks complete
+        np.save(out.with_suffix('.tmp.npy'), embeddings.astype(np.float16))
+        out.with_suffix('.ids.tmp').write_text('\n'.join(names))
+        os.replace(out.with_suffix('.tmp.npy'), out)
+        os.replace(out.with_suffix('.ids.tmp'), out.with_suffix('.ids'))
+
+        return proteome_id, embeddings.mean(axis = 0), len(sequences), fasta_path, perf_counter() - start, scheduler.stats, None
+
+    except Exception as e:
+        return proteome_id, None, 0, fasta_path, perf_counter() - start, BatchStats(), f"{type(e).__name__}: {e}"
+
+
+class DoneManifest:
+    def __init__(self, path: str | Path) -> None:
+        """
+        Record of the embedded proteomes, stored as a SQLite table keyed on proteome_id.
+
+        Parameters
+        ----------
+        path : str | Path
+            Path of the SQLite file, created if it does not exist
+        """
+
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread = False)
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS proteomes (
+                    proteome_id TEXT PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    source_mtime_ns INTEGER NOT NULL,
+                    output TEXT NOT NULL,
+                    n_proteins INTEGER NOT NULL,
+                    embedder TEXT NOT NULL,
+                    elapsed REAL,
+                    updated_at REAL
+                )"""
+            )
+
+    def done(self, embedder: str) -> Dict[str, Tuple[int, str]]:
+        """proteome_id -> (source mtime, output) of the proteomes embedded with embedder."""
+
+        with self._lock:
+            rows = self._connection.execute("SELECT proteome_id, source_mtime_ns, output FROM proteomes WHERE embedder = ?", (embedder,)).fetchall()
+
+        return {proteome_id: (mtime_ns, output) for proteome_id, mtime_ns, output in rows}
+
+    def record(self, proteome_id: str, source: str, output: str, n_proteins: int, embedder: str, elapsed: float) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO proteomes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (proteome_id, source, Path(source).stat().st_mtime_ns, output, n_proteins, embedder, elapsed, time()),
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+def embed_proteomes(fasta_dir: str | Path, outdir: str | Path, embedder = None, embedder_name: str = None, workers: int = 4,
+                    scheduler: BatchScheduler = None, n_shards: int = 256, flush_every: int = 256,
+                    patterns: Tuple[str, ...] = FASTA_PATTERNS) -> Tuple[Dict[str, str], BatchStats]:
+    """
+    Embed the proteomes of a directory, one FASTA file per proteome (id = file name without extension).
+
+    Per-protein embeddings are written to outdir/shards/<shard>/<proteome_id>.npy (float16, one
+    row per protein, names in the .ids file next to it) and the mean of each proteome to the
+    EmbeddingStore outdir/proteomes. Proteomes already in the done-manifest with an unchanged
+    FASTA file and an existing output are skipped.
+
+    Parameters
+    ----------
+    fasta_dir : str | Path
+        Directory of the proteome FASTA files
+    outdir : str | Path
+        Output directory, created if it does not exist
+    embedder : Embedder, optional
+        Sequences -> (n, dim) embeddings, sent once to each worker, by default None (make_embedder(embedder_name) built in each worker)
+    embedder_name : str, optional
+        Name of the embedder, recorded in the manifest, by default None (embedder.name, or 'kmer' without embedder).
+        Required for an embedder without a name attribute
+    workers : int, optional
+        Number of worker processes, by default 4
+    scheduler : BatchScheduler, optional
+        Batching of the proteins of a proteome, by default None (BatchScheduler())
+    n_shards : int, optional
+        Number of shard directories, by default 256
+    flush_every : int, optional
+        Proteome embeddings written to the store at once, by default 256
+
+    Returns
+    -------
+    Tuple[Dict[str, str], BatchStats]
+        Proteomes that could not be embedded with the error message, batching statistics of the run
+    """
+
+    # The manifest is keyed on the embedder actually used, a proteome is embedded again with another one
+    if embedder is None:
+        embedder_name = make_embedder(embedder_name or 'kmer').name
+    elif embedder_name is None:
+        embedder_name = getattr(embedder, 'name', None)
+        if embedder_name is None:
+            raise ValueError(f"{type(embedder).__name__} has no name attribute, give the embedder_name recorded in the manifest")
+
+    scheduler = BatchScheduler() if scheduler is None else scheduler
+    outdir = Path(outdir)
+    outdir.mkdir(parents = True, exist_ok = True)
+
+    manifest = DoneManifest(outdir / DONE_FILENAME)
+    store = EmbeddingStore(outdir / PROTEOMES_DIRNAME, dtype = 'float32')
+    done: Dict[str, Tuple[int, str]] = manifest.done(embedder_name)
+
+    jobs: List[Tuple] = []
+    skipped: int = 0
+    for path in sorted({path for pattern in patterns for path in Path(fasta_dir).glob(pattern)}):
+        proteome_id: str = path.stem
+        if proteome_id in done:
+            mtime_ns, output = done[proteome_id]
+            if mtime_ns == path.stat().st_mtime_ns and Path(output).exists() and proteome_id in store:
+                skipped += 1
+                continue
+        out_path: Path = outdir / SHARDS_DIRNAME / shard_of(proteome_id, n_shards) / f"{proteome_id}.npy"
+        jobs.append((str(path), proteome_id, str(out_path)))
+
+    print(f"{skipped} proteomes already embedded, {len(jobs)} to embed")
+
+    errors: Dict[str, str] = {}
+    stats = BatchStats()
+    pending: List[Tuple] = []
+
+    def flush() -> None:
+        # The store is written before the manifest, a proteome is only marked done once both exist
+        if not pending:
+            return
+        store.add([item[0] for item in pending], np.stack([item[1] for item in pending]))
+        for proteome_id, _, n_proteins, source, elapsed, out_path in pending:
+            manifest.record(proteome_id, source, out_path, n_proteins, embedder_name, elapsed)
+        pending.clear()
+
+    try:
+        # Workers only receive the embedder name (or the given embedder) once, at startup
+        with ProcessPoolExecutor(max_workers = workers, initializer = _init_worker, initargs = (embedder_name, embedder, scheduler)) as executor:
+            futures = {executor.submit(_embed_proteome, job): job for job in jobs}
+            for n, future in enumerate(as_completed(futures), start = 1):
+                proteome_id, mean, n_proteins, source, elapsed, proteome_stats, error = future.result()
+                stats += proteome_stats
+                if error is not None:
+                    print(f"Error of embedding: {proteome_id} - {error}")
+                    errors[proteome_id] = error
+                    continue
+
+                pending.append((proteome_id, mean, n_proteins, source, elapsed, futures[future][2]))
+                if len(pending) >= flush_every:
+                    flush()
+                    print(f"{n}/{len(jobs)} proteomes embedded, {stats}")
+    finally:
+        flush()
+        manifest.close()
+
+    return errors, stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("fasta_dir", help = "directory of proteome FASTA files, one per genome or phage")
+    parser.add_argument("outdir", help = "output directory")
+    parser.add_argument("--embedder", default = "kmer", help = "'kmer', 'kmer<k>' or an ESM-C model name, by default kmer (2-mers)")
+    parser.add_argument("--workers", type = int, default = 4)
+    parser.add_argument("--max-tokens", type = int, default = 16384, help = "padded residues per embedder call")
+    parser.add_argument("--max-batch", type = int, default = 64, help = "sequences per embedder call")
+    parser.add_argument("--max-length", type = int, default = None, help = "longer proteins are split into windows, e.g. the model context")
+    parser.add_argument("--overlap", type = int, default = 64, help = "residues shared by consecutive windows")
+    parser.add_argument("--shards", type = int, default = 256, help = "number of shard directories")
+    args = parser.parse_args()
+
+    start = perf_counter()
+    scheduler = BatchScheduler(args.max_tokens, args.max_batch, args.max_length, args.overlap)
+    errors, stats = embed_proteomes(args.fasta_dir, args.outdir, embedder_name = args.embedder, workers = args.workers,
+                                    scheduler = scheduler, n_shards = args.shards)
+    print(f"Done in {perf_counter() - start:.1f} s, {len(errors)} failed")
+    print(f"Embedding: {stats} (per worker)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,399 @@
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+MANIFEST_FILENAME = 'manifest.json'
+MAX_SEGMENTS = 8
+FASTA_PATTERNS: Tuple[str, ...] = ('*.fa', '*.faa', '*.fasta')
+
+# Sequences -> (len(sequences), dim) embeddings, e.g. mean-pooled ESM-C
+Embedder = Callable[[Sequence[str]], np.ndarray]
+
+
+def read_fasta_records(fasta_path: str | Path) -> Iterator[Tuple[str, str]]:
+    """Stream the (header, sequence) records of a FASTA file, header without '>'."""
+
+    with open(fasta_path, buffering = 1 << 20) as fasta:
+        name: str = None
+        chunks: List[str] = []
+        for line in fasta:
+            if line.startswith('>'):
+                if name is not None:
+                    yield name, ''.join(chunks)
+                name = line[1:].rstrip('\r\n')
+                chunks = []
+            else:
+                chunks.append(line.strip())
+        if name is not None:
+            yield name, ''.join(chunks)
+
+
+class EmbeddingStore:
+    def __init__(self, directory: str | Path, dim: int = None, dtype: str = 'float16', max_segments: int = MAX_SEGMENTS) -> None:
+        """
+        Memory-mapped store of fixed size embeddings (e.g. mean-pooled ESM-C) indexed by id.
+
+        Embeddings are written as append-only .npy segments, each one with the ids of its
+        rows, listed in manifest.json. Segments are memory-mapped when the store is opened,
+        so a lookup returns a view of the mapping without copy, and adding proteomes
+        writes a new segment without rewriting the existing ones. An id added again is
+        served from its most recent segment until the store is compacted. The newest segments
+        are merged as they accumulate, so a store holds a few segments (each one keeps a
+        memory mapping, and so a file descriptor, open) and a row is rewritten a logarithmic
+        number of times.
+
+        Parameters
+        ----------
+        directory : str | Path
+            Directory of the store, created if it does not exist
+        dim : int, optional
+            Embedding size, by default None (read from the store, or from the first embeddings added)
+        dtype : str, optional
+            Storage type of a new store, 'float16' or 'float32', by default 'float16'
+        max_segments : int, optional
+            Maximum number of segments after an add, by default MAX_SEGMENTS (None for no limit)
+        """
+
+        self.directory = Path(directory)
+        self.directory.mkdir(parents = True, exist_ok = True)
+        self._lock = threading.Lock()
+        self._manifest_path: Path = self.directory / MANIFEST_FILENAME
+
+        self.dim: int = dim
+        self.dtype = np.dtype(dtype)
+        self.max_segments: int = max_segments
+        self._segments: List[dict] = []
+        self._matrices: List[np.ndarray] = []
+        self._segment_ids: List[List[str]] = []
+        self._index: Dict[str, Tuple[int, int]] = {}
+        self._version: Tuple[int, int] = None
+
+        self.refresh()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index)
+
+    @property
+    def ids(self) -> List[str]:
+        return list(self._index)
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Load the segments listed in the manifest, e.g. after another process added some.
+        The segments already loaded at the start of the manifest are kept, only the others are mapped.
+
+        Returns
+        -------
+        bool
+            True if the manifest changed since the last load
+        """
+
+        if not self._manifest_path.exists():
+            return False
+
+        # The manifest is replaced on each write, a new inode tells it changed
+        stat = self._manifest_path.stat()
+        version: Tuple[int, int] = (stat.st_ino, stat.st_mtime_ns)
+        if not force and version == self._version:
+            return False
+
+        manifest: dict = json.loads(self._manifest_path.read_text())
+        with self._lock:
+            loaded: List[dict] = self._segments
+            matrices: List[np.ndarray] = list(self._matrices)
+            segment_ids: List[List[str]] = list(self._segment_ids)
+            index: Dict[str, Tuple[int, int]] = dict(self._index)
+
+        # Segments are never modified, only appended or replaced by a merge under a new file name.
+        # A merge keeps the ids of the rows it shadows, so dropping the replaced segments loses none.
+        kept: int = 0
+        while kept < min(len(loaded), len(manifest['segments'])) and loaded[kept]['file'] == manifest['segments'][kept]['file']:
+            kept += 1
+        for s in range(kept, len(loaded)):
+            for key in segment_ids[s]:
+                if index.get(key, (-1,))[0] >= kept:
+                    del index[key]
+        matrices, segment_ids = matrices[:kept], segment_ids[:kept]
+
+        for s, segment in enumerate(manifest['segments'][kept:], start = kept):
+            matrices.append(np.load(self.directory / segment['file'], mmap_mode = 'r'))
+            ids: List[str] = (self.directory / segment['ids']).read_text().split('\n')[:segment['n']]
+            segment_ids.append(ids)
+            index.update((key, (s, row)) for row, key in enumerate(ids))
+
+        with self._lock:
+            self.dim = manifest['dim']
+            self.dtype = np.dtype(manifest['dtype'])
+            self._segments = manifest['segments']
+            self._matrices = matrices
+            self._segment_ids = segment_ids
+            self._index = index
+            self._version = version
+
+        return True
+
+    def _write_manifest(self, segments: List[dict]) -> None:
+        tmp_path: Path = self._manifest_path.with_suffix('.json.tmp')
+        tmp_path.write_text(json.dumps({'dim': self.dim, 'dtype': self.dtype.name, 'segments': segments}, indent = 1))
+        os.replace(tmp_path, self._manifest_path)
+
+    def _write_segment(self, ids: Sequence[str], embeddings: np.ndarray) -> dict:
+        number: int = max((int(segment['file'][4:9]) for segment in self._segments), default = 0) + 1
+        segment: dict = {'file': f"seg-{number:05d}.npy", 'ids': f"seg-{number:05d}.ids", 'n': len(ids)}
+
+        np.save(self.directory / segment['file'], embeddings.astype(self.dtype, copy = False))
+        (self.directory / segment['ids']).write_text('\n'.join(ids))
+
+        return segment
+
+    def add(self, ids: Sequence[str], embeddings: np.ndarray) -> None:
+        """Write the embeddings of ids as a new segment."""
+
+        embeddings = np.asarray(embeddings)
+        if embeddings.ndim != 2 or len(embeddings) != len(ids):
+            raise ValueError(f"Expected a ({len(ids)}, dim) embedding matrix, got shape {embeddings.shape}")
+        if any('\n' in key for key in ids):
+            raise ValueError("Embedding ids must not contain line breaks")
+
+        if self.dim is None:
+            self.dim = embeddings.shape[1]
+        elif embeddings.shape[1] != self.dim:
+            raise ValueError(f"Expected embeddings of size {self.dim}, got {embeddings.shape[1]}")
+
+        if len(ids) == 0:
+            return
+
+        self.refresh()
+        self._write_manifest(self._segments + [self._write_segment(ids, embeddings)])
+        self.refresh(force = True)
+
+        start: int = self._merge_start()
+        if start < len(self._segments) - 1:
+            self._merge(start)
+
+    def get(self, key: str) -> np.ndarray:
+        """Embedding of an id, a read-only view of the memory-mapped segment."""
+
+        s, row = self._index[key]
+        return self._matrices[s][row]
+
+    def get_many(self, ids: Iterable[str], missing: str = 'raise') -> Tuple[List[str], np.ndarray]:
+        """
+        Embeddings of many ids, gathered segment by segment.
+
+        Parameters
+        ----------
+        ids : Iterable[str]
+            Ids to look up
+        missing : str, optional
+            'raise' (KeyError) or 'skip' the ids absent from the store, by default 'raise'
+
+        Returns
+        -------
+        Tuple[List[str], np.ndarray]
+            Ids found and their (n, dim) embeddings, in the requested order
+        """
+
+        ids = list(ids)
+        found: List[str] = [key for key in ids if key in self._index]
+        if missing == 'raise' and len(found) < len(ids):
+            raise KeyError(f"{len(ids) - len(found)} ids are not in the store, e.g. {next(key for key in ids if key not in self._index)}")
+
+        out: np.ndarray = np.empty((len(found), self.dim or 0), dtype = self.dtype)
+        locations: np.ndarray = np.array([self._index[key] for key in found], dtype = np.intp).reshape(-1, 2)
+        for s in np.unique(locations[:, 0]):
+            rows: np.ndarray = np.flatnonzero(locations[:, 0] == s)
+            out[rows] = self._matrices[s][locations[rows, 1]]
+
+        return found, out
+
+    def matrix(self) -> Tuple[List[str], np.ndarray]:
+        """All the ids and their embeddings. Zero-copy when the store has a single segment (e.g. after compact)."""
+
+        if len(self._matrices) == 1 and len(self._index) == len(self._matrices[0]):
+            return self.ids, self._matrices[0]
+
+        return self.get_many(self.ids)
+
+    @staticmethod
+    def _proteome_embedding(fasta_path: str | Path, embedder: Embedder, batch_size: int) -> np.ndarray:
+        """Mean of the embeddings of the proteins of a FASTA file."""
+
+        total: np.ndarray = None
+        n: int = 0
+        batch: List[str] = []
+        for _, sequence in read_fasta_records(fasta_path):
+            batch.append(sequence)
+            if len(batch) == batch_size:
+                embedded: np.ndarray = np.asarray(embedder(batch), dtype = np.float64)
+                total = embedded.sum(axis = 0) if total is None else total + embedded.sum(axis = 0)
+                n += len(batch)
+                batch = []
+        if batch:
+            embedded = np.asarray(embedder(batch), dtype = np.float64)
+            total = embedded.sum(axis = 0) if total is None else total + embedded.sum(axis = 0)
+            n += len(batch)
+        if n == 0:
+            raise ValueError(f"No sequence in {fasta_path}")
+
+        return total / n
+
+    def add_fasta(self, fasta_path: str | Path, embedder: Embedder, key: str = None, batch_size: int = 64,
+                  segment_size: int = 4096) -> int:
+        """
+        Embed a FASTA file.
+
+        Parameters
+        ----------
+        fasta_path : str | Path
+            FASTA file
+        embedder : Embedder
+            Sequences -> (n, dim) embeddings
+        key : str, optional
+            Id of the whole file (a proteome), embedded as the mean of its proteins,
+            by default None (one embedding per record, id = header, the records already stored are skipped)
+        batch_size : int, optional
+            Number of sequences per embedder call, by default 64
+        segment_size : int, optional
+            Number of records per written segment, by default 4096
+
+        Returns
+        -------
+        int
+            Number of embeddings written
+        """
+
+        if key is not None:
+            self.add([key], self._proteome_embedding(fasta_path, embedder, batch_size)[None, :])
+            return 1
+
+        written: int = 0
+        ids: List[str] = []
+        parts: List[np.ndarray] = []
+        batch: List[Tuple[str, str]] = []
+        seen: set = set()
+
+        for name, sequence in read_fasta_records(fasta_path):
+            if name in self._index or name in seen:
+                continue
+            seen.add(name)
+            batch.append((name, sequence))
+
+            if len(batch) == batch_size:
+                ids.extend(name for name, _ in batch)
+                parts.append(np.asarray(embedder([sequence for _, sequence in batch])))
+                batch = []
+
+            if len(ids) >= segment_size:
+                self.add(ids, np.concatenate(parts))
+                written += len(ids)
+                ids, parts = [], []
+
+        if batch:
+            ids.extend(name for name, _ in batch)
+            parts.append(np.asarray(embedder([sequence for _, sequence in batch])))
+        if ids:
+            self.add(ids, np.concatenate(parts))
+            written += len(ids)
+
+        return written
+
+    def add_directory(self, fasta_dir: str | Path, embedder: Embedder, patterns: Tuple[str, ...] = FASTA_PATTERNS, batch_size: int = 64,
+                      segment_size: int = 4096) -> Dict[str, str]:
+        """
+        Embed the proteomes of a directory, one embedding per file (id = file name without extension).
+        The proteomes already in the store are skipped, so only new files are embedded.
+
+        Parameters
+        ----------
+        fasta_dir : str | Path
+            Directory of the proteome FASTA files
+        embedder : Embedder
+            Sequences -> (n, dim) embeddings
+        patterns : Tuple[str, ...], optional
+            Glob patterns of the FASTA files, by default FASTA_PATTERNS
+        batch_size : int, optional
+            Number of sequences per embedder call, by default 64
+        segment_size : int, optional
+            Number of proteomes per written segment, by default 4096
+
+        Returns
+        -------
+        Dict[str, str]
+            Files that could not be embedded, with the error message
+        """
+
+        errors: Dict[str, str] = {}
+        paths: List[Path] = sorted({path for pattern in patterns for path in Path(fasta_dir).glob(pattern)})
+        ids: List[str] = []
+        embeddings: List[np.ndarray] = []
+        seen: set = set()
+
+        try:
+            for path in paths:
+                if path.stem in self._index or path.stem in seen:
+                    continue
+                seen.add(path.stem)
+                try:
+                    embeddings.append(self._proteome_embedding(path, embedder, batch_size))
+                    ids.append(path.stem)
+                except Exception as e:
+                    print(f"Error of embedding: {path} - {e}")
+                    errors[path.stem] = str(e)
+
+                if len(ids) >= segment_size:
+                    self.add(ids, np.stack(embeddings))
+                    ids, embeddings = [], []
+        finally:
+            # The proteomes embedded before an interruption are kept
+            if ids:
+                self.add(ids, np.stack(embeddings))
+
+        return errors
+
+    def _merge_start(self) -> int:
+        """First of the newest segments to merge, the last one if there is nothing to merge."""
+
+        # As a binary counter: the newest segments are merged while the previous one is not larger,
+        # so the sizes halve from the oldest segment to the newest
+        # (the segments past max_segments are merged first)
+        sizes: List[int] = [segment['n'] for segment in self._segments]
+        start: int = len(sizes) - 1
+        if self.max_segments is not None:
+            start = min(start, max(self.max_segments - 1, 0))
+        total: int = sum(sizes[start:])
+        while start > 0 and sizes[start - 1] <= total:
+            start -= 1
+            total += sizes[start]
+
+        return start
+
+    def _merge(self, start: int) -> None:
+        """Rewrite the segments from start on as a single segment, without their shadowed rows."""
+
+        ids: List[str] = [key for s in range(start, len(self._segments)) for row, key in enumerate(self._segment_ids[s])
+                          if self._index[key] == (s, row)]
+        ids, matrix = self.get_many(ids)
+        old_files: List[str] = [name for segment in self._segments[start:] for name in (segment['file'], segment['ids'])]
+
+        segment: dict = self._write_segment(ids, matrix)
+        self._write_manifest(self._segments[:start] + [segment])
+        self.refresh(force = True)
+
+        for name in old_files:
+            (self.directory / name).unlink(missing_ok = True)
+
+    def compact(self) -> None:
+        """Rewrite the store as a single segment without the shadowed rows."""
+
+        self._merge(0)
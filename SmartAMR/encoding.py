@@ -0,0 +1,103 @@
+from typing import List, Sequence
+
+import numpy as np
+
+NUCLEOTIDES: str = 'ACGT'
+N_CODE: int = 4  # Ambiguous base (N, IUPAC codes, any other character)
+VOCAB_SIZE: int = 5
+ALPHABET: np.ndarray = np.frombuffer(b'ACGTN', dtype = np.uint8)
+
+# The 64 codons, index 16 * first + 4 * second + third base code
+CODONS: List[str] = [a + b + c for a in NUCLEOTIDES for b in NUCLEOTIDES for c in NUCLEOTIDES]
+
+# Byte -> code lookup table, upper and lower case, U read as T
+LOOKUP: np.ndarray = np.full(256, N_CODE, dtype = np.uint8)
+for code, base in enumerate(NUCLEOTIDES):
+    LOOKUP[ord(base)] = LOOKUP[ord(base.lower())] = code
+LOOKUP[ord('U')] = LOOKUP[ord('u')] = NUCLEOTIDES.index('T')
+
+
+def encode_batch(sequences: Sequence[str], length: int = None, pad_value: int = N_CODE, out: np.ndarray = None) -> np.ndarray:
+    """
+    Encode nucleotide sequences into a uint8 matrix (A=0, C=1, G=2, T=3, N/ambiguous=4)
+
+    All the sequences are translated at once through a 256-entry lookup table, then
+    scattered into the matrix: shorter sequences are padded, longer ones truncated.
+
+    Parameters
+    ----------
+    sequences : Sequence[str]
+        Nucleotide sequences
+    length : int, optional
+        Number of columns of the matrix, by default None (length of the longest sequence)
+    pad_value : int, optional
+        Code written after the end of the shorter sequences, by default N_CODE
+    out : np.ndarray, optional
+        Preallocated (len(sequences), length) uint8 matrix to fill, by default None
+
+    Returns
+    -------
+    np.ndarray
+        (len(sequences), length) uint8 matrix
+    """
+
+    raw: List[bytes] = [seq.encode('ascii', errors = 'replace') if isinstance(seq, str) else bytes(seq) for seq in sequences]
+
+    if length is None:
+        length = max((len(seq) for seq in raw), default = 0)
+
+    if out is None:
+        out = np.empty((len(raw), length), dtype = np.uint8)
+    elif out.shape != (len(raw), length) or out.dtype != np.uint8:
+        raise ValueError(f"out must be a uint8 array of shape {(len(raw), length)}, got {out.dtype} {out.shape}")
+
+    out.fill(pad_value)
+
+    truncated: List[bytes] = [seq[:length] for seq in raw]
+    lengths: np.ndarray = np.fromiter((len(seq) for seq in truncated), dtype = np.int64, count = len(truncated))
+    codes: np.ndarray = LOOKUP[np.frombuffer(b''.join(truncated), dtype = np.uint8)]
+
+    rows: np.ndarray = np.repeat(np.arange(len(truncated)), lengths)
+    starts: np.ndarray = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    out[rows, np.arange(codes.size) - starts] = codes
+
+    return out
+
+
+def encode_sequence(seq: str, length: int = None, pad_value: int = N_CODE) -> np.ndarray:
+    """Encode a single nucleotide sequence, see encode_batch."""
+
+    return encode_batch([seq], length = length, pad_value = pad_value)[0]
+
+
+def decode_batch(encoded: np.ndarray, lengths: Sequence[int] = None) -> List[str]:
+    """
+    Decode a matrix of nucleotide codes back to sequences, codes outside 0-3 are decoded as 'N'
+
+    Parameters
+    ----------
+    encoded : np.ndarray
+        (n, length) matrix of codes
+    lengths : Sequence[int], optional
+        Length of each sequence, to strip the padding, by default None (keep all the columns)
+
+    Returns
+    -------
+    List[str]
+        Decoded sequences
+    """
+
+    encoded = np.atleast_2d(np.asarray(encoded))
+    chars: np.ndarray = ALPHABET[np.minimum(encoded, N_CODE).astype(np.intp)]
+    rows: List[str] = [row.tobytes().decode('ascii') for row in chars]
+
+    if lengths is not None:
+        rows = [row[:n] for row, n in zip(rows, lengths)]
+
+    return rows
+
+
+def decode_sequence(encoded: np.ndarray) -> str:
+    """Decode a single vector of nucleotide codes, see decode_batch."""
+
+    return decode_batch(np.asarray(encoded)[None, :])[0]
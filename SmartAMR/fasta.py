@@ -0,0 +1,183 @@
+import mmap
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+FAI_SUFFIX = '.fai'
+
+
+@dataclass
+class FaiRecord:
+    """One line of a samtools `.fai` index."""
+
+    name: str
+    length: int
+    offset: int
+    linebases: int
+    linewidth: int
+
+
+def build_fasta_index(fasta_path: str | Path) -> Dict[str, FaiRecord]:
+    """
+    Scan a FASTA file once and return its `.fai`-style index, keyed by sequence id
+    (first word of the header).
+
+    Records whose lines do not all have the same width (except the last one) get
+    `linebases = linewidth = 0` and are read as a whole by FastaIndex.fetch.
+
+    Parameters
+    ----------
+    fasta_path : str | Path
+        Path to the FASTA file
+
+    Returns
+    -------
+    Dict[str, FaiRecord]
+        Index of the records in file order
+    """
+
+    index: Dict[str, FaiRecord] = {}
+    record: FaiRecord | None = None
+    short_line_seen: bool = False
+    position: int = 0
+
+    with open(fasta_path, 'rb') as handle:
+        for line in handle:
+            if line.startswith(b'>'):
+                if record is not None:
+                    index[record.name] = record
+                words: List[bytes] = line[1:].split(None, 1)
+                record = FaiRecord(name = words[0].decode() if words else '', length = 0, offset = position + len(line), linebases = -1, linewidth = -1)
+                short_line_seen = False
+
+            elif record is not None:
+                bases: int = len(line.rstrip(b'\r\n'))
+
+                if record.linebases == -1:
+                    record.linebases, record.linewidth = bases, len(line)
+                elif record.linebases > 0:
+                    # Only the last line of a record may be shorter than the others
+                    irregular: bool = (short_line_seen and bases > 0) or bases > record.linebases
+                    irregular |= bases == record.linebases and line.endswith(b'\n') and len(line) != record.linewidth
+                    if irregular:
+                        record.linebases = record.linewidth = 0
+                    short_line_seen |= bases < record.linebases
+
+                record.length += bases
+
+            position += len(line)
+
+    if record is not None:
+        index[record.name] = record
+
+    for record in index.values():
+        if record.linebases == -1:
+            record.linebases = record.linewidth = 0
+
+    return index
+
+
+def write_fasta_index(index: Dict[str, FaiRecord], fai_path: str | Path) -> None:
+    with open(fai_path, 'w') as handle:
+        for record in index.values():
+            handle.write(f"{record.name}\t{record.length}\t{record.offset}\t{record.linebases}\t{record.linewidth}\n")
+
+
+def read_fasta_index(fai_path: str | Path) -> Dict[str, FaiRecord]:
+    index: Dict[str, FaiRecord] = {}
+    with open(fai_path) as handle:
+        for line in handle:
+            name, length, offset, linebases, linewidth = line.rstrip('\n').split('\t')[:5]
+            index[name] = FaiRecord(name, int(length), int(offset), int(linebases), int(linewidth))
+
+    return index
+
+
+class FastaIndex:
+    def __init__(self, fasta_path: str | Path, persist: bool = True) -> None:
+        """
+        Random access to the sequences of a FASTA file through a `.fai` index.
+
+        The index is built on first use and written next to the FASTA file
+        (`genome.fna.fai`), later instances only read it back. Sequence slices
+        are read from a memory map of the FASTA file, so fetching a gene costs
+        one small read instead of a parse of the whole genome.
+
+        Parameters
+        ----------
+        fasta_path : str | Path
+            Path to the FASTA file
+        persist : bool, optional
+            Write the index next to the FASTA file, by default True
+        """
+
+        self.fasta_path: Path = Path(fasta_path)
+
+        if not self.fasta_path.exists():
+            raise ValueError(f"path: {fasta_path} does not exist, please provide correct path")
+
+        fai_path: Path = self.fasta_path.with_name(self.fasta_path.name + FAI_SUFFIX)
+
+        if fai_path.exists() and fai_path.stat().st_mtime >= self.fasta_path.stat().st_mtime:
+            self.index: Dict[str, FaiRecord] = read_fasta_index(fai_path)
+        else:
+            self.index: Dict[str, FaiRecord] = build_fasta_index(self.fasta_path)
+            if persist:
+                write_fasta_index(self.index, fai_path)
+
+        self._handle = open(self.fasta_path, 'rb')
+        self._map = mmap.mmap(self._handle.fileno(), 0, access = mmap.ACCESS_READ) if self.fasta_path.stat().st_size else b''
+
+    def __enter__(self) -> "FastaIndex":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.index)
+
+    def _byte_offset(self, record: FaiRecord, position: int) -> int:
+        return record.offset + (position // record.linebases) * record.linewidth + position % record.linebases
+
+    def fetch(self, name: str, start: int = 0, end: int = None) -> str:
+        """
+        Return the sequence `name[start:end]` (0-based, end excluded).
+
+        Raises
+        ------
+        KeyError
+            If `name` is not in the FASTA file
+        """
+
+        record: FaiRecord = self.index[name]
+        start, end, _ = slice(start, end).indices(record.length)
+
+        if end <= start:
+            return ''
+
+        if record.linebases == 0:
+            next_header: int = self._map.find(b'\n>', record.offset - 1)
+            stop: int = next_header + 1 if next_header != -1 else len(self._map)
+            chunk: bytes = self._map[record.offset:stop]
+            return b''.join(chunk.split()).decode()[start:end]
+
+        chunk: bytes = self._map[self._byte_offset(record, start):self._byte_offset(record, end - 1) + 1]
+        return chunk.replace(b'\n', b'').replace(b'\r', b'').decode()
+
+    def fetch_many(self, regions: List[Tuple[str, int, int]]) -> List[str]:
+        """Fetch several (name, start, end) regions."""
+
+        return [self.fetch(name, start, end) for name, start, end in regions]
+
+    def close(self) -> None:
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._handle.close()
+
@@ -0,0 +1,193 @@
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+import pandas as pd
+
+FEATURES_ROOT = '.PATRIC.features.tab'
+INDEX_FILENAME = 'features_index.sqlite'
+FEATURE_COLUMNS: List[str] = ['accession', 'start', 'end', 'strand', 'gene']
+
+# SQLite limits the number of bound parameters of a statement
+_MAX_PARAMS = 900
+
+
+def _chunks(values: List, size: int) -> Iterable[List]:
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+class FeatureIndex:
+    def __init__(self, db_path: str | Path) -> None:
+        """
+        Persistent index of the gene coordinates of many XXXX.PATRIC.features.tab files.
+
+        Coordinates are stored in a SQLite table indexed on (genome_id, gene) and
+        (gene, genome_id), so looking up genes in one genome, or the same genes across
+        thousands of genomes, does not touch the features files anymore. Genes with
+        several copies keep one row per copy.
+
+        Parameters
+        ----------
+        db_path : str | Path
+            Path of the SQLite file, created if it does not exist
+        """
+
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.db_path, check_same_thread = False)
+
+        with self._lock, self._connection:
+            self._connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS features (
+                    genome_id TEXT NOT NULL,
+                    gene TEXT NOT NULL,
+                    accession TEXT NOT NULL,
+                    start INTEGER NOT NULL,
+                    "end" INTEGER NOT NULL,
+                    strand TEXT
+                );
+                CREATE INDEX IF NOT EXISTS features_genome_gene ON features (genome_id, gene);
+                CREATE INDEX IF NOT EXISTS features_gene_genome ON features (gene, genome_id);
+                CREATE TABLE IF NOT EXISTS genomes (
+                    genome_id TEXT PRIMARY KEY,
+                    mtime_ns INTEGER NOT NULL,
+                    n_features INTEGER NOT NULL
+                );
+                """
+            )
+
+    @classmethod
+    def in_directory(cls, file_path: str | Path) -> "FeatureIndex":
+        """Open the index stored in a directory of genome files."""
+
+        return cls(Path(file_path) / INDEX_FILENAME)
+
+    def __enter__(self) -> "FeatureIndex":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __contains__(self, genome_id: str) -> bool:
+        with self._lock:
+            return self._connection.execute("SELECT 1 FROM genomes WHERE genome_id = ?", (genome_id,)).fetchone() is not None
+
+    def add_genome(self, file_path: str, genome_id: str, force: bool = False) -> int:
+        """
+        Index the features of one genome, skipped if its features file did not change since it was indexed.
+
+        Returns
+        -------
+        int
+            Number of features indexed
+        """
+
+        data_path: Path = Path.joinpath(Path(file_path), Path(genome_id + FEATURES_ROOT))
+        mtime_ns: int = data_path.stat().st_mtime_ns
+
+        with self._lock:
+            known = self._connection.execute("SELECT mtime_ns, n_features FROM genomes WHERE genome_id = ?", (genome_id,)).fetchone()
+        if not force and known is not None and known[0] == mtime_ns:
+            return known[1]
+
+        df: pd.DataFrame = pd.read_csv(data_path, sep = '\t', usecols = lambda column: column in FEATURE_COLUMNS, dtype = {'gene': str, 'accession': str})
+        df = df.dropna(subset = ['gene'])
+        if 'strand' not in df.columns:
+            df['strand'] = None
+
+        rows = zip([genome_id] * len(df), df['gene'], df['accession'], df['start'].astype(int).tolist(), df['end'].astype(int).tolist(),
+                   df['strand'].where(df['strand'].notna(), None))
+
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM features WHERE genome_id = ?", (genome_id,))
+            self._connection.executemany('INSERT INTO features (genome_id, gene, accession, start, "end", strand) VALUES (?, ?, ?, ?, ?, ?)', rows)
+            self._connection.execute("INSERT OR REPLACE INTO genomes (genome_id, mtime_ns, n_features) VALUES (?, ?, ?)", (genome_id, mtime_ns, len(df)))
+
+        return len(df)
+
+    def build(self, file_path: str, genome_ids: Iterable[str] = None) -> Dict[str, str]:
+        """
+        Index the features files of a directory.
+
+        Parameters
+        ----------
+        file_path : str
+            Directory of the genome files
+        genome_ids : Iterable[str], optional
+            Genomes to index, by default None (all the features files of the directory)
+
+        Returns
+        -------
+        Dict[str, str]
+            Genomes that could not be indexed, with the error message
+        """
+
+        if genome_ids is None:
+            genome_ids = [path.name[:-len(FEATURES_ROOT)] for path in sorted(Path(file_path).glob(f"*{FEATURES_ROOT}"))]
+
+        errors: Dict[str, str] = {}
+        for genome_id in genome_ids:
+            try:
+                self.add_genome(file_path, genome_id)
+            except Exception as e:
+                print(f"Error of indexing: {genome_id} - {e}")
+                errors[genome_id] = str(e)
+
+        return errors
+
+    def lookup(self, genome_id: str, genes: List[str]) -> Dict[str, List[Tuple[str, int, int, str]]]:
+        """
+        Return the coordinates of genes in one genome.
+
+        Returns
+        -------
+        Dict[str, List[Tuple[str, int, int, str]]]
+            gene -> list of (accession, start, end, strand), one per copy, in file order. Genes absent from the genome are omitted.
+        """
+
+        result: Dict[str, List[Tuple[str, int, int, str]]] = {}
+
+        for chunk in _chunks(list(dict.fromkeys(genes)), _MAX_PARAMS):
+            placeholders: str = ", ".join("?" for _ in chunk)
+            with self._lock:
+                rows = self._connection.execute(
+                    f'SELECT gene, accession, start, "end", strand FROM features WHERE genome_id = ? AND gene IN ({placeholders}) ORDER BY rowid',
+                    [genome_id] + chunk,
+                ).fetchall()
+
+            for gene, accession, start, end, strand in rows:
+                result.setdefault(gene, []).append((accession, start, end, strand))
+
+        return {gene: result[gene] for gene in genes if gene in result}
+
+    def lookup_many(self, genome_ids: List[str], genes: List[str]) -> pd.DataFrame:
+        """
+        Return the coordinates of genes across many genomes.
+
+        Returns
+        -------
+        pd.DataFrame
+            One row per copy: genome_id, gene, accession, start, end, strand
+        """
+
+        # The connection context commits (or rolls back) the temp table writes, no transaction is left open on the index
+        with self._lock, self._connection:
+            self._connection.execute("CREATE TEMP TABLE IF NOT EXISTS query_genomes (genome_id TEXT PRIMARY KEY)")
+            self._connection.execute("CREATE TEMP TABLE IF NOT EXISTS query_genes (gene TEXT PRIMARY KEY)")
+            self._connection.execute("DELETE FROM query_genomes")
+            self._connection.execute("DELETE FROM query_genes")
+            self._connection.executemany("INSERT OR IGNORE INTO query_genomes VALUES (?)", ((g,) for g in genome_ids))
+            self._connection.executemany("INSERT OR IGNORE INTO query_genes VALUES (?)", ((g,) for g in genes))
+            rows = self._connection.execute(
+                'SELECT f.genome_id, f.gene, f.accession, f.start, f."end", f.strand FROM query_genes q '
+                'JOIN features f ON f.gene = q.gene WHERE f.genome_id IN (SELECT genome_id FROM query_genomes) ORDER BY f.rowid'
+            ).fetchall()
+
+        return pd.DataFrame(rows, columns = ['genome_id', 'gene', 'accession', 'start', 'end', 'strand'])
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
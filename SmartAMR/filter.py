@@ -1,8 +1,143 @@
+import json
+import os
+import tempfile
 from pathlib import Path
-import numpy as np 
+from typing import Dict, Iterable, Iterator, List
 import pandas as pd
 
-def filter_dataset(data: str = None, filter: bool = False, filter_field: str = 'resistant_phenotype') -> pd.DataFrame:
+from SmartAMR.manifest import file_sha256
+
+AMR_KEY: List[str] = ['genome_id', 'antibiotic']
+CACHE_INDEX: str = 'cache_index.json'
+
+def _source_hash(data_path: Path, cache_dir: Path) -> str:
+    """
+    SHA-256 of a source file. The digest is remembered in the cache index with the
+    file size and mtime, so the file is only re-hashed when it is modified.
+    """
+
+    index_path: Path = Path.joinpath(cache_dir, CACHE_INDEX)
+    index: dict = json.loads(index_path.read_text()) if index_path.exists() else {}
+
+    source_stat = data_path.stat()
+    key: str = str(data_path.resolve())
+    known: dict = index.get(key, {})
+
+    if known.get('size') == source_stat.st_size and known.get('mtime_ns') == source_stat.st_mtime_ns:
+        return known['sha256']
+
+    digest: str = file_sha256(data_path)
+    index[key] = {'size': source_stat.st_size, 'mtime_ns': source_stat.st_mtime_ns, 'sha256': digest}
+    # Written aside then renamed, so that a concurrent reader never sees a partial index
+    with tempfile.NamedTemporaryFile('w', dir = cache_dir, prefix = f"{CACHE_INDEX}.", suffix = '.tmp', delete = False) as handle:
+        handle.write(json.dumps(index, indent = 1))
+    os.replace(handle.name, index_path)
+
+    return digest
+
+
+def _dictionary_encode(df: pd.DataFrame) -> pd.DataFrame:
+    """Repetitive text columns as pandas categories, in place."""
+
+    for column in df.columns:
+        text: bool = pd.api.types.is_object_dtype(df[column]) or pd.api.types.is_string_dtype(df[column])
+        # Identifiers are (nearly) unique, dictionary encoding only pays on repeated values
+        if text and df[column].nunique() < 0.5 * len(df):
+            df[column] = df[column].astype('category')
+
+    return df
+
+
+def metadata_cache(data: str = None, cache_dir: str = None) -> Path:
+    """
+    Return the columnar cache of a tab-separated metadata file, building it if needed.
+
+    The TSV is parsed once and written as a Parquet file whose repetitive text
+    columns are dictionary encoded (pandas categories). The cache is keyed by the SHA-256 of the
+    source file, so a new release of the metadata gets a new cache.
+
+    Parameters
+    ----------
+    data : str, optional
+        Path to the tab-separated metadata file, by default None
+    cache_dir : str, optional
+        Directory of the cache files, by default None (`.cache` next to the data)
+
+    Returns
+    -------
+    Path
+        Path to the Parquet cache
+    """
+
+    data_path: Path = Path(data)
+
+    if not data_path.exists():
+        raise ValueError(f"path: {data} does not exist, please provide correct path")
+
+    cache_path: Path = Path(cache_dir) if cache_dir is not None else Path.joinpath(data_path.parent, '.cache')
+    cache_path.mkdir(parents = True, exist_ok = True)
+
+    digest: str = _source_hash(data_path, cache_path)
+    parquet_path: Path = Path.joinpath(cache_path, f"{data_path.stem}.{digest[:16]}.parquet")
+
+    if parquet_path.exists():
+        return parquet_path
+
+    df: pd.DataFrame = _dictionary_encode(pd.read_csv(data_path, sep = '\t', dtype = {'genome_id': str, 'taxon_id': str}, low_memory = False))
+
+    tmp_path: Path = parquet_path.with_suffix('.tmp')
+    df.to_parquet(tmp_path, engine = 'pyarrow', index = False)
+    tmp_path.replace(parquet_path)
+
+    return parquet_path
+
+
+def read_metadata(data: str = None, columns: List[str] = None, not_null: List[str] = None, cache_dir: str = None) -> pd.DataFrame:
+    """
+    Read a metadata file through its columnar cache
+
+    Parameters
+    ----------
+    data : str, optional
+        Path to the tab-separated metadata file, by default None
+    columns : List[str], optional
+        Columns to read, by default None (all columns)
+    not_null : List[str], optional
+        Columns whose missing values are filtered out during the scan, by default None
+    cache_dir : str, optional
+        Directory of the cache files, by default None (`.cache` next to the data)
+
+    Returns
+    -------
+    pd.DataFrame
+        Metadata, with repetitive text columns as categories and genome_id / taxon_id as str
+    """
+
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    parquet_path: Path = metadata_cache(data, cache_dir = cache_dir)
+    schema_names: List[str] = pq.read_schema(parquet_path).names
+
+    for column in (columns or []) + (not_null or []):
+        if column not in schema_names:
+            raise ValueError(f"{column} not in the data column names. Please provide correct column name")
+
+    predicate = None
+    for column in not_null or []:
+        valid = pc.field(column).is_valid()
+        predicate = valid if predicate is None else predicate & valid
+
+    df: pd.DataFrame = pd.read_parquet(parquet_path, engine = 'pyarrow', columns = columns, filters = predicate)
+
+    for column in ('genome_id', 'taxon_id'):
+        if column in df.columns:
+            df[column] = df[column].astype(str)
+
+    return df
+
+
+def filter_dataset(data: str = None, filter: bool = False, filter_field: str = 'resistant_phenotype', columns: List[str] = None, cache: bool = False) -> pd.DataFrame:
     """
     Filter out Nan values from an AMR dataframe considering an user definer column name
 
@@ -14,11 +149,15 @@ def filter_dataset(data: str = None, filter: bool = False, filter_field: str = '
         Set if the dataframe has to be filtered, by default False
     filter_field : str, optional
         Name of the column to filter out Nans from, by default 'resistant_phenotype'
+    columns : List[str], optional
+        Columns to return, by default None (all columns)
+    cache : bool, optional
+        Read the data through its Parquet cache (see metadata_cache), by default False
 
     Returns
     -------
     pd.DataFrame
-        Nan filtered DataFrame
+        Nan filtered DataFrame, with the dtypes of read_metadata
     """
 
 
@@ -27,33 +166,193 @@ def filter_dataset(data: str = None, filter: bool = False, filter_field: str = '
     if not data_path.exists():
         raise ValueError(f"path: {data} does not exist, please provide correct path")
 
-    df: pd.DataFrame = pd.read_csv(data_path, sep = '\t')
-    df['genome_id'] = df['genome_id'].astype(str)
+    if cache:
+        return read_metadata(data_path, columns = columns, not_null = [filter_field])
 
-    if not filter_field in df.columns:
-        raise ValueError(f"{filter_field} not in the data column names. Please provide correct column name")
-    
-    df = df.dropna(subset=[filter_field])
+    header: pd.Index = pd.read_csv(data_path, sep = '\t', nrows = 0).columns
+    for column in (columns or []) + [filter_field]:
+        if column not in header:
+            raise ValueError(f"{column} not in the data column names. Please provide correct column name")
 
-    return df
+    # The filter field is read even when it is not returned
+    usecols: List[str] = None if columns is None else [column for column in dict.fromkeys(columns + ['genome_id', filter_field]) if column in header]
+    df: pd.DataFrame = pd.read_csv(data_path, sep = '\t', usecols = usecols, dtype = {'genome_id': str, 'taxon_id': str}, low_memory = False)
+    # Encoded before filtering, as the cache, so that both paths give the same categories
+    df = _dictionary_encode(df).dropna(subset = [filter_field]).reset_index(drop = True)
 
-def get_amr_data(data):
-    """ Get all the informations from BVBRC metadata which have valid AMR phenotype."""
-    pass
+    for column in ('genome_id', 'taxon_id'):
+        if column in df.columns:
+            df[column] = df[column].astype(str)
 
-def get_amr_measurment_data(data):
-    """Get all the information from BVBRC metadata for which there is a MIC measurment."""
-    pass
+    return df if columns is None else df[columns]
 
-def get_taxon_ids(data):
-    """Return taxon IDs from metadata"""
-    pass
+def _predicate_mask(df: pd.DataFrame, not_null: List[str], predicates: Dict[str, object]) -> pd.Series:
+    """Boolean mask of the rows with no missing value in `not_null` and matching all `predicates`."""
 
-def genome_ids(data):
-    """Return genome IDs from metadata"""
-    pass
+    mask: pd.Series = df[not_null].notna().all(axis = 1) if not_null else pd.Series(True, index = df.index)
 
+    for field, predicate in predicates.items():
+        if callable(predicate):
+            mask &= predicate(df[field])
+        elif isinstance(predicate, (set, frozenset, list, tuple)):
+            mask &= df[field].isin(predicate)
+        else:
+            mask &= df[field] == predicate
 
+    return mask
 
 
+def iter_filter_dataset(data: str = None, not_null: Iterable[str] = ('resistant_phenotype',), predicates: Dict[str, object] = None,
+                        columns: List[str] = None, chunksize: int = 100_000) -> Iterator[pd.DataFrame]:
+    """
+    Stream a tab-separated metadata file by chunks and yield the filtered rows, peak memory is bounded by `chunksize`
 
+    Parameters
+    ----------
+    data : str, optional
+        Path to the file to filter, by default None
+    not_null : Iterable[str], optional
+        Columns to filter out Nans from, by default ('resistant_phenotype',)
+    predicates : Dict[str, object], optional
+        Column -> accepted value, collection of accepted values or callable returning a boolean mask
+        from the column, e.g. {'resistant_phenotype': {'Resistant', 'Susceptible'}}, by default None
+    columns : List[str], optional
+        Columns to return, by default None (all columns)
+    chunksize : int, optional
+        Number of lines parsed at once, by default 100_000
+
+    Yields
+    ------
+    pd.DataFrame
+        Filtered chunk
+    """
+
+    data_path: Path = Path(data)
+
+    if not data_path.exists():
+        raise ValueError(f"path: {data} does not exist, please provide correct path")
+
+    predicates = predicates or {}
+    header: List[str] = pd.read_csv(data_path, sep = '\t', nrows = 0).columns.tolist()
+
+    for field in list(not_null) + list(predicates) + list(columns or []):
+        if not field in header:
+            raise ValueError(f"{field} not in the data column names. Please provide correct column name")
+
+    usecols: List[str] | None = None
+    if columns is not None:
+        usecols = list(dict.fromkeys(list(columns) + list(not_null) + list(predicates)))
+
+    reader = pd.read_csv(data_path, sep = '\t', usecols = usecols, dtype = {'genome_id': str, 'taxon_id': str}, chunksize = chunksize)
+
+    for chunk in reader:
+        chunk = chunk[_predicate_mask(chunk, list(not_null), predicates)]
+        if columns is not None:
+            chunk = chunk[list(columns)]
+        if len(chunk):
+            yield chunk
+
+
+def write_filtered_dataset(data: str = None, output: str = None, not_null: Iterable[str] = ('resistant_phenotype',), predicates: Dict[str, object] = None,
+                           columns: List[str] = None, chunksize: int = 100_000) -> int:
+    """
+    Filter a tab-separated metadata file by chunks straight into a tab-separated output file
+
+    Parameters
+    ----------
+    data : str, optional
+        Path to the file to filter, by default None
+    output : str, optional
+        Path of the filtered file, by default None
+    not_null, predicates, columns, chunksize
+        See iter_filter_dataset
+
+    Returns
+    -------
+    int
+        Number of rows written
+    """
+
+    n_rows: int = 0
+    header: bool = True
+
+    with open(output, 'w') as handle:
+        for chunk in iter_filter_dataset(data, not_null = not_null, predicates = predicates, columns = columns, chunksize = chunksize):
+            chunk.to_csv(handle, sep = '\t', index = False, header = header)
+            header = False
+            n_rows += len(chunk)
+
+    return n_rows
+
+
+def _key_signatures(df: pd.DataFrame, key: List[str]) -> pd.Series:
+    """Order independent hash of all the rows sharing the same key."""
+
+    row_hashes: pd.Series = pd.util.hash_pandas_object(df, index=False)
+    return row_hashes.groupby([df[k] for k in key]).sum()
+
+
+def diff_amr_metadata(previous: str, current: str, key: List[str] = AMR_KEY) -> pd.DataFrame:
+    """
+    Compare two releases of the BV-BRC AMR metadata
+
+    Parameters
+    ----------
+    previous : str
+        Path to the previous release of PATRIC_genomes_AMR.txt
+    current : str
+        Path to the current release of PATRIC_genomes_AMR.txt
+    key : List[str], optional
+        Columns identifying a record, by default ['genome_id', 'antibiotic']
+
+    Returns
+    -------
+    pd.DataFrame
+        Rows of the current release whose key was 'added' or 'changed', and the keys of the
+        'removed' records, flagged in a 'change' column
+    """
+
+    for path in (previous, current):
+        if not Path(path).exists():
+            raise ValueError(f"path: {path} does not exist, please provide correct path")
+
+    old: pd.DataFrame = pd.read_csv(previous, sep = '\t', dtype = str)
+    new: pd.DataFrame = pd.read_csv(current, sep = '\t', dtype = str)
+
+    old_signatures: pd.Series = _key_signatures(old, key)
+    new_signatures: pd.Series = _key_signatures(new, key)
+
+    common: pd.Index = new_signatures.index.intersection(old_signatures.index)
+    added: pd.Index = new_signatures.index.difference(old_signatures.index)
+    removed: pd.Index = old_signatures.index.difference(new_signatures.index)
+    changed: pd.Index = common[new_signatures[common].values != old_signatures[common].values]
+
+    new_keys: pd.MultiIndex = pd.MultiIndex.from_frame(new[key])
+    added_rows: pd.DataFrame = new[new_keys.isin(added)].assign(change = 'added')
+    changed_rows: pd.DataFrame = new[new_keys.isin(changed)].assign(change = 'changed')
+    removed_rows: pd.DataFrame = removed.to_frame(index = False, name = key).assign(change = 'removed')
+
+    return pd.concat([added_rows, changed_rows, removed_rows], ignore_index = True)
+
+
+def delta_genome_ids(delta: pd.DataFrame, changes: Iterable[str] = ('added', 'changed')) -> List[str]:
+    """Return the unique genome IDs of a metadata delta with one of the given changes."""
+
+    return delta.loc[delta['change'].isin(list(changes)), 'genome_id'].astype(str).unique().tolist()
+
+
+def get_amr_data(data: str = None, columns: List[str] = None) -> pd.DataFrame:
+    """ Get all the informations from BVBRC metadata which have valid AMR phenotype."""
+    return read_metadata(data, columns = columns, not_null = ['resistant_phenotype'])
+
+def get_amr_measurment_data(data: str = None, columns: List[str] = None) -> pd.DataFrame:
+    """Get all the information from BVBRC metadata for which there is a MIC measurment."""
+    return read_metadata(data, columns = columns, not_null = ['measurement_value'])
+
+def get_taxon_ids(data: str = None) -> List[str]:
+    """Return taxon IDs from metadata"""
+    return read_metadata(data, columns = ['taxon_id'], not_null = ['taxon_id'])['taxon_id'].unique().tolist()
+
+def genome_ids(data: str = None) -> List[str]:
+    """Return genome IDs from metadata"""
+    return read_metadata(data, columns = ['genome_id'], not_null = ['genome_id'])['genome_id'].unique().tolist()
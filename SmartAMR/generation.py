@@ -0,0 +1,237 @@
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from SmartAMR.encoding import N_CODE, encode_batch, decode_batch
+from SmartAMR.sampler import ConstrainedSampler
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    # 0.5 * (tanh(0.5 * x) + 1) computed in a single buffer, temporaries dominate the LSTM step
+    out: np.ndarray = np.multiply(x, 0.5)
+    np.tanh(out, out = out)
+    out += 1.0
+    out *= 0.5
+    return out
+
+
+def _hard_sigmoid(x: np.ndarray) -> np.ndarray:
+    return np.clip(0.2 * x + 0.5, 0.0, 1.0)
+
+
+def _softmax(x: np.ndarray) -> np.ndarray:
+    e: np.ndarray = np.exp(x - x.max(axis = -1, keepdims = True))
+    return e / e.sum(axis = -1, keepdims = True)
+
+
+ACTIVATIONS = {'sigmoid': _sigmoid, 'hard_sigmoid': _hard_sigmoid, 'tanh': np.tanh, 'softmax': _softmax, 'linear': lambda x: x}
+
+
+class LSTMStepper:
+    def __init__(self, embeddings: np.ndarray, kernel: np.ndarray, recurrent_kernel: np.ndarray, bias: np.ndarray,
+                 dense_kernel: np.ndarray, dense_bias: np.ndarray, activation: str = 'tanh', recurrent_activation: str = 'sigmoid',
+                 output_activation: str = 'softmax') -> None:
+        """
+        Embedding -> LSTM -> Dense network run one time step at a time in numpy, for a batch of sequences.
+
+        The embedding is folded into the LSTM input kernel, so the input projection of a
+        step is a row gather. Gates follow the Keras order (input, forget, cell, output).
+
+        Parameters
+        ----------
+        embeddings : np.ndarray
+            (vocab, embedding_dim) embedding matrix
+        kernel : np.ndarray
+            (embedding_dim, 4 * units) LSTM input kernel
+        recurrent_kernel : np.ndarray
+            (units, 4 * units) LSTM recurrent kernel
+        bias : np.ndarray
+            (4 * units,) LSTM bias
+        dense_kernel : np.ndarray
+            (units, n_outputs) output kernel
+        dense_bias : np.ndarray
+            (n_outputs,) output bias
+        activation, recurrent_activation, output_activation : str, optional
+            Activations of the LSTM cell, LSTM gates and output layer
+        """
+
+        self.input_projection: np.ndarray = (embeddings @ kernel + bias).astype(np.float32)
+        self.recurrent_kernel: np.ndarray = recurrent_kernel.astype(np.float32)
+        self.dense_kernel: np.ndarray = dense_kernel.astype(np.float32)
+        self.dense_bias: np.ndarray = dense_bias.astype(np.float32)
+        self.units: int = recurrent_kernel.shape[0]
+        self.activation = ACTIVATIONS[activation]
+        self.recurrent_activation = ACTIVATIONS[recurrent_activation]
+        self.output_activation = ACTIVATIONS[output_activation]
+
+    @classmethod
+    def from_keras(cls, model) -> "LSTMStepper":
+        """Extract the Embedding, LSTM and (TimeDistributed) Dense layers of a Keras model."""
+
+        layers: Dict[str, object] = {}
+        for layer in model.layers:
+            inner = getattr(layer, 'layer', layer)  # unwrap TimeDistributed
+            kind: str = type(inner).__name__
+            if kind in ('Embedding', 'LSTM', 'Dense'):
+                layers[kind] = inner
+
+        missing: List[str] = [kind for kind in ('Embedding', 'LSTM', 'Dense') if kind not in layers]
+        if missing:
+            raise ValueError(f"Model has no {', '.join(missing)} layer, expected Embedding -> LSTM -> Dense")
+
+        lstm = layers['LSTM']
+        lstm_config: dict = lstm.get_config()
+        (embeddings,) = layers['Embedding'].get_weights()
+        kernel, recurrent_kernel, bias = lstm.get_weights()
+        dense_kernel, dense_bias = layers['Dense'].get_weights()
+
+        return cls(embeddings, kernel, recurrent_kernel, bias, dense_kernel, dense_bias,
+                   activation = lstm_config.get('activation', 'tanh'),
+                   recurrent_activation = lstm_config.get('recurrent_activation', 'sigmoid'),
+                   output_activation = layers['Dense'].get_config().get('activation', 'softmax'))
+
+    @property
+    def vocab_size(self) -> int:
+        return self.input_projection.shape[0]
+
+    def initial_state(self, batch_size: int) -> Tuple[np.ndarray, np.ndarray]:
+        return np.zeros((batch_size, self.units), np.float32), np.zeros((batch_size, self.units), np.float32)
+
+    def cell(self, tokens: np.ndarray, state: Tuple[np.ndarray, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """Advance the LSTM by one token per sequence, without the Dense layer, returns the new (h, c) state."""
+
+        h, c = state
+        z: np.ndarray = h @ self.recurrent_kernel
+        z += self.input_projection[tokens]
+        u: int = self.units
+        i: np.ndarray = self.recurrent_activation(z[:, :u])
+        f: np.ndarray = self.recurrent_activation(z[:, u:2 * u])
+        g: np.ndarray = self.activation(z[:, 2 * u:3 * u])
+        o: np.ndarray = self.recurrent_activation(z[:, 3 * u:])
+        c = f * c
+        c += i * g
+        h = o * self.activation(c)  # the 'linear' activation returns c itself
+
+        return h, c
+
+    def output(self, h: np.ndarray) -> np.ndarray:
+        return self.output_activation(h @ self.dense_kernel + self.dense_bias)
+
+    def step(self, tokens: np.ndarray, state: Tuple[np.ndarray, np.ndarray]) -> Tuple[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
+        """
+        Advance the LSTM by one token per sequence.
+
+        Returns
+        -------
+        Tuple[np.ndarray, Tuple[np.ndarray, np.ndarray]]
+            (batch, n_outputs) outputs of the Dense layer, new (h, c) state
+        """
+
+        state = self.cell(tokens, state)
+
+        return self.output(state[0]), state
+
+    def run(self, tokens: np.ndarray) -> np.ndarray:
+        """Outputs of all the time steps of a (batch, time) token matrix, as the Keras model with return_sequences."""
+
+        state = self.initial_state(tokens.shape[0])
+        outputs: List[np.ndarray] = []
+        for t in range(tokens.shape[1]):
+            out, state = self.step(tokens[:, t], state)
+            outputs.append(out)
+
+        return np.stack(outputs, axis = 1)
+
+    def final(self, tokens: np.ndarray) -> np.ndarray:
+        """Output of the last time step of a (batch, time) token matrix, as the Keras model without return_sequences."""
+
+        state = self.initial_state(tokens.shape[0])
+        for t in range(tokens.shape[1]):
+            state = self.cell(tokens[:, t], state)
+
+        return self.output(state[0])
+
+
+class BatchedGenerator:
+    def __init__(self, stepper: LSTMStepper, sampler: ConstrainedSampler) -> None:
+        """
+        Constrained nucleotide sampler carrying the LSTM state forward one base at a time.
+
+        Each generated base costs one LSTM step for the whole batch, instead of a model
+        call on the full window per base and per sequence. The next-base probabilities
+        are biased by the sampler as in the prototype `generate_sequence_constrained`.
+
+        Parameters
+        ----------
+        stepper : LSTMStepper
+            Generative network, e.g. LSTMStepper.from_keras(generative_model)
+        sampler : ConstrainedSampler
+            Codon usage and mutation biasing, e.g. ConstrainedSampler.from_dicts(codon_usage, canonical_codons, mutation_probabilities)
+        """
+
+        self.stepper = stepper
+        self.sampler = sampler
+
+    @classmethod
+    def from_keras(cls, model, sampler: ConstrainedSampler) -> "BatchedGenerator":
+        return cls(LSTMStepper.from_keras(model), sampler)
+
+    def generate(self, seeds: str | Sequence[str], length: int, n_samples: int = 1, batch_size: int = 1024,
+                 rng: np.random.Generator | int | None = None) -> List[str]:
+        """
+        Generate constrained sequences from seeds.
+
+        Parameters
+        ----------
+        seeds : str | Sequence[str]
+            Seed sequence(s), each one is extended up to `length` bases
+        length : int
+            Length of the generated sequences (seed included)
+        n_samples : int, optional
+            Number of sequences generated per seed, by default 1
+        batch_size : int, optional
+            Number of sequences advanced together, by default 1024
+        rng : np.random.Generator | int | None, optional
+            Random generator or seed, by default None
+
+        Returns
+        -------
+        List[str]
+            n_samples sequences per seed, grouped by seed
+        """
+
+        rng = np.random.default_rng(rng)
+        seeds = [seeds] if isinstance(seeds, str) else list(seeds)
+        all_seeds: List[str] = [seed for seed in seeds for _ in range(n_samples)]
+        generated: List[str] = []
+
+        for start in range(0, len(all_seeds), batch_size):
+            generated.extend(self._generate_batch(all_seeds[start:start + batch_size], length, rng))
+
+        return generated
+
+    def _generate_batch(self, seeds: List[str], length: int, rng: np.random.Generator) -> List[str]:
+
+        seed_lengths: np.ndarray = np.array([min(len(seed), length) for seed in seeds])
+        if seed_lengths.min() < 1:
+            raise ValueError("Seeds must contain at least one base")
+
+        bases: np.ndarray = encode_batch(seeds, length = length, pad_value = 0).astype(np.intp)
+        tokens: np.ndarray = bases.copy()
+        if self.stepper.vocab_size <= N_CODE:
+            tokens[tokens == N_CODE] = 0
+
+        state = self.stepper.initial_state(len(seeds))
+
+        for t in range(length - 1):
+            probabilities, state = self.stepper.step(tokens[:, t], state)
+            sampling: np.ndarray = seed_lengths <= t + 1
+            if not sampling.any():
+                continue
+
+            sampled: np.ndarray = self.sampler.sample(probabilities[:, :4].astype(np.float64), bases, t, rng)
+
+            tokens[sampling, t + 1] = sampled[sampling]
+            bases[sampling, t + 1] = sampled[sampling]
+
+        return decode_batch(bases)
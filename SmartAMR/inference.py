@@ -0,0 +1,172 @@
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from SmartAMR.encoding import N_CODE, encode_batch
+from SmartAMR.generation import LSTMStepper
+
+QUANTIZATIONS: Tuple[str, ...] = ('none', 'float16', 'int8')
+WEIGHTS: Tuple[str, ...] = ('embeddings', 'kernel', 'recurrent_kernel', 'bias', 'dense_kernel', 'dense_bias')
+# Matrices quantized to int8, the biases stay in float32
+QUANTIZED_WEIGHTS: Tuple[str, ...] = ('embeddings', 'kernel', 'recurrent_kernel', 'dense_kernel')
+
+
+def _keras_weights(model) -> Tuple[Dict[str, np.ndarray], Dict[str, str]]:
+    """Weights and activations of the Embedding -> LSTM -> Dense layers of a Keras model."""
+
+    layers: Dict[str, object] = {type(layer).__name__: layer for layer in model.layers}
+    missing: List[str] = [kind for kind in ('Embedding', 'LSTM', 'Dense') if kind not in layers]
+    if missing:
+        raise ValueError(f"Model has no {', '.join(missing)} layer, expected Embedding -> LSTM -> Dense")
+    if layers['LSTM'].get_config().get('return_sequences'):
+        raise ValueError("Expected a classifier, the LSTM returns sequences")
+
+    (embeddings,) = layers['Embedding'].get_weights()
+    kernel, recurrent_kernel, bias = layers['LSTM'].get_weights()
+    dense_kernel, dense_bias = layers['Dense'].get_weights()
+    activations: Dict[str, str] = {'activation': layers['LSTM'].get_config().get('activation', 'tanh'),
+                                   'recurrent_activation': layers['LSTM'].get_config().get('recurrent_activation', 'sigmoid'),
+                                   'output_activation': layers['Dense'].get_config().get('activation', 'sigmoid')}
+
+    return dict(zip(WEIGHTS, (embeddings, kernel, recurrent_kernel, bias, dense_kernel, dense_bias))), activations
+
+
+def quantize_int8(weights: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric int8 quantization with one float32 scale per output column."""
+
+    scale: np.ndarray = np.abs(weights).max(axis = 0) / 127.0
+    scale = np.where(scale > 0, scale, 1.0).astype(np.float32)
+
+    return np.round(weights / scale).astype(np.int8), scale
+
+
+def export_classifier(model, path: str | Path, seq_length: int = None, quantize: str = 'none') -> Path:
+    """
+    Export the Embedding -> LSTM -> Dense AMR prediction model of the prototypes to a .npz file
+    read by AMRScorer.load, without TensorFlow.
+
+    Parameters
+    ----------
+    model : keras.Model
+        Trained classifier
+    path : str | Path
+        Output .npz file
+    seq_length : int, optional
+        Length the sequences are padded or truncated to, by default None (the model input length)
+    quantize : str, optional
+        'none', 'float16' or 'int8' (per-column scales) storage of the weight matrices, by default 'none'
+
+    Returns
+    -------
+    Path
+        Path of the exported file
+    """
+
+    if quantize not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization {quantize}, expected one of {QUANTIZATIONS}")
+
+    seq_length = seq_length or model.input_shape[1]
+    if seq_length is None:
+        raise ValueError("The model has no fixed input length, give seq_length")
+
+    weights, activations = _keras_weights(model)
+    arrays: Dict[str, np.ndarray] = {}
+    for name, value in weights.items():
+        if quantize == 'int8' and name in QUANTIZED_WEIGHTS:
+            arrays[name], arrays[f"{name}_scale"] = quantize_int8(value)
+        elif quantize == 'float16' and name in QUANTIZED_WEIGHTS:
+            arrays[name] = value.astype(np.float16)
+        else:
+            arrays[name] = value.astype(np.float32)
+
+    path = Path(path)
+    np.savez(path, seq_length = seq_length, quantize = quantize, **activations, **arrays)
+
+    return path if path.suffix == '.npz' else path.with_name(path.name + '.npz')
+
+
+class AMRScorer:
+    def __init__(self, stepper: LSTMStepper, seq_length: int, batch_size: int = 256) -> None:
+        """
+        Batch AMR likelihood of nucleotide sequences, running the LSTM classifier in numpy.
+
+        Sequences are encoded as the prototypes (padded or truncated to seq_length, N and
+        padding read as A when the embedding has no N row) and advanced together one base
+        at a time, the Dense layer being applied once to the last state.
+
+        Parameters
+        ----------
+        stepper : LSTMStepper
+            Classifier network
+        seq_length : int
+            Length the sequences are padded or truncated to
+        batch_size : int, optional
+            Sequences scored together, by default 256
+        """
+
+        self.stepper = stepper
+        self.seq_length: int = seq_length
+        self.batch_size: int = batch_size
+
+    @classmethod
+    def from_keras(cls, model, seq_length: int = None, **kwargs) -> "AMRScorer":
+        weights, activations = _keras_weights(model)
+        return cls(LSTMStepper(**weights, **activations), seq_length or model.input_shape[1], **kwargs)
+
+    @classmethod
+    def load(cls, path: str | Path, **kwargs) -> "AMRScorer":
+        """Scorer of a file written by export_classifier, the quantized weights are expanded to float32."""
+
+        with np.load(path) as data:
+            weights: Dict[str, np.ndarray] = {}
+            for name in WEIGHTS:
+                value: np.ndarray = data[name].astype(np.float32)
+                if f"{name}_scale" in data:
+                    value *= data[f"{name}_scale"]
+                weights[name] = value
+
+            stepper = LSTMStepper(**weights, activation = str(data['activation']), recurrent_activation = str(data['recurrent_activation']),
+                                  output_activation = str(data['output_activation']))
+            seq_length: int = int(data['seq_length'])
+
+        return cls(stepper, seq_length, **kwargs)
+
+    def encode(self, sequences: Sequence[str]) -> np.ndarray:
+        tokens: np.ndarray = encode_batch(sequences, length = self.seq_length, pad_value = 0).astype(np.intp)
+        if self.stepper.vocab_size <= N_CODE:
+            tokens[tokens == N_CODE] = 0
+
+        return tokens
+
+    def score_encoded(self, tokens: np.ndarray) -> np.ndarray:
+        """(n,) AMR likelihood of a (n, seq_length) token matrix."""
+
+        scores: List[np.ndarray] = [self.stepper.final(tokens[start:start + self.batch_size])[:, 0]
+                                    for start in range(0, len(tokens), self.batch_size)]
+
+        return np.concatenate(scores) if scores else np.empty(0, dtype = np.float32)
+
+    def score(self, sequences: Sequence[str]) -> np.ndarray:
+        """(len(sequences),) AMR likelihood of nucleotide sequences."""
+
+        return self.score_encoded(self.encode(sequences))
+
+
+def check_parity(model, scorer: AMRScorer, sequences: Sequence[str], atol: float = 1e-4) -> float:
+    """
+    Compare the scores of a scorer with the predictions of the Keras model on the same sequences.
+
+    Returns
+    -------
+    float
+        Largest absolute difference, a ValueError is raised above atol
+    """
+
+    tokens: np.ndarray = scorer.encode(sequences)
+    expected: np.ndarray = np.asarray(model.predict(tokens, batch_size = scorer.batch_size, verbose = 0))[:, 0]
+    difference: float = float(np.abs(scorer.score_encoded(tokens) - expected).max(initial = 0.0))
+    if difference > atol:
+        raise ValueError(f"Scores differ from the Keras model by up to {difference:.2e} (> {atol:.0e})")
+
+    return difference
@@ -0,0 +1,191 @@
+from typing import Dict, Tuple
+
+import numpy as np
+import tensorflow as tf
+import keras
+
+from SmartAMR.codon_store import usage_vector
+from SmartAMR.sampler import mutation_transition_matrix
+
+
+def _as_usage(codon_usage: Dict[str, float] | np.ndarray) -> np.ndarray:
+    """(64,) codon usage in CODONS order, absent codons at 1e-6 as in the prototypes."""
+
+    usage: np.ndarray = usage_vector(codon_usage) if isinstance(codon_usage, dict) else np.asarray(codon_usage, dtype = np.float32)
+    if usage.shape != (64,):
+        raise ValueError(f"Expected 64 codon usages, got shape {usage.shape}")
+
+    return np.where(np.isnan(usage), 1e-6, usage).astype(np.float32)
+
+
+def mutation_penalty(y_true: tf.Tensor, y_pred: tf.Tensor, mutation_matrix: tf.Tensor, hard: bool = False) -> tf.Tensor:
+    """
+    Per-sequence mean of 1 - transition probability from the true base to the predicted base.
+
+    All the positions are gathered at once. With hard, the predicted base is the argmax
+    (mutation_penalty_tf of the prototypes, divided by the length); otherwise the penalty is
+    its expectation under y_pred, which is differentiable.
+
+    Parameters
+    ----------
+    y_true : tf.Tensor
+        (batch, length, 4) one-hot true bases
+    y_pred : tf.Tensor
+        (batch, length, 4) predicted probabilities
+    mutation_matrix : tf.Tensor
+        (4, 4) transition probability true base -> predicted base
+    hard : bool, optional
+        Penalize the argmax instead of the expectation, by default False
+
+    Returns
+    -------
+    tf.Tensor
+        (batch,) penalties
+    """
+
+    penalties: tf.Tensor = 1.0 - tf.convert_to_tensor(mutation_matrix, dtype = y_pred.dtype)
+    true_index: tf.Tensor = tf.argmax(y_true, axis = -1)
+
+    if hard:
+        pred_index: tf.Tensor = tf.argmax(y_pred, axis = -1)
+        per_position = tf.gather_nd(penalties, tf.stack([true_index, pred_index], axis = -1))
+    else:
+        # Row of the true base, weighted by the predicted probabilities
+        per_position = tf.reduce_sum(tf.gather(penalties, true_index) * y_pred, axis = -1)
+
+    return tf.reduce_mean(per_position, axis = -1)
+
+
+def codon_usage_reward(y: tf.Tensor, codon_usage: tf.Tensor, hard: bool = True) -> tf.Tensor:
+    """
+    Per-sequence mean codon usage of the codons of y, read in frame from the first base.
+
+    The bases are reshaped to (batch, length // 3, 3, 4), a trailing incomplete codon is
+    ignored. With hard, codons are the argmax bases (codon_usage_reward_tf of the
+    prototypes, divided by the number of codons); otherwise the reward is its expectation
+    under the probabilities y, which is differentiable.
+
+    Parameters
+    ----------
+    y : tf.Tensor
+        (batch, length, 4) one-hot bases or probabilities
+    codon_usage : tf.Tensor
+        (64,) usage in CODONS order (index 16 * first + 4 * second + third base)
+    hard : bool, optional
+        Reward the argmax codons instead of the expectation, by default True
+
+    Returns
+    -------
+    tf.Tensor
+        (batch,) rewards
+    """
+
+    usage: tf.Tensor = tf.convert_to_tensor(codon_usage, dtype = y.dtype)
+    n_codons: tf.Tensor = tf.shape(y)[1] // 3
+    codons: tf.Tensor = tf.reshape(y[:, :n_codons * 3, :], (tf.shape(y)[0], n_codons, 3, 4))
+
+    if hard:
+        bases: tf.Tensor = tf.argmax(codons, axis = -1, output_type = tf.int32)
+        indices: tf.Tensor = 16 * bases[..., 0] + 4 * bases[..., 1] + bases[..., 2]
+        per_codon = tf.gather(usage, indices)
+    else:
+        per_codon = tf.einsum('bna,bnc,bng,acg->bn', codons[:, :, 0], codons[:, :, 1], codons[:, :, 2], tf.reshape(usage, (4, 4, 4)))
+
+    return tf.reduce_mean(per_codon, axis = -1)
+
+
+@keras.saving.register_keras_serializable(package = 'SmartAMR')
+class ConstrainedGenerationLoss(keras.losses.Loss):
+    def __init__(self, mutation_probabilities: Dict[Tuple[str, str], float] = None, codon_usage: Dict[str, float] | np.ndarray = None,
+                 mutation_weight: float = 0.1, codon_weight: float = 0.1, name: str = 'constrained_generation_loss', **kwargs) -> None:
+        """
+        Categorical crossentropy of the next-base predictions, plus the expected mutation
+        penalty and minus the expected codon usage reward of the predictions.
+
+        Parameters
+        ----------
+        mutation_probabilities : Dict[Tuple[str, str], float], optional
+            Sorted base pair -> transition probability, as for the generation sampler, by default None (no penalty)
+        codon_usage : Dict[str, float] | np.ndarray, optional
+            Codon -> usage, or (64,) usage in CODONS order, by default None (no reward)
+        mutation_weight : float, optional
+            Weight of the mutation penalty, by default 0.1
+        codon_weight : float, optional
+            Weight of the codon usage reward, by default 0.1
+        """
+
+        super().__init__(name = name, **kwargs)
+        self.mutation_probabilities = mutation_probabilities
+        self.codon_usage = codon_usage
+        self.mutation_weight: float = mutation_weight
+        self.codon_weight: float = codon_weight
+
+        self._mutation_matrix: np.ndarray = None if mutation_probabilities is None else \
+            mutation_transition_matrix(mutation_probabilities).astype(np.float32)
+        self._codon_usage: np.ndarray = None if codon_usage is None else _as_usage(codon_usage)
+
+    def call(self, y_true, y_pred):
+        loss = tf.reduce_mean(keras.losses.categorical_crossentropy(y_true, y_pred), axis = -1)
+        if self._mutation_matrix is not None:
+            loss += self.mutation_weight * mutation_penalty(y_true, y_pred, self._mutation_matrix)
+        if self._codon_usage is not None:
+            loss -= self.codon_weight * codon_usage_reward(y_pred, self._codon_usage, hard = False)
+
+        return loss
+
+    def get_config(self) -> dict:
+        config: dict = super().get_config()
+        config.update(
+            # Tuple keys are not serializable
+            mutation_probabilities = None if self.mutation_probabilities is None else
+            [[a, b, p] for (a, b), p in self.mutation_probabilities.items()],
+            codon_usage = None if self.codon_usage is None else _as_usage(self.codon_usage).tolist(),
+            mutation_weight = self.mutation_weight,
+            codon_weight = self.codon_weight,
+        )
+        return config
+
+    @classmethod
+    def from_config(cls, config: dict) -> "ConstrainedGenerationLoss":
+        if isinstance(config.get('mutation_probabilities'), list):
+            config['mutation_probabilities'] = {(a, b): p for a, b, p in config['mutation_probabilities']}
+        if isinstance(config.get('codon_usage'), list):
+            config['codon_usage'] = np.asarray(config['codon_usage'], dtype = np.float32)
+
+        return cls(**config)
+
+
+@keras.saving.register_keras_serializable(package = 'SmartAMR')
+class MutationPenalty(keras.metrics.Mean):
+    def __init__(self, mutation_probabilities: Dict[Tuple[str, str], float], name: str = 'mutation_penalty', **kwargs) -> None:
+        """Mean mutation penalty of the argmax predictions, see mutation_penalty."""
+
+        super().__init__(name = name, **kwargs)
+        self.mutation_probabilities = mutation_probabilities
+        self._mutation_matrix: np.ndarray = mutation_transition_matrix(mutation_probabilities).astype(np.float32)
+
+    def update_state(self, y_true, y_pred, sample_weight = None):
+        return super().update_state(mutation_penalty(y_true, y_pred, self._mutation_matrix, hard = True), sample_weight = sample_weight)
+
+    def get_config(self) -> dict:
+        return {**super().get_config(), 'mutation_probabilities': [[a, b, p] for (a, b), p in self.mutation_probabilities.items()]}
+
+    @classmethod
+    def from_config(cls, config: dict) -> "MutationPenalty":
+        config['mutation_probabilities'] = {(a, b): p for a, b, p in config['mutation_probabilities']}
+        return cls(**config)
+
+
+@keras.saving.register_keras_serializable(package = 'SmartAMR')
+class CodonUsageReward(keras.metrics.Mean):
+    def __init__(self, codon_usage: Dict[str, float] | np.ndarray, name: str = 'codon_usage_reward', **kwargs) -> None:
+        """Mean codon usage of the argmax predictions, see codon_usage_reward."""
+
+        super().__init__(name = name, **kwargs)
+        self._codon_usage: np.ndarray = _as_usage(codon_usage)
+
+    def update_state(self, y_true, y_pred, sample_weight = None):
+        return super().update_state(codon_usage_reward(y_pred, self._codon_usage, hard = True), sample_weight = sample_weight)
+
+    def get_config(self) -> dict:
+        return {**super().get_config(), 'codon_usage': self._codon_usage.tolist()}
@@ -0,0 +1,164 @@
+import hashlib
+import sqlite3
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from time import time
+from typing import Dict, List, Set, Tuple
+
+MANIFEST_FILENAME = "download_manifest.sqlite"
+# Releases of the metadata files, kept apart from the genome files
+METADATA_MANIFEST_FILENAME = "metadata_manifest.sqlite"
+
+COMPLETE = "complete"
+PARTIAL = "partial"
+FAILED = "failed"
+MISSING = "missing"
+
+
+@dataclass
+class ManifestEntry:
+    """State of one (bvbrc_id, suffix) file."""
+
+    bvbrc_id: str
+    suffix: str
+    status: str
+    size: int | None = None
+    mtime: float | None = None
+    etag: str | None = None
+    sha256: str | None = None
+    attempts: int = 0
+    error: str | None = None
+    updated_at: float | None = None
+
+
+def file_sha256(path: str | Path, chunk_size: int = 1 << 20) -> str:
+    """Return the SHA-256 hex digest of a file, read by chunks."""
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        while chunk := handle.read(chunk_size):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class DownloadManifest:
+    def __init__(self, path: str | Path) -> None:
+        """
+        On-disk record of the downloaded files, stored as a SQLite table keyed on (bvbrc_id, suffix).
+
+        Parameters
+        ----------
+        path : str | Path
+            Path of the SQLite file, created if it does not exist
+        """
+
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread = False)
+
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS files (
+                    bvbrc_id TEXT NOT NULL,
+                    suffix TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    size INTEGER,
+                    mtime REAL,
+                    etag TEXT,
+                    sha256 TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    updated_at REAL,
+                    PRIMARY KEY (bvbrc_id, suffix)
+                )"""
+            )
+
+    @classmethod
+    def in_directory(cls, outdir: str | Path, filename: str = MANIFEST_FILENAME) -> "DownloadManifest":
+        """Open the manifest stored in a download directory."""
+
+        return cls(Path(outdir) / filename)
+
+    def __enter__(self) -> "DownloadManifest":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def get(self, bvbrc_id: str, suffix: str) -> ManifestEntry | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT bvbrc_id, suffix, status, size, mtime, etag, sha256, attempts, error, updated_at "
+                "FROM files WHERE bvbrc_id = ? AND suffix = ?",
+                (bvbrc_id, suffix),
+            ).fetchone()
+
+        return ManifestEntry(*row) if row is not None else None
+
+    def done(self, statuses: Tuple[str, ...] = (COMPLETE, MISSING)) -> Set[Tuple[str, str]]:
+        """Return the set of (bvbrc_id, suffix) keys in one of `statuses`, for O(1) membership tests."""
+
+        placeholders: str = ", ".join("?" for _ in statuses)
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT bvbrc_id, suffix FROM files WHERE status IN ({placeholders})", statuses
+            ).fetchall()
+
+        return set(rows)
+
+    def entries(self, status: str = None) -> List[ManifestEntry]:
+        query: str = "SELECT bvbrc_id, suffix, status, size, mtime, etag, sha256, attempts, error, updated_at FROM files"
+        params: Tuple = ()
+        if status is not None:
+            query += " WHERE status = ?"
+            params = (status,)
+
+        with self._lock:
+            rows = self._connection.execute(query, params).fetchall()
+
+        return [ManifestEntry(*row) for row in rows]
+
+    def record(self, entry: ManifestEntry) -> None:
+        """Insert or replace the entry of a file."""
+
+        entry.updated_at = time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO files (bvbrc_id, suffix, status, size, mtime, etag, sha256, attempts, error, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (entry.bvbrc_id, entry.suffix, entry.status, entry.size, entry.mtime, entry.etag,
+                 entry.sha256, entry.attempts, entry.error, entry.updated_at),
+            )
+
+    def summary(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._connection.execute("SELECT status, COUNT(*) FROM files GROUP BY status").fetchall()
+
+        return dict(rows)
+
+    def verify(self, outdir: str | Path) -> List[Tuple[str, str]]:
+        """
+        Re-hash the complete files of `outdir` and downgrade the corrupted or deleted ones to partial.
+
+        Returns
+        -------
+        List[Tuple[str, str]]
+            Keys of the files that no longer match the manifest
+        """
+
+        mismatches: List[Tuple[str, str]] = []
+        for entry in self.entries(COMPLETE):
+            path: Path = Path(outdir) / f"{entry.bvbrc_id}.{entry.suffix}"
+            if not path.exists() or path.stat().st_size != entry.size or file_sha256(path) != entry.sha256:
+                entry.status = PARTIAL
+                self.record(entry)
+                mismatches.append((entry.bvbrc_id, entry.suffix))
+
+        return mismatches
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,232 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+ID_COLUMNS: List[str] = ['phage_id', 'bacteria_id', 'label']
+PAIR_DTYPE = np.dtype([('phage_idx', np.int32), ('bacteria_idx', np.int32), ('label', np.int8)])
+
+PHAGE_MATRIX = 'phage_embeddings.npy'
+BACTERIA_MATRIX = 'bacteria_embeddings.npy'
+PHAGE_IDS = 'phage_ids.txt'
+BACTERIA_IDS = 'bacteria_ids.txt'
+PAIRS = 'pairs.npy'
+
+
+@dataclass(frozen = True)
+class FeatureLayout:
+    """
+    Columns of final_features.csv: the ID_COLUMNS, then the phage embedding, then the bacteria embedding.
+    The only place where the embedding blocks are located by column offset.
+    """
+
+    phage_dim: int
+    bacteria_dim: int
+    first_column: int = len(ID_COLUMNS)
+
+    @classmethod
+    def from_columns(cls, columns: Sequence[str], phage_dim: int) -> "FeatureLayout":
+        """Layout of a features file given its header and the size of the phage embedding."""
+
+        n_embedding: int = len(columns) - len(ID_COLUMNS)
+        if list(columns[:len(ID_COLUMNS)]) != ID_COLUMNS:
+            raise ValueError(f"Expected the features to start with the columns {ID_COLUMNS}, got {list(columns[:len(ID_COLUMNS)])}")
+        if not 0 < phage_dim < n_embedding:
+            raise ValueError(f"phage_dim must be in (0, {n_embedding}), got {phage_dim}")
+
+        return cls(phage_dim, n_embedding - phage_dim)
+
+    @property
+    def phage_columns(self) -> slice:
+        return slice(self.first_column, self.first_column + self.phage_dim)
+
+    @property
+    def bacteria_columns(self) -> slice:
+        return slice(self.first_column + self.phage_dim, self.first_column + self.phage_dim + self.bacteria_dim)
+
+
+def _write_ids(path: Path, ids: Sequence[str]) -> None:
+    if any('\n' in str(key) for key in ids):
+        raise ValueError("Ids must not contain line breaks")
+    path.write_text('\n'.join(str(key) for key in ids))
+
+
+def _read_ids(path: Path) -> List[str]:
+    text: str = path.read_text()
+    return text.split('\n') if text else []
+
+
+def write_pair_dataset(outdir: str | Path, phage_ids: Sequence[str], phage_embeddings: np.ndarray, bacteria_ids: Sequence[str],
+                       bacteria_embeddings: np.ndarray, pairs: pd.DataFrame, dtype: str = 'float32') -> "PairDataset":
+    """
+    Write a pair dataset: one embedding per phage and per bacteria, and a (phage_idx, bacteria_idx, label) table.
+
+    Parameters
+    ----------
+    outdir : str | Path
+        Output directory, created if it does not exist
+    phage_ids, bacteria_ids : Sequence[str]
+        Ids of the rows of the embedding matrices
+    phage_embeddings, bacteria_embeddings : np.ndarray
+        (n_phages, phage_dim) and (n_bacteria, bacteria_dim) embeddings
+    pairs : pd.DataFrame
+        phage_id, bacteria_id and label (bool or 0/1) columns
+    dtype : str, optional
+        Storage type of the embeddings, by default 'float32'
+    """
+
+    outdir = Path(outdir)
+    outdir.mkdir(parents = True, exist_ok = True)
+
+    phage_index: Dict[str, int] = {str(key): i for i, key in enumerate(phage_ids)}
+    bacteria_index: Dict[str, int] = {str(key): i for i, key in enumerate(bacteria_ids)}
+    unknown: pd.Series = ~pairs['phage_id'].astype(str).isin(phage_index) | ~pairs['bacteria_id'].astype(str).isin(bacteria_index)
+    if unknown.any():
+        raise KeyError(f"{int(unknown.sum())} pairs have no phage or bacteria embedding, e.g. {pairs[unknown].iloc[0].tolist()}")
+
+    table: np.ndarray = np.empty(len(pairs), dtype = PAIR_DTYPE)
+    table['phage_idx'] = pairs['phage_id'].astype(str).map(phage_index).to_numpy()
+    table['bacteria_idx'] = pairs['bacteria_id'].astype(str).map(bacteria_index).to_numpy()
+    table['label'] = pairs['label'].astype(bool).to_numpy()
+
+    np.save(outdir / PHAGE_MATRIX, np.asarray(phage_embeddings, dtype = dtype))
+    np.save(outdir / BACTERIA_MATRIX, np.asarray(bacteria_embeddings, dtype = dtype))
+    _write_ids(outdir / PHAGE_IDS, phage_ids)
+    _write_ids(outdir / BACTERIA_IDS, bacteria_ids)
+    np.save(outdir / PAIRS, table)
+
+    return PairDataset(outdir)
+
+
+def build_from_stores(outdir: str | Path, phage_store, bacteria_store, pairs: pd.DataFrame, **kwargs) -> "PairDataset":
+    """Write a pair dataset from the proteome embeddings of two SmartAMR.embedding_store.EmbeddingStore."""
+
+    phage_ids, phage_embeddings = phage_store.get_many(pairs['phage_id'].astype(str).unique())
+    bacteria_ids, bacteria_embeddings = bacteria_store.get_many(pairs['bacteria_id'].astype(str).unique())
+
+    return write_pair_dataset(outdir, phage_ids, phage_embeddings, bacteria_ids, bacteria_embeddings, pairs, **kwargs)
+
+
+def convert_features_csv(csv_path: str | Path, outdir: str | Path, phage_dim: int, chunksize: int = 2000, **kwargs) -> "PairDataset":
+    """
+    Convert final_features.csv (one row per pair, phage and bacteria embeddings repeated on each row)
+    into a pair dataset, reading the file by chunks and keeping the first row of each phage and bacteria.
+
+    Parameters
+    ----------
+    csv_path : str | Path
+        Features file, see FeatureLayout
+    outdir : str | Path
+        Output directory
+    phage_dim : int
+        Size of the phage embedding (the bacteria one is the rest of the columns)
+    chunksize : int, optional
+        Number of rows read at once, by default 2000
+    """
+
+    columns: List[str] = pd.read_csv(csv_path, nrows = 0).columns.tolist()
+    layout = FeatureLayout.from_columns(columns, phage_dim)
+
+    phages: Dict[str, np.ndarray] = {}
+    bacteria: Dict[str, np.ndarray] = {}
+    pair_chunks: List[pd.DataFrame] = []
+
+    for chunk in pd.read_csv(csv_path, chunksize = chunksize, dtype = {'phage_id': str, 'bacteria_id': str}, engine = 'c'):
+        values: np.ndarray = chunk.iloc[:, layout.first_column:].to_numpy(dtype = np.float32)
+        for row, (phage_id, bacteria_id) in enumerate(zip(chunk['phage_id'], chunk['bacteria_id'])):
+            if phage_id not in phages:
+                phages[phage_id] = values[row, :layout.phage_dim].copy()
+            if bacteria_id not in bacteria:
+                bacteria[bacteria_id] = values[row, layout.phage_dim:].copy()
+        pair_chunks.append(chunk[ID_COLUMNS])
+
+    return write_pair_dataset(outdir, list(phages), np.stack(list(phages.values())), list(bacteria), np.stack(list(bacteria.values())),
+                              pd.concat(pair_chunks, ignore_index = True), **kwargs)
+
+
+class PairDataset:
+    def __init__(self, directory: str | Path) -> None:
+        """
+        Phage-bacteria pair features stored without duplication.
+
+        The phage and bacteria embeddings are memory-mapped matrices with one row per
+        phage or bacteria, and each pair is a (phage_idx, bacteria_idx, label) row. The
+        features of a pair (phage embedding then bacteria embedding, as the columns of
+        final_features.csv) are only gathered for the requested pairs.
+
+        Parameters
+        ----------
+        directory : str | Path
+            Directory written by write_pair_dataset, convert_features_csv or build_from_stores
+        """
+
+        self.directory = Path(directory)
+        self.phage_embeddings: np.ndarray = np.load(self.directory / PHAGE_MATRIX, mmap_mode = 'r')
+        self.bacteria_embeddings: np.ndarray = np.load(self.directory / BACTERIA_MATRIX, mmap_mode = 'r')
+        self.phage_ids: List[str] = _read_ids(self.directory / PHAGE_IDS)
+        self.bacteria_ids: List[str] = _read_ids(self.directory / BACTERIA_IDS)
+        self.pairs: np.ndarray = np.load(self.directory / PAIRS, mmap_mode = 'r')
+
+    def __len__(self) -> int:
+        return len(self.pairs)
+
+    @property
+    def layout(self) -> FeatureLayout:
+        return FeatureLayout(self.phage_embeddings.shape[1], self.bacteria_embeddings.shape[1])
+
+    @property
+    def labels(self) -> np.ndarray:
+        return np.asarray(self.pairs['label'])
+
+    def frame(self) -> pd.DataFrame:
+        """Pair table with the ids, as the ID_COLUMNS of final_features.csv."""
+
+        return pd.DataFrame({
+            'phage_id': pd.Categorical.from_codes(self.pairs['phage_idx'], self.phage_ids),
+            'bacteria_id': pd.Categorical.from_codes(self.pairs['bacteria_idx'], self.bacteria_ids),
+            'label': self.labels.astype(bool),
+        })
+
+    def features(self, indices: Sequence[int] | slice = slice(None), blocks: Tuple[str, ...] = ('phage', 'bacteria')) -> np.ndarray:
+        """
+        Features of the pairs at indices.
+
+        Parameters
+        ----------
+        indices : Sequence[int] | slice, optional
+            Pairs, by default slice(None) (all of them)
+        blocks : Tuple[str, ...], optional
+            Embeddings concatenated per pair, among 'phage' and 'bacteria', by default both
+
+        Returns
+        -------
+        np.ndarray
+            (n_pairs, sum of the block sizes) float32 features
+        """
+
+        pairs: np.ndarray = self.pairs[indices]
+        matrices: Dict[str, Tuple[np.ndarray, str]] = {'phage': (self.phage_embeddings, 'phage_idx'),
+                                                      'bacteria': (self.bacteria_embeddings, 'bacteria_idx')}
+        unknown: List[str] = [block for block in blocks if block not in matrices]
+        if unknown:
+            raise ValueError(f"Unknown blocks {unknown}, expected 'phage' or 'bacteria'")
+
+        widths: List[int] = [matrices[block][0].shape[1] for block in blocks]
+        out: np.ndarray = np.empty((len(pairs), sum(widths)), dtype = np.float32)
+        offset: int = 0
+        for block, width in zip(blocks, widths):
+            matrix, column = matrices[block]
+            out[:, offset:offset + width] = matrix[pairs[column]]
+            offset += width
+
+        return out
+
+    def iter_batches(self, batch_size: int = 1024, indices: Sequence[int] = None, **kwargs) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """(features, labels) of the pairs at indices (by default all) by batches of batch_size."""
+
+        indices = np.arange(len(self)) if indices is None else np.asarray(indices)
+        for start in range(0, len(indices), batch_size):
+            batch: np.ndarray = indices[start:start + batch_size]
+            yield self.features(batch, **kwargs), self.labels[batch]
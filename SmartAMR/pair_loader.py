@@ -0,0 +1,175 @@
+from typing import Iterator, Tuple
+
+import numpy as np
+
+from SmartAMR.pair_dataset import PairDataset
+
+BALANCING: Tuple[str, ...] = ('none', 'undersample', 'oversample')
+
+
+def _group_codes(dataset: PairDataset, by: str) -> np.ndarray:
+    if by not in ('phage', 'bacteria'):
+        raise ValueError(f"Unknown group {by}, expected 'phage' or 'bacteria'")
+
+    return np.asarray(dataset.pairs[f"{by}_idx"])
+
+
+def stratified_split(dataset: PairDataset, test_size: float = 0.2, by: str = 'bacteria', rng: np.random.Generator | int | None = 42,
+                     indices: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Split pairs so that each phage (or bacteria) keeps the same share of positive and negative pairs on both sides.
+
+    Parameters
+    ----------
+    dataset : PairDataset
+        Pairs to split
+    test_size : float, optional
+        Share of the pairs of each stratum in the test split, by default 0.2
+    by : str, optional
+        'phage' or 'bacteria', strata = (id, label), by default 'bacteria'
+    rng : np.random.Generator | int | None, optional
+        Random generator or seed, by default 42
+    indices : np.ndarray, optional
+        Pairs to split, by default None (all of them)
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        Sorted train and test pair indices
+    """
+
+    rng = np.random.default_rng(rng)
+    indices = np.arange(len(dataset)) if indices is None else np.asarray(indices)
+    strata: np.ndarray = _group_codes(dataset, by).astype(np.int64) * 2 + dataset.labels
+
+    # Shuffle, then take the first test_size of each stratum
+    shuffled: np.ndarray = indices[rng.permutation(len(indices))]
+    shuffled_strata: np.ndarray = strata[shuffled]
+    order: np.ndarray = np.argsort(shuffled_strata, kind = 'stable')
+    sorted_strata: np.ndarray = shuffled_strata[order]
+
+    starts: np.ndarray = np.flatnonzero(np.r_[True, sorted_strata[1:] != sorted_strata[:-1]])
+    counts: np.ndarray = np.diff(np.r_[starts, len(sorted_strata)])
+    rank: np.ndarray = np.arange(len(sorted_strata)) - np.repeat(starts, counts)
+    test: np.ndarray = rank < np.repeat(np.round(counts * test_size), counts)
+
+    return np.sort(shuffled[order][~test]), np.sort(shuffled[order][test])
+
+
+def group_split(dataset: PairDataset, test_size: float = 0.2, by: str = 'phage', rng: np.random.Generator | int | None = 42,
+                indices: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Split pairs by held-out phages (or bacteria): all the pairs of a phage are on the same side.
+    Groups with and without positive pairs are split separately, so both sides keep positives.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        Sorted train and test pair indices
+    """
+
+    rng = np.random.default_rng(rng)
+    indices = np.arange(len(dataset)) if indices is None else np.asarray(indices)
+    groups: np.ndarray = _group_codes(dataset, by)[indices]
+    labels: np.ndarray = dataset.labels[indices]
+
+    unique_groups: np.ndarray = np.unique(groups)
+    positive_groups: np.ndarray = np.unique(groups[labels > 0])
+    test_groups = []
+    for stratum in (positive_groups, np.setdiff1d(unique_groups, positive_groups)):
+        n_test: int = int(round(len(stratum) * test_size))
+        test_groups.append(rng.permutation(stratum)[:n_test])
+
+    test: np.ndarray = np.isin(groups, np.concatenate(test_groups))
+
+    return indices[~test], indices[test]
+
+
+class PairLoader:
+    def __init__(self, dataset: PairDataset, indices: np.ndarray = None, batch_size: int = 256, balance: str = 'none', shuffle: bool = True,
+                 blocks: Tuple[str, ...] = ('phage', 'bacteria'), drop_last: bool = False, rng: np.random.Generator | int | None = None) -> None:
+        """
+        Minibatches of pair features gathered on the fly from the phage and bacteria embedding matrices.
+
+        Only the (P + B) embeddings and the pair indices are kept in memory, a batch
+        holds the features of batch_size pairs. With balance, each epoch draws a new
+        balanced set of pairs: 'undersample' keeps as many negatives as positives (the
+        resample downsampling of the notebooks), 'oversample' repeats positives up to the
+        number of negatives.
+
+        Parameters
+        ----------
+        dataset : PairDataset
+            Pair features
+        indices : np.ndarray, optional
+            Pairs of the loader, e.g. a split, by default None (all of them)
+        batch_size : int, optional
+            Pairs per batch, by default 256
+        balance : str, optional
+            'none', 'undersample' or 'oversample', by default 'none'
+        shuffle : bool, optional
+            Shuffle the pairs at each epoch, by default True
+        blocks : Tuple[str, ...], optional
+            Embeddings concatenated per pair, by default ('phage', 'bacteria')
+        drop_last : bool, optional
+            Drop the last incomplete batch, by default False
+        rng : np.random.Generator | int | None, optional
+            Random generator or seed, by default None
+        """
+
+        if balance not in BALANCING:
+            raise ValueError(f"Unknown balancing {balance}, expected one of {BALANCING}")
+
+        self.dataset: PairDataset = dataset
+        self.indices: np.ndarray = np.arange(len(dataset)) if indices is None else np.asarray(indices)
+        self.batch_size: int = batch_size
+        self.balance: str = balance
+        self.shuffle: bool = shuffle
+        self.blocks: Tuple[str, ...] = blocks
+        self.drop_last: bool = drop_last
+        self.rng: np.random.Generator = np.random.default_rng(rng)
+
+        labels: np.ndarray = dataset.labels[self.indices]
+        self._positives: np.ndarray = self.indices[labels > 0]
+        self._negatives: np.ndarray = self.indices[labels == 0]
+
+    def epoch_indices(self) -> np.ndarray:
+        """Pairs of the next epoch, balanced and shuffled as configured."""
+
+        if self.balance == 'undersample':
+            n: int = min(len(self._positives), len(self._negatives))
+            indices: np.ndarray = np.concatenate([self.rng.choice(self._positives, n, replace = False),
+                                                  self.rng.choice(self._negatives, n, replace = False)])
+        elif self.balance == 'oversample':
+            minority, majority = sorted((self._positives, self._negatives), key = len)
+            extra: np.ndarray = self.rng.choice(minority, len(majority) - len(minority), replace = True) if len(minority) else minority
+            indices = np.concatenate([majority, minority, extra])
+        else:
+            indices = self.indices
+
+        return self.rng.permutation(indices) if self.shuffle else np.sort(indices)
+
+    def __len__(self) -> int:
+        if self.balance == 'undersample':
+            n: int = 2 * min(len(self._positives), len(self._negatives))
+        elif self.balance == 'oversample':
+            n = (2 if len(self._positives) and len(self._negatives) else 1) * max(len(self._positives), len(self._negatives))
+        else:
+            n = len(self.indices)
+
+        return n // self.batch_size if self.drop_last else -(-n // self.batch_size)
+
+    def __iter__(self) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        indices: np.ndarray = self.epoch_indices()
+        stop: int = len(indices) - len(indices) % self.batch_size if self.drop_last else len(indices)
+
+        for start in range(0, stop, self.batch_size):
+            # Sorted gathers read the memory-mapped matrices in order
+            batch: np.ndarray = np.sort(indices[start:start + self.batch_size])
+            yield self.dataset.features(batch, blocks = self.blocks), self.dataset.labels[batch].astype(np.float32)
+
+    def repeat(self) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Endless batches over successive epochs, e.g. for keras Model.fit with steps_per_epoch = len(loader)."""
+
+        while True:
+            yield from self
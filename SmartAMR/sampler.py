@@ -0,0 +1,163 @@
+from typing import Dict, Iterable, Tuple
+
+import numpy as np
+
+from SmartAMR.encoding import CODONS, NUCLEOTIDES, N_CODE
+
+N_STATES: int = N_CODE + 1  # A, C, G, T and ambiguous
+
+
+def mutation_transition_matrix(mutation_probabilities: Dict[Tuple[str, str], float]) -> np.ndarray:
+    """
+    (4, 4) factor of the transition current base -> next base
+
+    The probability of a pair is looked up on the sorted pair of bases, as in the prototype
+    `generate_sequence_constrained`, and is 1.0 when the pair is absent (e.g. no mutation).
+    """
+
+    matrix: np.ndarray = np.ones((4, 4), dtype = np.float64)
+    for i, current_base in enumerate(NUCLEOTIDES):
+        for j, next_base in enumerate(NUCLEOTIDES):
+            matrix[i, j] = mutation_probabilities.get(tuple(sorted((current_base, next_base))), 1.0)
+
+    return matrix
+
+
+def codon_bias_table(codon_usage: Dict[str, float], canonical_codons: Iterable[str] = None, missing_usage: float = 1e-6,
+                     non_canonical_penalty: float = 0.1) -> np.ndarray:
+    """
+    (16, 4) factor of the base completing a codon, row 4 * first + second, column third base
+
+    Parameters
+    ----------
+    codon_usage : Dict[str, float]
+        Codon -> usage frequency
+    canonical_codons : Iterable[str], optional
+        Canonical codons, by default None (the codons of codon_usage)
+    missing_usage : float, optional
+        Usage of the codons absent from codon_usage, by default 1e-6
+    non_canonical_penalty : float, optional
+        Factor applied to the non-canonical codons, by default 0.1
+    """
+
+    canonical = set(codon_usage) if canonical_codons is None else set(canonical_codons)
+    table: np.ndarray = np.empty((16, 4), dtype = np.float64)
+    for i, first in enumerate(NUCLEOTIDES):
+        for j, second in enumerate(NUCLEOTIDES):
+            for k, third in enumerate(NUCLEOTIDES):
+                codon: str = first + second + third
+                table[4 * i + j, k] = codon_usage.get(codon, missing_usage) * (1.0 if codon in canonical else non_canonical_penalty)
+
+    return table
+
+
+class ConstrainedSampler:
+    def __init__(self, mutation_matrix: np.ndarray, codon_bias: np.ndarray) -> None:
+        """
+        Biasing and sampling of the next nucleotide of a batch of sequences.
+
+        The mutation factor depends on the current base and the codon factor on the two
+        previous bases. Both are folded into two lookup tables indexed by the previous
+        bases (ambiguous bases included, they do not bias), so that biasing a whole batch
+        is a single gather, multiply and normalize.
+
+        Parameters
+        ----------
+        mutation_matrix : np.ndarray
+            (4, 4) transition factor current base -> next base, see mutation_transition_matrix
+        codon_bias : np.ndarray
+            (16, 4) codon completion factor, see codon_bias_table
+        """
+
+        self.mutation_matrix: np.ndarray = np.asarray(mutation_matrix, dtype = np.float64)
+        self.codon_bias: np.ndarray = np.asarray(codon_bias, dtype = np.float64)
+
+        # Row = current base, ambiguous -> no bias
+        self._mutation_table: np.ndarray = np.ones((N_STATES, 4))
+        self._mutation_table[:4] = self.mutation_matrix
+
+        # Row = N_STATES * previous base + current base
+        self._codon_table: np.ndarray = np.ones((N_STATES, N_STATES, 4))
+        self._codon_table[:4, :4] = self.codon_bias.reshape(4, 4, 4)
+        self._codon_table *= self._mutation_table[None, :, :]
+        self._codon_table = self._codon_table.reshape(N_STATES * N_STATES, 4)
+
+    @classmethod
+    def from_dicts(cls, codon_usage: Dict[str, float], canonical_codons: Iterable[str], mutation_probabilities: Dict[Tuple[str, str], float],
+                   **codon_kwargs) -> "ConstrainedSampler":
+        """Build the sampler from the dictionaries of the prototype (codon_usage, canonical_codons, mutation_probabilities)."""
+
+        return cls(mutation_transition_matrix(mutation_probabilities), codon_bias_table(codon_usage, canonical_codons, **codon_kwargs))
+
+    @classmethod
+    def from_codon_table(cls, codon_table, mutation_probabilities: Dict[Tuple[str, str], float], **codon_kwargs) -> "ConstrainedSampler":
+        """
+        Build the sampler from a scrapper.CodonTable (Kazusa frequencies per thousand, RNA or DNA codons).
+        The frequencies are normalized to sum to 1, the codons of the table are the canonical ones.
+        """
+
+        usage: Dict[str, float] = {codon.replace('U', 'T'): value for codon, value in codon_table.table.items()}
+        total: float = sum(usage.values())
+        if total <= 0:
+            raise ValueError(f"Codon table of {codon_table.taxon_id} is empty, call set_table first")
+
+        usage = {codon: value / total for codon, value in usage.items()}
+
+        return cls.from_dicts(usage, usage.keys(), mutation_probabilities, **codon_kwargs)
+
+    @classmethod
+    def from_usage_vector(cls, usage: np.ndarray, mutation_probabilities: Dict[Tuple[str, str], float], canonical_codons: Iterable[str] = None,
+                          **codon_kwargs) -> "ConstrainedSampler":
+        """
+        Build the sampler from a (64,) codon usage vector in CODONS order, e.g. a row of CodonTableStore.load_many.
+        The usage is normalized to sum to 1, codons with no usage (0 or NaN) are the missing ones.
+        """
+
+        usage = np.nan_to_num(np.asarray(usage, dtype = np.float64))
+        total: float = usage.sum()
+        if total <= 0:
+            raise ValueError("Codon usage vector is empty")
+
+        usage_dict: Dict[str, float] = {codon: value / total for codon, value in zip(CODONS, usage) if value > 0}
+
+        return cls.from_dicts(usage_dict, canonical_codons, mutation_probabilities, **codon_kwargs)
+
+    def bias(self, probabilities: np.ndarray, bases: np.ndarray, t: int) -> np.ndarray:
+        """
+        Bias the probabilities of the base at position t + 1.
+
+        Parameters
+        ----------
+        probabilities : np.ndarray
+            (batch, 4) model probabilities of the next base
+        bases : np.ndarray
+            (batch, >= t + 1) codes of the bases up to position t (0-3, 4 for ambiguous)
+        t : int
+            Position of the current base
+
+        Returns
+        -------
+        np.ndarray
+            (batch, 4) normalized probabilities, the model probabilities where the biased ones sum to 0
+        """
+
+        current: np.ndarray = bases[:, t]
+
+        # Third base of a codon: the prototype checks (len(generated) + 1) % 3 == 0 with len(generated) = t + 1
+        if t >= 1 and (t + 2) % 3 == 0:
+            factor: np.ndarray = self._codon_table[N_STATES * bases[:, t - 1] + current]
+        else:
+            factor: np.ndarray = self._mutation_table[current]
+
+        biased: np.ndarray = probabilities * factor
+        total: np.ndarray = biased.sum(axis = 1, keepdims = True)
+
+        return np.where(total > 0, biased / np.where(total > 0, total, 1.0), probabilities)
+
+    def sample(self, probabilities: np.ndarray, bases: np.ndarray, t: int, rng: np.random.Generator) -> np.ndarray:
+        """Draw the base at position t + 1 of each sequence from the biased probabilities (inverse CDF)."""
+
+        cdf: np.ndarray = np.cumsum(self.bias(probabilities, bases, t), axis = 1)
+        draws: np.ndarray = rng.random((len(cdf), 1)) * cdf[:, -1:]
+
+        return np.minimum((draws > cdf).sum(axis = 1), 3)
@@ -1,13 +1,20 @@
 import os
 import re
-import subprocess as sp
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
 from pathlib import Path
-from time import sleep
-from typing import List, Dict, Tuple
+from time import sleep, monotonic
+from typing import List, Dict, Tuple, Iterable
 from urllib.parse import urlsplit, unquote, urljoin
 from urllib.request import urlopen
 
 import numpy as np
+import pandas as pd
+
+from SmartAMR.filter import diff_amr_metadata, delta_genome_ids
+from SmartAMR.manifest import DownloadManifest, ManifestEntry, COMPLETE, FAILED, MISSING, PARTIAL, METADATA_MANIFEST_FILENAME, file_sha256
+from SmartAMR.transport import Transport, PooledTransport, WgetTransport, RemoteStat, RemoteFileNotFoundError
 
 PATRIC_FTP_BASE_URL = "ftp://ftp.bvbrc.org"
 PATRIC_FTP_AMR_METADATA_URL = urljoin(PATRIC_FTP_BASE_URL, urljoin("RELEASE_NOTES/", "PATRIC_genomes_AMR.txt"))
@@ -16,59 +23,189 @@ PATRIC_FTP_GENOMES_METADATA_URL = urljoin(PATRIC_FTP_BASE_URL, urljoin("RELEASE_
 
 KAZUSA_URL = "https://www.kazusa.or.jp/codon/cgi-bin/showcodon.cgi?species="
 
+# Kind of genome file -> suffix of the file in the BV-BRC genome directory
+GENOME_SUFFIXES: Dict[str, str] = {
+    "contig": "fna",
+    "protein": "PATRIC.faa",
+    "feature": "PATRIC.features.tab",
+    "feature_seq": "PATRIC.ffn",
+    "rna": "PATRIC.frn",
+    "annotation": "PATRIC.gff",
+    "pathway": "PATRIC.pathway.tab",
+    "speciality_gene": "PATRIC.spgene.tab",
+    "subsystem": "PATRIC.subsystem.tab",
+}
+
+
+class HostRateLimiter:
+    def __init__(self, wait : float = 1, max_per_host : int = None) -> None:
+        """
+        Thread-safe politeness guard: requests to the same host start at least
+        `wait` seconds apart, and at most `max_per_host` of them run at once.
+
+        Parameters
+        ----------
+        wait : float, optional
+            Minimum delay in seconds between two requests to the same host, by default 1
+        max_per_host : int, optional
+            Maximum number of concurrent requests per host, by default None (unbounded)
+        """
+
+        self.wait = wait
+        self.max_per_host = max_per_host
+        self._lock = threading.Lock()
+        self._next_slot: Dict[str, float] = {}
+        self._slots: Dict[str, threading.Semaphore] = {}
+
+    def _semaphore(self, host: str) -> threading.Semaphore:
+        with self._lock:
+            if host not in self._slots:
+                self._slots[host] = threading.BoundedSemaphore(self.max_per_host) if self.max_per_host else None
+            return self._slots[host]
+
+    def acquire(self, host: str) -> None:
+        """Block until a request to `host` may start."""
+
+        semaphore = self._semaphore(host)
+        if semaphore is not None:
+            semaphore.acquire()
+
+        with self._lock:
+            now: float = monotonic()
+            start: float = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = start + self.wait
+
+        if start > now:
+            sleep(start - now)
+
+    def release(self, host: str) -> None:
+        """Signal that a request to `host` has finished."""
+
+        semaphore = self._semaphore(host)
+        if semaphore is not None:
+            semaphore.release()
+
+
+@dataclass
+class DownloadReport:
+    """Summary of a bulk download."""
+
+    n_files: int = 0
+    n_failed: int = 0
+    n_skipped: int = 0
+    n_bytes: int = 0
+    elapsed: float = 0.0
+    connections_opened: int = 0
+    connections_reused: int = 0
+    failures: List[Tuple[str, str]] = field(default_factory=list)
+
+    @property
+    def files_per_s(self) -> float:
+        return self.n_files / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def mb_per_s(self) -> float:
+        return self.n_bytes / 1e6 / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (f"{self.n_files} files ({self.n_failed} failed, {self.n_skipped} skipped), {self.n_bytes / 1e6:.2f} MB in {self.elapsed:.1f} s "
+                f"-> {self.files_per_s:.2f} files/s, {self.mb_per_s:.2f} MB/s, "
+                f"{self.connections_opened} connections opened / {self.connections_reused} reused")
+
+
 class Downloader:
-    def __init__(self, base_url : str , outdir : str = None, wait : int = 1) -> None:
-        """AI is creating summary for __init__
+    def __init__(self, base_url : str , outdir : str = None, wait : int = 1, max_per_host : int = None, transport : Transport = None) -> None:
+        """
+        Base class of the BV-BRC downloaders.
 
         Parameters
         ----------
         base_url : str
-            [description]
+            Root URL of the files to download
         outdir : str, optional
-            [description], by default None
+            Existing directory where the files are written, by default None
         wait : int, optional
-            [description], by default 1
+            Minimum delay in seconds between two requests to the same host, by default 1
+        max_per_host : int, optional
+            Maximum number of concurrent requests per host, by default None (unbounded)
+        transport : Transport, optional
+            Download backend, by default None (a PooledTransport reusing connections,
+            pass a WgetTransport to spawn wget instead)
 
         Raises
         ------
         ValueError
-            [description]
+            If the output directory does not exist
         """
         
         self.base_url = base_url
         self.wait = wait
         self.outdir = Path(outdir)
+        self.rate_limiter = HostRateLimiter(wait = wait, max_per_host = max_per_host)
+        self.transport = transport if transport is not None else PooledTransport()
 
         if not self.outdir.exists():
             raise ValueError(f"Directory {self.outdir} does not exist, please provide existing directory as output")
 
 
-    def _download(self, base_url: str , filename: str = None) -> None:
+    def _fetch(self, base_url: str , filename: str = None) -> Path:
         """
-        Generic downloading method.
+        Download a single file, waiting for the per-host rate limiter first.
 
         Parameters
         ----------
-        base_url : str, optional
-            [description], by default PATRIC_FTP_BASE_URL
+        base_url : str
+            URL of the directory containing the file
         filename : str, optional
-            [description], by default None
+            Name of the file to download, by default None
+
+        Returns
+        -------
+        Path
+            Path of the downloaded file
+
+        Raises
+        ------
+        IOError
+            If the download failed
         """
     
         ftp_url: str = urljoin(base_url, filename)
         
         ftp_path: Path = Path(ftp_url)
+        out_path: Path = Path.joinpath(self.outdir, ftp_path.name)
+        host: str = urlsplit(ftp_url).netloc
+
+        self.rate_limiter.acquire(host)
+        try:
+            self.transport.fetch(ftp_url, out_path)
+        finally:
+            self.rate_limiter.release(host)
+
+        return out_path
+
+    def _download(self, base_url: str , filename: str = None) -> Path | None:
+        """
+        Generic downloading method.
 
-        print(f"test : {ftp_url}")
+        Parameters
+        ----------
+        base_url : str, optional
+            [description], by default PATRIC_FTP_BASE_URL
+        filename : str, optional
+            [description], by default None
 
-        abstract_cmd: str = f"wget --quiet -o /dev/null -O {Path.joinpath(self.outdir, ftp_path.name)} --continue --timeout 15 {ftp_url}"
+        Returns
+        -------
+        Path | None
+            Path of the downloaded file, None if the download failed
+        """
 
         try:
-            sleep(self.wait)
-            sp.call([abstract_cmd], shell=True)
+            return self._fetch(base_url = base_url, filename = filename)
 
         except Exception as e: 
-            print(f"Error of download: {ftp_path} - {e}")
+            print(e)
 
         return 
     
@@ -77,158 +214,288 @@ class Downloader:
 
 
 class GenomeContigDownloader(Downloader):
-    def __init__(self, outdir : str = None, wait : int = 1) -> None:
-        super().__init__(base_url = PATRIC_FTP_GENOMES_URL, outdir = outdir, wait = wait)
+    def __init__(self, outdir : str = None, wait : int = 1, transport : Transport = None) -> None:
+        super().__init__(base_url = PATRIC_FTP_GENOMES_URL, outdir = outdir, wait = wait, transport = transport)
 
-    def download(self, bvbrc_id : str = None) -> None:
+    def download(self, bvbrc_id : str = None) -> Path | None:
         
         if bvbrc_id is None:
             raise KeyError(f"Id {bvbrc_id} does not exist.")
         
         filename: str = f"{bvbrc_id}.fna"
         ftp_url = f"{self.base_url}{bvbrc_id}/"
-        sleep(self.wait)
 
         return self._download(base_url = ftp_url, filename = filename)
     
 class GenomeProteinSeqDownloader(Downloader):
-    def __init__(self, outdir : str = None, wait : int = 1) -> None:
-        super().__init__(base_url = PATRIC_FTP_GENOMES_URL, outdir = outdir, wait = wait)
+    def __init__(self, outdir : str = None, wait : int = 1, transport : Transport = None) -> None:
+        super().__init__(base_url = PATRIC_FTP_GENOMES_URL, outdir = outdir, wait = wait, transport = transport)
 
-    def download(self, bvbrc_id : str = None) -> None:
+    def download(self, bvbrc_id : str = None) -> Path | None:
         
         if bvbrc_id is None:
             raise KeyError(f"Id {bvbrc_id} does not exist.")
         
         filename: str = f"{bvbrc_id}.PATRIC.faa"
         ftp_url = f"{self.base_url}{bvbrc_id}/"
-        sleep(self.wait)
 
         return self._download(base_url = ftp_url, filename = filename)
     
 class GenomeFeatureDownloader(Downloader):
-    def __init__(self, outdir : str = None, wait : int = 1) -> None:
-        super().__init__(base_url = PATRIC_FTP_GENOMES_URL, outdir = outdir, wait = wait)
+    def __init__(self, outdir : str = None, wait : int = 1, transport : Transport = None) -> None:
+        super().__init__(base_url = PATRIC_FTP_GENOMES_URL, outdir = outdir, wait = wait, transport = transport)
 
-    def download(self, bvbrc_id : str = None) -> None:
+    def download(self, bvbrc_id : str = None) -> Path | None:
         
         if bvbrc_id is None:
             raise KeyError(f"Id {bvbrc_id} does not exist.")
         
         filename: str = f"{bvbrc_id}.PATRIC.features.tab"
         ftp_url = f"{self.base_url}{bvbrc_id}/"
-        sleep(self.wait)
 
         return self._download(base_url = ftp_url, filename = filename)
     
 class GenomeFeatureSeqDownloader(Downloader):
-    def __init__(self, outdir : str = None, wait : int = 1) -> None:
-        super().__init__(base_url = PATRIC_FTP_GENOMES_URL, outdir = outdir, wait = wait)
+    def __init__(self, outdir : str = None, wait : int = 1, transport : Transport = None) -> None:
+        super().__init__(base_url = PATRIC_FTP_GENOMES_URL, outdir = outdir, wait = wait, transport = transport)
 
-    def download(self, bvbrc_id : str = None) -> None:
+    def download(self, bvbrc_id : str = None) -> Path | None:
         
         if bvbrc_id is None:
             raise KeyError(f"Id {bvbrc_id} does not exist.")
         
         filename: str = f"{bvbrc_id}.PATRIC.ffn"
         ftp_url = f"{self.base_url}{bvbrc_id}/"
-        sleep(self.wait)
 
         return self._download(base_url = ftp_url, filename = filename)
     
 class GenomeRNASeqDownloader(Downloader):
-    def __init__(self, outdir : str = None, wait : int = 1) -> None:
-        super().__init__(base_url = PATRIC_FTP_GENOMES_URL, outdir = outdir, wait = wait)
+    def __init__(self, outdir : str = None, wait : int = 1, transport : Transport = None) -> None:
+        super().__init__(base_url = PATRIC_FTP_GENOMES_URL, outdir = outdir, wait = wait, transport = transport)
 
-    def download(self, bvbrc_id : str = None) -> None:
+    def download(self, bvbrc_id : str = None) -> Path | None:
         
         if bvbrc_id is None:
             raise KeyError(f"Id {bvbrc_id} does not exist.")
         
         filename: str = f"{bvbrc_id}.PATRIC.frn"
         ftp_url = f"{self.base_url}{bvbrc_id}/"
-        sleep(self.wait)
 
         return self._download(base_url = ftp_url, filename = filename)
     
 class GenomeAnnotationDownloader(Downloader):
-    def __init__(self, outdir : str = None, wait : int = 1) -> None:
-        super().__init__(base_url = PATRIC_FTP_GENOMES_URL, outdir = outdir, wait = wait)
+    def __init__(self, outdir : str = None, wait : int = 1, transport : Transport = None) -> None:
+        super().__init__(base_url = PATRIC_FTP_GENOMES_URL, outdir = outdir, wait = wait, transport = transport)
 
-    def download(self, bvbrc_id : str = None) -> None:
+    def download(self, bvbrc_id : str = None) -> Path | None:
         
         if bvbrc_id is None:
             raise KeyError(f"Id {bvbrc_id} does not exist.")
         
         filename: str = f"{bvbrc_id}.PATRIC.gff"
         ftp_url = f"{self.base_url}{bvbrc_id}/"
-        sleep(self.wait)
 
         return self._download(base_url = ftp_url, filename = filename)
     
 class GenomePathwayDownloader(Downloader):
-    def __init__(self, outdir : str = None, wait : int = 1) -> None:
-        super().__init__(base_url = PATRIC_FTP_GENOMES_URL, outdir = outdir, wait = wait)
+    def __init__(self, outdir : str = None, wait : int = 1, transport : Transport = None) -> None:
+        super().__init__(base_url = PATRIC_FTP_GENOMES_URL, outdir = outdir, wait = wait, transport = transport)
 
-    def download(self, bvbrc_id : str = None) -> None:
+    def download(self, bvbrc_id : str = None) -> Path | None:
         
         if bvbrc_id is None:
             raise KeyError(f"Id {bvbrc_id} does not exist.")
         
         filename: str = f"{bvbrc_id}.PATRIC.pathway.tab"
         ftp_url = f"{self.base_url}{bvbrc_id}/"
-        sleep(self.wait)
 
         return self._download(base_url = ftp_url, filename = filename)
 
 
 class GenomeSpecialityGeneDownloader(Downloader):
-    def __init__(self, outdir : str = None, wait : int = 1) -> None:
-        super().__init__(base_url = PATRIC_FTP_GENOMES_URL, outdir = outdir, wait = wait)
+    def __init__(self, outdir : str = None, wait : int = 1, transport : Transport = None) -> None:
+        super().__init__(base_url = PATRIC_FTP_GENOMES_URL, outdir = outdir, wait = wait, transport = transport)
 
-    def download(self, bvbrc_id : str = None) -> None:
+    def download(self, bvbrc_id : str = None) -> Path | None:
         
         if bvbrc_id is None:
             raise KeyError(f"Id {bvbrc_id} does not exist.")
         
         filename: str = f"{bvbrc_id}.PATRIC.spgene.tab"
         ftp_url = f"{self.base_url}{bvbrc_id}/"
-        sleep(self.wait)
 
         return self._download(base_url = ftp_url, filename = filename)
 
 class GenomeSubSystemDownloader(Downloader):
-    def __init__(self, outdir : str = None, wait : int = 1) -> None:
-        super().__init__(base_url = PATRIC_FTP_GENOMES_URL, outdir = outdir, wait = wait)
+    def __init__(self, outdir : str = None, wait : int = 1, transport : Transport = None) -> None:
+        super().__init__(base_url = PATRIC_FTP_GENOMES_URL, outdir = outdir, wait = wait, transport = transport)
 
-    def download(self, bvbrc_id : str = None) -> None:
+    def download(self, bvbrc_id : str = None) -> Path | None:
         
         if bvbrc_id is None:
             raise KeyError(f"Id {bvbrc_id} does not exist.")
         
         filename: str = f"{bvbrc_id}.PATRIC.subsystem.tab"
         ftp_url = f"{self.base_url}{bvbrc_id}/"
-        sleep(self.wait)
 
         return self._download(base_url = ftp_url, filename = filename)
     
 
 class GlobalDownloader(Downloader):
-    def __init__(self, outdir = None, wait = 1) -> None:
-        super().__init__(base_url = PATRIC_FTP_GENOMES_URL, outdir = outdir, wait = wait)
+    def __init__(self, outdir = None, wait = 1, max_per_host : int = None, base_url : str = PATRIC_FTP_GENOMES_URL,
+                 transport : Transport = None, retries : int = 3, backoff : float = 2.0) -> None:
+        """
+        Downloader of all the files of BV-BRC genomes, keeping track of them in a manifest.
 
-    def download(self, bvbrc_id = None) -> None:
+        The state of every (bvbrc_id, suffix) file is stored in `download_manifest.sqlite`
+        in `outdir`: complete files (size checked against the server and SHA-256 recorded)
+        and files missing on the server are skipped by later runs, failed and truncated
+        ones are retried.
+
+        Parameters
+        ----------
+        outdir : str, optional
+            Existing directory where the files are written, by default None
+        wait : int, optional
+            Minimum delay in seconds between two requests to the same host, by default 1
+        max_per_host : int, optional
+            Maximum number of concurrent requests per host, by default None (unbounded)
+        base_url : str, optional
+            Root URL of the genome directories, by default PATRIC_FTP_GENOMES_URL
+        transport : Transport, optional
+            Download backend, by default None (PooledTransport)
+        retries : int, optional
+            Number of retries of a failed or truncated file, by default 3
+        backoff : float, optional
+            Base of the exponential backoff between retries in seconds, by default 2.0
+        """
+
+        super().__init__(base_url = base_url, outdir = outdir, wait = wait, max_per_host = max_per_host, transport = transport)
+        self.retries = retries
+        self.backoff = backoff
+        self.manifest = DownloadManifest.in_directory(self.outdir)
+
+    def download(self, bvbrc_id = None) -> DownloadReport:
 
         if bvbrc_id is None:
             raise KeyError(f"Id {bvbrc_id} does not exist.")
-        suffixes : list[str] = ["fna", "PATRIC.faa", "PATRIC.features.tab", "PATRIC.ffn", "PATRIC.frn", "PATRIC.gff", "PATRIC.pathway.tab", "PATRIC.spgene.tab", "PATRIC.subsystem.tab"]
-        filenames: List = [f"{bvbrc_id}.{s}" for s in suffixes]
 
-        for file in filenames:
-            ftp_url = f"{self.base_url}{bvbrc_id}/"
-            sleep(self.wait)
+        return self.download_many([bvbrc_id], workers = 1)
+
+    def _fetch_tracked(self, bvbrc_id : str, suffix : str) -> Path:
+        """
+        Download one genome file, check it against the remote size and record it in the manifest.
+
+        Raises
+        ------
+        IOError
+            If the file is still missing or truncated after all the retries
+        """
+
+        url: str = urljoin(f"{self.base_url}{bvbrc_id}/", f"{bvbrc_id}.{suffix}")
+        out_path: Path = Path.joinpath(self.outdir, f"{bvbrc_id}.{suffix}")
+        host: str = urlsplit(url).netloc
+        entry: ManifestEntry = self.manifest.get(bvbrc_id, suffix) or ManifestEntry(bvbrc_id, suffix, status = FAILED)
+
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                sleep(self.backoff ** attempt)
+            entry.attempts += 1
+
+            self.rate_limiter.acquire(host)
+            try:
+                remote: RemoteStat = self.transport.stat(url)
+                local_size: int = out_path.stat().st_size if out_path.exists() else 0
+                same_remote: bool = (remote.mtime, remote.etag) == (entry.mtime, entry.etag)
+                # Partial files are only continued when they come from the same remote version
+                if remote.size is None or local_size != remote.size or not same_remote:
+                    self.transport.fetch(url, out_path, resume = entry.status == PARTIAL and same_remote and local_size > 0)
+
+            except RemoteFileNotFoundError as e:
+                entry.status, entry.error = MISSING, str(e)
+                self.manifest.record(entry)
+                raise
+
+            except IOError as e:
+                entry.status, entry.error = FAILED, str(e)
+                self.manifest.record(entry)
+                continue
+
+            finally:
+                self.rate_limiter.release(host)
+
+            entry.size, entry.mtime, entry.etag = out_path.stat().st_size, remote.mtime, remote.etag
+
+            if remote.size is not None and entry.size != remote.size:
+                entry.status, entry.error = PARTIAL, f"Truncated file: {entry.size} / {remote.size} bytes"
+                self.manifest.record(entry)
+                continue
+
+            entry.status, entry.error, entry.sha256 = COMPLETE, None, file_sha256(out_path)
+            self.manifest.record(entry)
+
+            return out_path
+
+        raise IOError(f"Error of download: {url} - {entry.error}")
+
+    def download_many(self, bvbrc_ids : Iterable[str], kinds : List[str] = None, workers : int = 4, retry_missing : bool = False) -> DownloadReport:
+        """
+        Download several files of several genomes through a bounded pool of workers.
+
+        The politeness is kept by the per-host rate limiter: whatever the number of
+        workers, two requests to the same host start at least `wait` seconds apart.
+        Files recorded as complete in the manifest are skipped without any request.
+
+        Parameters
+        ----------
+        bvbrc_ids : Iterable[str]
+            BV-BRC genome ids to download
+        kinds : List[str], optional
+            Kinds (keys of GENOME_SUFFIXES) or suffixes of the files to download, by default None (all files)
+        workers : int, optional
+            Number of concurrent downloads, by default 4
+        retry_missing : bool, optional
+            Request again the files previously found missing on the server, by default False
+
+        Returns
+        -------
+        DownloadReport
+            Number of files and bytes downloaded, failures and throughput
+        """
+
+        if kinds is None:
+            suffixes: List[str] = list(GENOME_SUFFIXES.values())
+        else:
+            suffixes: List[str] = [GENOME_SUFFIXES.get(kind, kind) for kind in kinds]
+
+        done: set = self.manifest.done(statuses = (COMPLETE,) if retry_missing else (COMPLETE, MISSING))
+        jobs: List[Tuple[str, str]] = [(bvbrc_id, s) for bvbrc_id in bvbrc_ids for s in suffixes]
+        report: DownloadReport = DownloadReport(n_skipped = sum(job in done for job in jobs))
+        jobs = [job for job in jobs if job not in done]
+
+        opened_before: int = getattr(self.transport, "opened", 0)
+        reused_before: int = getattr(self.transport, "reused", 0)
+        start: float = monotonic()
+
+        with ThreadPoolExecutor(max_workers = workers) as executor:
+            futures = {executor.submit(self._fetch_tracked, bvbrc_id, suffix): f"{bvbrc_id}.{suffix}" for bvbrc_id, suffix in jobs}
+
+            for future in as_completed(futures):
+                file: str = futures[future]
+                try:
+                    out_path: Path = future.result()
+                    report.n_files += 1
+                    report.n_bytes += out_path.stat().st_size
+                except Exception as e:
+                    report.n_failed += 1
+                    report.failures.append((file, str(e)))
+                    print(e)
+
+        report.elapsed = monotonic() - start
+        report.connections_opened = getattr(self.transport, "opened", 0) - opened_before
+        report.connections_reused = getattr(self.transport, "reused", 0) - reused_before
 
-            self._download(base_url = ftp_url, filename = file)
+        return report
 
     
 class CodonTable():
@@ -265,15 +532,25 @@ class CodonTable():
             return f"<{self.__class__.__name__} for {self.taxon_id} (No data)>"
         return f"<{self.__class__.__name__} for {self.taxon_id} with {len(self.table)} codons>\n{output}"
 
-    def set_table(self, taxon_id: str, replace_uracil: bool = False)-> None:
+    def fetch_html(self, taxon_id: str) -> str:
+        """Download the Kazusa page of a taxon."""
 
         url: str = f"{self.base_url}{taxon_id}"
-        self.taxon_id = taxon_id
         web_handle = urlopen(url)
-        html_content: str = web_handle.read().decode().replace("\n", " ")
+
+        return web_handle.read().decode()
+
+    def parse_html(self, taxon_id: str, html_content: str, replace_uracil: bool = False) -> None:
+        """Set the table from a Kazusa page, e.g. a page saved with fetch_html, without any request."""
+
+        self.taxon_id = taxon_id
+        html_content = html_content.replace("\n", " ")
 
         raw_table: List = re.findall(self.reg_table, html_content)
-        codon_element_table: List = re.findall(self.reg_condon, *raw_table)
+        if not raw_table:
+            raise ValueError(f"No codon usage table found in the page of {taxon_id}")
+
+        codon_element_table: List = re.findall(self.reg_condon, *raw_table[:1])
 
         for codon, value_str, count_str in codon_element_table:
 
@@ -284,6 +561,12 @@ class CodonTable():
 
         return
 
+    def set_table(self, taxon_id: str, replace_uracil: bool = False)-> None:
+
+        self.parse_html(taxon_id, self.fetch_html(taxon_id), replace_uracil = replace_uracil)
+
+        return
+
     def write_table(self, outdir: str = None) -> None:
         
         out_path: Path = Path(outdir)
@@ -297,12 +580,102 @@ class CodonTable():
 
 
 class MetadataUpdater(Downloader):
-    def __init__(self, outdir = None, wait = 1):
-        super().__init__(base_url = PATRIC_FTP_BASE_URL, outdir = outdir, wait = wait)
+    def __init__(self, outdir = None, wait = 1, transport : Transport = None):
+        """
+        Incremental updater of the BV-BRC AMR metadata (PATRIC_genomes_AMR.txt).
+
+        The release is only downloaded when its remote size, modification time or ETag
+        changed since the last update. The previous release is kept as
+        PATRIC_genomes_AMR.previous.txt and the differences between both are written
+        to PATRIC_genomes_AMR.delta.tsv.gz. The release is recorded in its own manifest
+        (metadata_manifest.sqlite), under the name of the local file, so that verify checks it.
+
+        Parameters
+        ----------
+        outdir : str, optional
+            Existing directory where the metadata is written, by default None
+        wait : int, optional
+            Minimum delay in seconds between two requests to the same host, by default 1
+        transport : Transport, optional
+            Download backend, by default None (PooledTransport)
+        """
+
+        super().__init__(base_url = PATRIC_FTP_BASE_URL, outdir = outdir, wait = wait, transport = transport)
+        self.manifest = DownloadManifest.in_directory(self.outdir, METADATA_MANIFEST_FILENAME)
+        self.release_dir: str = "RELEASE_NOTES"
+        self.filename: str = "PATRIC_genomes_AMR.txt"
+        self.metadata_path: Path = Path.joinpath(self.outdir, self.filename)
+        # (stem, suffix) key: DownloadManifest.verify rebuilds the path as outdir/<stem>.<suffix>
+        self.key: Tuple[str, str] = (self.metadata_path.stem, self.metadata_path.suffix.lstrip('.'))
+        self.previous_path: Path = Path.joinpath(self.outdir, "PATRIC_genomes_AMR.previous.txt")
+        self.delta_path: Path = Path.joinpath(self.outdir, "PATRIC_genomes_AMR.delta.tsv.gz")
+
+    def __call__(self, force : bool = False) -> pd.DataFrame | None:
+        """
+        Update the metadata if a new release is available.
+
+        Parameters
+        ----------
+        force : bool, optional
+            Download the release even if it did not change, by default False
+
+        Returns
+        -------
+        pd.DataFrame | None
+            Delta with the previous release (see filter.diff_amr_metadata), None if the metadata is up to date
+        """
+
+        url: str = urljoin(self.base_url, urljoin(f"{self.release_dir}/", self.filename))
+        host: str = urlsplit(url).netloc
+        entry: ManifestEntry | None = self.manifest.get(*self.key)
+
+        self.rate_limiter.acquire(host)
+        try:
+            remote: RemoteStat = self.transport.stat(url)
+
+            if (not force and entry is not None and entry.status == COMPLETE and self.metadata_path.exists()
+                    and (remote.size, remote.mtime, remote.etag) == (entry.size, entry.mtime, entry.etag)):
+                print("Metadata is up to date")
+                return None
+
+            print(f"Updating Metdata ...")
+            if self.metadata_path.exists():
+                self.metadata_path.replace(self.previous_path)
+
+            try:
+                self.transport.fetch(url, self.metadata_path, resume = False)
+            except Exception:
+                if self.previous_path.exists():
+                    self.previous_path.replace(self.metadata_path)
+                raise
+
+        finally:
+            self.rate_limiter.release(host)
+
+        sha256: str = file_sha256(self.metadata_path)
+        self.manifest.record(ManifestEntry(*self.key, status = COMPLETE, size = self.metadata_path.stat().st_size,
+                                           mtime = remote.mtime, etag = remote.etag, sha256 = sha256, attempts = 1))
+
+        if entry is not None and entry.sha256 == sha256:
+            print("Metadata content is unchanged")
+            # The delta of the previous update would otherwise be reported again by new_genome_ids
+            self.delta_path.unlink(missing_ok = True)
+            return None
+
+        if self.previous_path.exists():
+            delta: pd.DataFrame = diff_amr_metadata(self.previous_path, self.metadata_path)
+        else:
+            delta: pd.DataFrame = pd.read_csv(self.metadata_path, sep = '\t', dtype = str).assign(change = 'added')
+
+        delta.to_csv(self.delta_path, sep = '\t', index = False)
+        print(f"{delta['change'].value_counts().to_dict()} records written to {self.delta_path}")
+
+        return delta
 
-    def __call__(self) -> None:
-        filename: str = urljoin("RELEASE_NOTES/", "PATRIC_genomes_AMR.txt")
-        print(f"Updating Metdata ...")
-        return self._download(base_url = self.base_url, filename = filename)
+    def new_genome_ids(self) -> List[str]:
+        """Return the genome IDs added or changed by the last update, to be passed to GlobalDownloader.download_many."""
 
+        if not self.delta_path.exists():
+            return []
 
+        return delta_genome_ids(pd.read_csv(self.delta_path, sep = '\t', dtype = str))
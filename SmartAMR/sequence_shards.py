@@ -0,0 +1,286 @@
+"""Write nucleotide sequences into uint8-encoded shards, read back as a streaming tf.data training input.
+
+Usage:
+    python -m SmartAMR.sequence_shards amr_genes.fasta other_genes.fasta shards/ --length 1000 --labels 1 0
+
+Each shard is a memory-mapped (n, length) uint8 matrix of SmartAMR.encoding codes (with its
+labels), listed in manifest.json. Training batches are read by blocks from the shards,
+shuffled in a bounded buffer and one-hot encoded on the fly, so memory does not grow with
+the number of sequences.
+"""
+import argparse
+import json
+import os
+from pathlib import Path
+from typing import Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from SmartAMR.embedding_store import read_fasta_records
+from SmartAMR.encoding import NUCLEOTIDES, encode_batch
+
+MANIFEST_FILENAME = 'manifest.json'
+TASKS: Tuple[str, ...] = ('next_base', 'classify')
+
+
+class SequenceShardWriter:
+    def __init__(self, directory: str | Path, seq_length: int, shard_size: int = 65536) -> None:
+        """
+        Append sequences to uint8 shards of shard_size rows, padded or truncated to seq_length
+        (see SmartAMR.encoding.encode_batch). The manifest is written when the writer is closed,
+        use it as a context manager.
+
+        Parameters
+        ----------
+        directory : str | Path
+            Output directory, created if it does not exist
+        seq_length : int
+            Length of the encoded sequences
+        shard_size : int, optional
+            Sequences per shard, by default 65536
+        """
+
+        self.directory = Path(directory)
+        self.directory.mkdir(parents = True, exist_ok = True)
+        self.seq_length: int = seq_length
+        self.shard_size: int = shard_size
+
+        self._shards: List[dict] = []
+        self._sequences: List[str] = []
+        self._labels: List[int] = []
+        self._labelled: bool = None
+
+    def __enter__(self) -> "SequenceShardWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def add(self, sequence: str, label: int = None) -> None:
+        if self._labelled is None:
+            self._labelled = label is not None
+        elif self._labelled != (label is not None):
+            raise ValueError("Either all the sequences have a label or none")
+
+        self._sequences.append(sequence)
+        if label is not None:
+            self._labels.append(label)
+        if len(self._sequences) == self.shard_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._sequences:
+            return
+
+        name: str = f"shard-{len(self._shards):05d}"
+        np.save(self.directory / f"{name}.npy", encode_batch(self._sequences, length = self.seq_length))
+        shard: dict = {'name': name, 'n': len(self._sequences)}
+        if self._labels:
+            np.save(self.directory / f"{name}.labels.npy", np.asarray(self._labels, dtype = np.int8))
+            shard['labels'] = f"{name}.labels.npy"
+
+        self._shards.append(shard)
+        self._sequences, self._labels = [], []
+
+    def close(self) -> "SequenceShards":
+        self.flush()
+        manifest_path: Path = self.directory / MANIFEST_FILENAME
+        tmp_path: Path = manifest_path.with_suffix('.json.tmp')
+        tmp_path.write_text(json.dumps({'seq_length': self.seq_length, 'shards': self._shards}, indent = 1))
+        os.replace(tmp_path, manifest_path)
+
+        return SequenceShards(self.directory)
+
+
+def count_records(fasta_path: str | Path) -> int:
+    """Number of records of a FASTA file, counted without parsing the sequences."""
+
+    with open(fasta_path, 'rb', buffering = 1 << 20) as fasta:
+        return sum(line.startswith(b'>') for line in fasta)
+
+
+def shards_from_fasta(fasta_paths: Sequence[str | Path], directory: str | Path, seq_length: int, labels: Sequence[int] = None,
+                      shard_size: int = 65536, rng: np.random.Generator | int | None = 0) -> "SequenceShards":
+    """
+    Encode the records of FASTA files into shards, streaming the files.
+
+    The records of the files are interleaved in a random order drawn over all of them (the
+    records of each file are counted first), so every shard holds the classes in the same
+    proportions as the whole input and the shuffle buffer of the dataset does not need to
+    span several shards.
+
+    Parameters
+    ----------
+    fasta_paths : Sequence[str | Path]
+        Nucleotide FASTA files
+    directory : str | Path
+        Output directory
+    seq_length : int
+        Length of the encoded sequences
+    labels : Sequence[int], optional
+        Label of the records of each file, by default None (unlabelled)
+    shard_size : int, optional
+        Sequences per shard, by default 65536
+    rng : np.random.Generator | int | None, optional
+        Random generator or seed of the interleaving, by default 0
+    """
+
+    if labels is not None and len(labels) != len(fasta_paths):
+        raise ValueError(f"Expected one label per FASTA file, got {len(labels)} labels for {len(fasta_paths)} files")
+
+    rng = np.random.default_rng(rng)
+    readers: List[Tuple[Iterable, int]] = [(read_fasta_records(path), None if labels is None else int(label))
+                                           for path, label in zip(fasta_paths, labels if labels is not None else [None] * len(fasta_paths))]
+
+    # File of each written record: a uniform permutation, as drawing the files in proportion to their remaining records
+    order: np.ndarray = np.repeat(np.arange(len(fasta_paths), dtype = np.int32), [count_records(path) for path in fasta_paths])
+    rng.shuffle(order)
+
+    with SequenceShardWriter(directory, seq_length, shard_size) as writer:
+        for i in order:
+            records, label = readers[i]
+            record = next(records, None)
+            if record is not None:
+                writer.add(record[1], label)
+
+    return SequenceShards(directory)
+
+
+class SequenceShards:
+    def __init__(self, directory: str | Path) -> None:
+        """
+        uint8-encoded sequence shards written by SequenceShardWriter or shards_from_fasta.
+
+        Parameters
+        ----------
+        directory : str | Path
+            Shard directory
+        """
+
+        self.directory = Path(directory)
+        manifest: dict = json.loads((self.directory / MANIFEST_FILENAME).read_text())
+        self.seq_length: int = manifest['seq_length']
+        self.shards: List[dict] = manifest['shards']
+        self.sizes: np.ndarray = np.array([shard['n'] for shard in self.shards], dtype = np.int64)
+        self.has_labels: bool = bool(self.shards) and all('labels' in shard for shard in self.shards)
+
+        self._codes: List[np.ndarray] = [np.load(self.directory / f"{shard['name']}.npy", mmap_mode = 'r') for shard in self.shards]
+        self._labels: List[np.ndarray] = [np.load(self.directory / shard['labels']) for shard in self.shards] if self.has_labels else []
+
+    def __len__(self) -> int:
+        return int(self.sizes.sum())
+
+    def read_block(self, shard: int, start: int, stop: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Codes and labels (-1 if unlabelled) of rows start:stop of a shard."""
+
+        codes: np.ndarray = np.array(self._codes[shard][start:stop])
+        labels: np.ndarray = self._labels[shard][start:stop] if self.has_labels else np.full(len(codes), -1, dtype = np.int8)
+
+        return codes, labels
+
+    def dataset(self, task: str = 'next_base', batch_size: int = 64, shuffle_buffer: int = 8192, block_rows: int = 256,
+                cycle_length: int = None, one_hot_inputs: bool = False, repeat: bool = False, drop_remainder: bool = False,
+                seed: int = None):
+        """
+        tf.data input of keras Model.fit, reading the shards by blocks.
+
+        The shard order is shuffled, blocks of block_rows sequences are read from
+        cycle_length shards at once in parallel, the sequences are shuffled in a buffer of
+        shuffle_buffer sequences, batched, then one-hot encoded and prefetched. Only the
+        buffers are in memory, as uint8 codes. Padding and ambiguous bases (code N_CODE, 4)
+        are one-hot encoded as zero vectors, so they do not count in a categorical
+        crossentropy.
+
+        Parameters
+        ----------
+        task : str, optional
+            'next_base': (codes[:, :-1], one-hot codes[:, 1:]) as the generative model of the prototypes,
+            'classify': (codes, label) as the AMR prediction model, by default 'next_base'
+        batch_size : int, optional
+            Sequences per batch, by default 64
+        shuffle_buffer : int, optional
+            Sequences in the shuffle buffer, 0 to keep the shard order, by default 8192
+        block_rows : int, optional
+            Sequences read at once from a shard, by default 256
+        cycle_length : int, optional
+            Shards read in parallel, by default None (number of CPUs)
+        one_hot_inputs : bool, optional
+            One-hot encode the inputs too (float32 (batch, length, 4)), instead of the codes for an Embedding layer, by default False
+        repeat : bool, optional
+            Repeat endlessly, each epoch in a new order, by default False
+        drop_remainder : bool, optional
+            Drop the last incomplete batch, by default False
+        seed : int, optional
+            Seed of the shuffling, by default None
+
+        Returns
+        -------
+        tf.data.Dataset
+            Batches of (inputs, targets)
+        """
+
+        import tensorflow as tf
+
+        if task not in TASKS:
+            raise ValueError(f"Unknown task {task}, expected one of {TASKS}")
+        if task == 'classify' and not self.has_labels:
+            raise ValueError(f"The shards of {self.directory} have no labels")
+
+        shuffle: bool = shuffle_buffer > 0
+        cycle_length = cycle_length or os.cpu_count() or 1
+        sizes: tf.Tensor = tf.constant(self.sizes)
+        length: int = self.seq_length
+
+        def read(shard, start):
+            codes, labels = tf.numpy_function(lambda s, b: self.read_block(int(s), int(b), int(b) + block_rows),
+                                              [shard, start], [tf.uint8, tf.int8], stateful = False)
+            codes.set_shape([None, length])
+            labels.set_shape([None])
+            return tf.data.Dataset.from_tensor_slices((codes, labels))
+
+        def blocks(shard):
+            return tf.data.Dataset.range(0, sizes[shard], block_rows).map(lambda start: (shard, start))
+
+        def one_hot(codes, labels):
+            # tf.one_hot of N_CODE (out of the depth) is a zero vector
+            codes = tf.cast(codes, tf.int32)
+            if task == 'next_base':
+                inputs, targets = codes[:, :-1], tf.one_hot(codes[:, 1:], len(NUCLEOTIDES))
+            else:
+                inputs, targets = codes, tf.cast(labels, tf.float32)
+            if one_hot_inputs:
+                inputs = tf.one_hot(inputs, len(NUCLEOTIDES))
+            return inputs, targets
+
+        dataset = tf.data.Dataset.range(len(self.shards))
+        if shuffle:
+            dataset = dataset.shuffle(len(self.shards), seed = seed, reshuffle_each_iteration = True)
+        if repeat:
+            dataset = dataset.repeat()
+
+        dataset = dataset.interleave(lambda shard: blocks(shard).flat_map(read),
+                                     cycle_length = cycle_length, block_length = block_rows,
+                                     num_parallel_calls = tf.data.AUTOTUNE, deterministic = not shuffle)
+        if shuffle:
+            dataset = dataset.shuffle(shuffle_buffer, seed = seed, reshuffle_each_iteration = True)
+
+        return dataset.batch(batch_size, drop_remainder = drop_remainder, num_parallel_calls = tf.data.AUTOTUNE, deterministic = not shuffle) \
+                      .map(one_hot, num_parallel_calls = tf.data.AUTOTUNE, deterministic = not shuffle) \
+                      .prefetch(tf.data.AUTOTUNE)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("fasta", nargs = "+", type = Path, help = "nucleotide FASTA files")
+    parser.add_argument("outdir", type = Path, help = "shard directory")
+    parser.add_argument("--length", type = int, required = True, help = "length of the encoded sequences")
+    parser.add_argument("--labels", type = int, nargs = "+", help = "label of the records of each FASTA file")
+    parser.add_argument("--shard-size", type = int, default = 65536, help = "sequences per shard")
+    args = parser.parse_args()
+
+    shards: SequenceShards = shards_from_fasta(args.fasta, args.outdir, args.length, labels = args.labels, shard_size = args.shard_size)
+    print(f"{len(shards)} sequences of {shards.seq_length} bases in {len(shards.shards)} shards")
+
+
+if __name__ == "__main__":
+    main()
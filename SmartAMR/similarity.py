@@ -0,0 +1,263 @@
+from pathlib import Path
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+METRICS: Tuple[str, ...] = ('cosine', 'l2')
+BACKENDS: Tuple[str, ...] = ('numpy', 'faiss')
+
+
+def _import_faiss():
+    try:
+        import faiss
+    except ImportError as e:
+        raise ImportError("The faiss backend needs faiss-cpu, install it or use backend='numpy'") from e
+
+    return faiss
+
+
+def _squared_distances(x: np.ndarray, y: np.ndarray, y_norms: np.ndarray = None) -> np.ndarray:
+    """(len(x), len(y)) squared euclidean distances."""
+
+    if y_norms is None:
+        y_norms = np.einsum('ij,ij->i', y, y)
+
+    return np.maximum(np.einsum('ij,ij->i', x, x)[:, None] - 2 * x @ y.T + y_norms[None, :], 0)
+
+
+def kmeans(vectors: np.ndarray, n_clusters: int, n_iter: int = 20, sample_size: int = 256, rng: np.random.Generator | int | None = 0,
+           block_size: int = 65536) -> np.ndarray:
+    """
+    Lloyd k-means of the rows of vectors, trained on at most sample_size points per cluster.
+
+    Returns
+    -------
+    np.ndarray
+        (n_clusters, dim) float32 centroids
+    """
+
+    rng = np.random.default_rng(rng)
+    if len(vectors) < n_clusters:
+        raise ValueError(f"Cannot train {n_clusters} clusters on {len(vectors)} vectors")
+
+    sample: np.ndarray = vectors
+    if len(vectors) > sample_size * n_clusters:
+        sample = vectors[np.sort(rng.choice(len(vectors), sample_size * n_clusters, replace = False))]
+    sample = np.asarray(sample, dtype = np.float32)
+
+    centroids: np.ndarray = sample[rng.choice(len(sample), n_clusters, replace = False)].copy()
+    for _ in range(n_iter):
+        labels: np.ndarray = np.concatenate([_squared_distances(sample[i:i + block_size], centroids).argmin(axis = 1)
+                                             for i in range(0, len(sample), block_size)])
+        counts: np.ndarray = np.bincount(labels, minlength = n_clusters)
+        sums: np.ndarray = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+
+        empty: np.ndarray = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # Empty clusters restart on random points
+        centroids[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace = False)]
+
+    return centroids
+
+
+class SimilarityIndex:
+    def __init__(self, metric: str = 'cosine', n_lists: int = None, n_probe: int = 8, backend: str = 'numpy') -> None:
+        """
+        Nearest-neighbour search over embeddings (e.g. phage or bacteria proteomes).
+
+        Without n_lists the search is exact (brute force by blocks). With n_lists the
+        vectors are split by a k-means into inverted lists (IVF) and a query only scans
+        the n_probe lists of its closest centroids. The faiss backend (faiss-cpu,
+        optional) runs the same flat or IVF index.
+
+        Parameters
+        ----------
+        metric : str, optional
+            'cosine' or 'l2', by default 'cosine'
+        n_lists : int, optional
+            Number of inverted lists, by default None (exact search)
+        n_probe : int, optional
+            Number of lists scanned per query, by default 8
+        backend : str, optional
+            'numpy' or 'faiss', by default 'numpy'
+        """
+
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric {metric}, expected one of {METRICS}")
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend}, expected one of {BACKENDS}")
+
+        self.metric: str = metric
+        self.n_lists: int = n_lists
+        self.n_probe: int = n_probe
+        self.backend: str = backend
+
+        self.ids: List[str] = []
+        self.vectors: np.ndarray = None  # rows grouped by inverted list
+        self.norms: np.ndarray = None
+        self.centroids: np.ndarray = None
+        self.list_offsets: np.ndarray = None  # list l = rows list_offsets[l]:list_offsets[l + 1]
+        self._faiss_index = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_store(cls, store, **kwargs) -> "SimilarityIndex":
+        """Index all the embeddings of a SmartAMR.embedding_store.EmbeddingStore."""
+
+        ids, matrix = store.matrix()
+        return cls(**kwargs).fit(ids, matrix)
+
+    def _prepare(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.array(vectors, dtype = np.float32, ndmin = 2)
+        if self.metric == 'cosine':
+            norms: np.ndarray = np.linalg.norm(vectors, axis = 1, keepdims = True)
+            vectors /= np.where(norms > 0, norms, 1)
+
+        return vectors
+
+    def fit(self, ids: Sequence[str], vectors: np.ndarray, rng: np.random.Generator | int | None = 0) -> "SimilarityIndex":
+        """Build the index of the (len(ids), dim) vectors."""
+
+        vectors = self._prepare(vectors)
+        if len(vectors) != len(ids):
+            raise ValueError(f"Got {len(ids)} ids for {len(vectors)} vectors")
+
+        ids = list(ids)
+        if self.n_lists:
+            self.centroids = kmeans(vectors, self.n_lists, rng = rng)
+            labels: np.ndarray = np.concatenate([_squared_distances(vectors[i:i + 65536], self.centroids).argmin(axis = 1)
+                                                 for i in range(0, len(vectors), 65536)])
+            order: np.ndarray = np.argsort(labels, kind = 'stable')
+            vectors = vectors[order]
+            ids = [ids[i] for i in order]
+            self.list_offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength = self.n_lists))])
+
+        self.ids = ids
+        self.vectors = vectors
+        self.norms = np.einsum('ij,ij->i', vectors, vectors)
+        self._faiss_index = self._build_faiss() if self.backend == 'faiss' else None
+
+        return self
+
+    def _build_faiss(self):
+        faiss = _import_faiss()
+        dim: int = self.vectors.shape[1]
+        quantizer = faiss.IndexFlatIP(dim) if self.metric == 'cosine' else faiss.IndexFlatL2(dim)
+
+        if not self.n_lists:
+            quantizer.add(self.vectors)
+            return quantizer
+
+        faiss_metric = faiss.METRIC_INNER_PRODUCT if self.metric == 'cosine' else faiss.METRIC_L2
+        index = faiss.IndexIVFFlat(quantizer, dim, self.n_lists, faiss_metric)
+        # faiss trains its own coarse quantizer, the rows keep their order in self.ids
+        index.train(self.vectors)
+        index.add(self.vectors)
+        index.nprobe = self.n_probe
+        return index
+
+    def _distances(self, queries: np.ndarray, rows: slice | np.ndarray) -> np.ndarray:
+        """Distances of queries to rows of the index: 1 - cosine similarity or squared L2 distance."""
+
+        products: np.ndarray = queries @ self.vectors[rows].T
+        if self.metric == 'cosine':
+            return 1 - products
+
+        return np.maximum(np.einsum('ij,ij->i', queries, queries)[:, None] - 2 * products + self.norms[rows][None, :], 0)
+
+    @staticmethod
+    def _top_k(distances: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        k = min(k, distances.shape[1])
+        top: np.ndarray = np.argpartition(distances, k - 1, axis = 1)[:, :k] if k < distances.shape[1] else np.tile(np.arange(k), (len(distances), 1))
+        top_distances: np.ndarray = np.take_along_axis(distances, top, axis = 1)
+        order: np.ndarray = np.argsort(top_distances, axis = 1, kind = 'stable')
+
+        return np.take_along_axis(top, order, axis = 1), np.take_along_axis(top_distances, order, axis = 1)
+
+    def search_rows(self, queries: np.ndarray, k: int = 10, block_size: int = 1024) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        k nearest rows of a batch of queries.
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray]
+            (n_queries, k) row indices in self.ids (-1 if fewer than k candidates) and their distances (inf if absent)
+        """
+
+        if self.vectors is None:
+            raise ValueError("The index is empty, call fit or load first")
+
+        queries = self._prepare(queries)
+        k = min(k, len(self.ids))
+
+        if self._faiss_index is not None:
+            scores, found = self._faiss_index.search(queries, k)
+            found_distances: np.ndarray = 1 - scores if self.metric == 'cosine' else scores
+            return found.astype(np.int64), np.where(found >= 0, found_distances, np.inf).astype(np.float32)
+
+        if not self.n_lists:
+            rows: np.ndarray = np.empty((len(queries), k), dtype = np.int64)
+            distances: np.ndarray = np.empty((len(queries), k), dtype = np.float32)
+            for start in range(0, len(queries), block_size):
+                block_rows, block_distances = self._top_k(self._distances(queries[start:start + block_size], slice(None)), k)
+                rows[start:start + block_size] = block_rows
+                distances[start:start + block_size] = block_distances
+            return rows, distances
+
+        # Each inverted list is scanned once for all the queries probing it, then the
+        # n_probe partial top k of a query are merged
+        n_probe: int = min(self.n_probe, self.n_lists)
+        probes: np.ndarray = np.argpartition(_squared_distances(queries, self.centroids), n_probe - 1, axis = 1)[:, :n_probe]
+        candidate_rows: np.ndarray = np.full((len(queries), n_probe, k), -1, dtype = np.int64)
+        candidate_distances: np.ndarray = np.full((len(queries), n_probe, k), np.inf, dtype = np.float32)
+
+        for l in np.unique(probes):
+            start, end = self.list_offsets[l], self.list_offsets[l + 1]
+            if start == end:
+                continue
+            probing, slots = np.nonzero(probes == l)
+            top, top_distances = self._top_k(self._distances(queries[probing], slice(start, end)), k)
+            candidate_rows[probing, slots, :top.shape[1]] = start + top
+            candidate_distances[probing, slots, :top.shape[1]] = top_distances
+
+        top, top_distances = self._top_k(candidate_distances.reshape(len(queries), -1), k)
+        rows = np.take_along_axis(candidate_rows.reshape(len(queries), -1), top, axis = 1)
+
+        return np.where(np.isfinite(top_distances), rows, -1), top_distances
+
+    def search(self, queries: np.ndarray, k: int = 10) -> List[List[Tuple[str, float]]]:
+        """k nearest ids of each query, as (id, distance) pairs sorted by distance."""
+
+        rows, distances = self.search_rows(queries, k)
+        return [[(self.ids[r], float(d)) for r, d in zip(row, distance) if r >= 0] for row, distance in zip(rows, distances)]
+
+    def save(self, path: str | Path) -> None:
+        """Write the index to an .npz file (the faiss index is rebuilt on load)."""
+
+        arrays: dict = {'ids': np.array(self.ids, dtype = str), 'vectors': self.vectors,
+                        'params': np.array([self.metric, str(self.n_lists or 0), str(self.n_probe), self.backend])}
+        if self.n_lists:
+            arrays.update(centroids = self.centroids, list_offsets = self.list_offsets)
+
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path: str | Path, backend: str = None) -> "SimilarityIndex":
+        """Read an index written by save, optionally on another backend."""
+
+        with np.load(path, allow_pickle = False) as data:
+            metric, n_lists, n_probe, saved_backend = (str(value) for value in data['params'])
+            index = cls(metric = metric, n_lists = int(n_lists) or None, n_probe = int(n_probe), backend = backend or saved_backend)
+            index.ids = [str(key) for key in data['ids']]
+            index.vectors = data['vectors']
+            if index.n_lists:
+                index.centroids = data['centroids']
+                index.list_offsets = data['list_offsets']
+
+        index.norms = np.einsum('ij,ij->i', index.vectors, index.vectors)
+        index._faiss_index = index._build_faiss() if index.backend == 'faiss' else None
+
+        return index
@@ -0,0 +1,349 @@
+import ftplib
+import http.client
+import re
+import subprocess as sp
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, List, Tuple
+from urllib.parse import urlsplit, unquote
+
+CHUNK_SIZE = 1 << 16
+
+
+# Only these answers mean the file does not exist, any other error is retried
+MISSING_HTTP_STATUSES: Tuple[int, ...] = (404, 410)
+MISSING_FTP_CODE = "550"
+
+
+class RemoteFileNotFoundError(IOError):
+    """The server answered that the requested file does not exist."""
+
+
+class RemoteServerError(IOError):
+    """The server answered with an error (5xx, 429, 403, ...), the download can be retried later."""
+
+
+def _http_error(status: int) -> IOError:
+    if status in MISSING_HTTP_STATUSES:
+        return RemoteFileNotFoundError(f"HTTP status {status}")
+    return RemoteServerError(f"HTTP status {status}")
+
+
+def _is_missing_ftp(error: Exception) -> bool:
+    return isinstance(error, ftplib.error_perm) and str(error).startswith(MISSING_FTP_CODE)
+
+
+@dataclass
+class RemoteStat:
+    """Metadata of a remote file, fields are None when the server does not provide them."""
+
+    size: int | None = None
+    mtime: float | None = None
+    etag: str | None = None
+
+
+class Transport:
+    """Interface of the download backends used by the scrapper."""
+
+    def fetch(self, url: str, out_path: Path, resume: bool = True) -> int:
+        """
+        Download `url` into `out_path`.
+
+        Parameters
+        ----------
+        url : str
+            URL of the file to download
+        out_path : Path
+            Destination of the file
+        resume : bool, optional
+            Continue a partially downloaded file, by default True
+
+        Returns
+        -------
+        int
+            Number of bytes transferred
+
+        Raises
+        ------
+        IOError
+            If the download failed
+        """
+        raise NotImplementedError("Subclasses must implement the fetch method.")
+
+    def stat(self, url: str) -> RemoteStat:
+        """Return the size / modification time / ETag of a remote file without downloading it."""
+        raise NotImplementedError("Subclasses must implement the stat method.")
+
+    def close(self) -> None:
+        return
+
+
+class WgetTransport(Transport):
+    def __init__(self, timeout: int = 15) -> None:
+        """
+        Transport spawning one `wget` process per file.
+
+        Parameters
+        ----------
+        timeout : int, optional
+            wget network timeout in seconds, by default 15
+        """
+
+        self.timeout = timeout
+
+    def fetch(self, url: str, out_path: Path, resume: bool = True) -> int:
+
+        size_before: int = out_path.stat().st_size if resume and out_path.exists() else 0
+        continue_flag: str = "--continue" if resume else ""
+        abstract_cmd: str = f"wget --no-verbose --server-response -O {out_path} {continue_flag} --timeout {self.timeout} {url}"
+
+        process = sp.run([abstract_cmd], shell=True, stdout=sp.DEVNULL, stderr=sp.PIPE, text=True, errors="replace")
+
+        # wget exit status 8: the server issued an error response, only a 404 / 410 / 550 means a missing file
+        if process.returncode == 8 and self._missing_response(process.stderr):
+            raise RemoteFileNotFoundError(f"Error of download: {url} - wget exited with status {process.returncode}")
+        if process.returncode != 0:
+            raise IOError(f"Error of download: {url} - wget exited with status {process.returncode}")
+
+        return out_path.stat().st_size - size_before
+
+    @staticmethod
+    def _missing_response(output: str) -> bool:
+        """Whether the last server answer printed by wget --server-response says the file does not exist."""
+
+        statuses: List[str] = re.findall(r"^\s*(?:HTTP/\S+\s+(\d{3})|(\d{3})[ -])", output, flags = re.MULTILINE)
+        codes: List[str] = [http_code or ftp_code for http_code, ftp_code in statuses]
+        if "No such file" in output:
+            return True
+
+        return bool(codes) and (codes[-1] == MISSING_FTP_CODE or int(codes[-1]) in MISSING_HTTP_STATUSES)
+
+    def stat(self, url: str) -> RemoteStat:
+        return PooledTransport(max_idle_per_host = 0).stat(url)
+
+
+class PooledTransport(Transport):
+    def __init__(self, timeout: int = 15, max_idle_per_host: int = 4, chunk_size: int = CHUNK_SIZE) -> None:
+        """
+        In-process FTP/HTTP(S) transport keeping persistent connections per host.
+
+        Connections are checked out of a per-host pool for the duration of one
+        transfer and put back afterwards, so consecutive files from the same
+        server share the same TCP connection / FTP login. Files are streamed to
+        disk in chunks of `chunk_size` bytes.
+
+        Parameters
+        ----------
+        timeout : int, optional
+            Socket timeout in seconds, by default 15
+        max_idle_per_host : int, optional
+            Number of idle connections kept open per host, by default 4
+        chunk_size : int, optional
+            Size of the chunks written to disk, by default 64 KiB
+        """
+
+        self.timeout = timeout
+        self.max_idle_per_host = max_idle_per_host
+        self.chunk_size = chunk_size
+        self.opened: int = 0
+        self.reused: int = 0
+        self._lock = threading.Lock()
+        self._idle: Dict[Tuple[str, str, int], List] = {}
+
+    def __enter__(self) -> "PooledTransport":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {"opened": self.opened, "reused": self.reused}
+
+    def _connect(self, key: Tuple[str, str, int], user: str | None, password: str | None):
+        scheme, host, port = key
+
+        if scheme == "ftp":
+            connection = ftplib.FTP(timeout = self.timeout)
+            connection.connect(host, port)
+            connection.login(user or "anonymous", password or "anonymous@")
+            connection.voidcmd("TYPE I")
+        elif scheme == "http":
+            connection = http.client.HTTPConnection(host, port, timeout = self.timeout)
+        elif scheme == "https":
+            connection = http.client.HTTPSConnection(host, port, timeout = self.timeout)
+        else:
+            raise ValueError(f"Unsupported URL scheme: {scheme}")
+
+        return connection
+
+    def _checkout(self, url: str) -> Tuple[Tuple[str, str, int], object, bool]:
+        parts = urlsplit(url)
+        default_ports: Dict[str, int] = {"ftp": 21, "http": 80, "https": 443}
+        key: Tuple[str, str, int] = (parts.scheme, parts.hostname, parts.port or default_ports.get(parts.scheme, 0))
+
+        with self._lock:
+            idle: List = self._idle.get(key, [])
+            if idle:
+                self.reused += 1
+                return key, idle.pop(), True
+
+        connection = self._connect(key, parts.username, parts.password)
+        with self._lock:
+            self.opened += 1
+
+        return key, connection, False
+
+    def _checkin(self, key: Tuple[str, str, int], connection) -> None:
+        with self._lock:
+            idle: List = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(connection)
+                return
+
+        self._discard(connection)
+
+    @staticmethod
+    def _discard(connection) -> None:
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _run(self, url: str, action):
+        """Run `action(connection, path)` on a pooled connection, retrying once on a stale reused connection."""
+
+        path: str = unquote(urlsplit(url).path) or "/"
+
+        for _ in range(2):
+            try:
+                key, connection, reused = self._checkout(url)
+            except (OSError, EOFError, ftplib.Error, http.client.HTTPException) as e:
+                # Refused connection, failed login (530), ...: retried later
+                raise IOError(f"Error of download: {url} - {e}") from e
+
+            try:
+                result, keep = action(connection, path)
+            except (RemoteFileNotFoundError, RemoteServerError) as e:
+                # An answer of the server, not a stale connection
+                self._discard(connection)
+                raise type(e)(f"Error of download: {url} - {e}") from e
+            except (OSError, EOFError, ftplib.Error, http.client.HTTPException) as e:
+                self._discard(connection)
+                if _is_missing_ftp(e):
+                    raise RemoteFileNotFoundError(f"Error of download: {url} - {e}") from e
+                # Idle connections may have been closed by the server in the meantime
+                if reused:
+                    continue
+                raise IOError(f"Error of download: {url} - {e}") from e
+
+            if keep:
+                self._checkin(key, connection)
+            else:
+                self._discard(connection)
+
+            return result
+
+        raise IOError(f"Error of download: {url}")
+
+    def _fetch_ftp(self, connection: ftplib.FTP, path: str, out_path: Path, resume: bool) -> Tuple[int, bool]:
+        offset: int = out_path.stat().st_size if resume and out_path.exists() else 0
+        mode: str = "ab" if offset else "wb"
+        written: int = 0
+        handle = None
+
+        def write(chunk: bytes) -> None:
+            # The file is only opened once data arrives, a missing remote file leaves nothing behind
+            nonlocal written, handle
+            if handle is None:
+                handle = open(out_path, mode)
+            handle.write(chunk)
+            written += len(chunk)
+
+        try:
+            connection.retrbinary(f"RETR {path}", write, blocksize = self.chunk_size, rest = offset or None)
+        finally:
+            if handle is not None:
+                handle.close()
+
+        if handle is None and not offset:
+            out_path.touch()
+
+        return written, True
+
+    def _fetch_http(self, connection: http.client.HTTPConnection, path: str, out_path: Path, resume: bool) -> Tuple[int, bool]:
+        offset: int = out_path.stat().st_size if resume and out_path.exists() else 0
+        headers: Dict[str, str] = {"Range": f"bytes={offset}-"} if offset else {}
+        connection.request("GET", path, headers = headers)
+        response = connection.getresponse()
+
+        if response.status == 416:
+            # Requested range not satisfiable: the local file is already complete
+            response.read()
+            return 0, not response.will_close
+        if response.status not in (200, 206):
+            response.read()
+            raise _http_error(response.status)
+
+        mode: str = "ab" if response.status == 206 else "wb"
+        written: int = 0
+
+        with open(out_path, mode) as handle:
+            while chunk := response.read(self.chunk_size):
+                handle.write(chunk)
+                written += len(chunk)
+
+        return written, not response.will_close
+
+    def fetch(self, url: str, out_path: Path, resume: bool = True) -> int:
+
+        out_path = Path(out_path)
+        scheme: str = urlsplit(url).scheme
+
+        if scheme == "ftp":
+            action = lambda connection, path: self._fetch_ftp(connection, path, out_path, resume)
+        else:
+            action = lambda connection, path: self._fetch_http(connection, path, out_path, resume)
+
+        return self._run(url, action)
+
+    def stat(self, url: str) -> RemoteStat:
+
+        def stat_ftp(connection: ftplib.FTP, path: str) -> Tuple[RemoteStat, bool]:
+            remote: RemoteStat = RemoteStat(size = connection.size(path))
+            try:
+                # MDTM answers "213 YYYYMMDDHHMMSS"
+                timestamp: str = connection.voidcmd(f"MDTM {path}").split()[-1]
+                remote.mtime = datetime.strptime(timestamp[:14], "%Y%m%d%H%M%S").replace(tzinfo = timezone.utc).timestamp()
+            except (ftplib.error_perm, ValueError):
+                pass
+            return remote, True
+
+        def stat_http(connection: http.client.HTTPConnection, path: str) -> Tuple[RemoteStat, bool]:
+            connection.request("HEAD", path)
+            response = connection.getresponse()
+            response.read()
+
+            if response.status != 200:
+                raise _http_error(response.status)
+
+            remote: RemoteStat = RemoteStat(etag = response.getheader("ETag"))
+            if response.getheader("Content-Length") is not None:
+                remote.size = int(response.getheader("Content-Length"))
+            if response.getheader("Last-Modified") is not None:
+                remote.mtime = parsedate_to_datetime(response.getheader("Last-Modified")).timestamp()
+            return remote, not response.will_close
+
+        return self._run(url, stat_ftp if urlsplit(url).scheme == "ftp" else stat_http)
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, {}
+
+        for connections in idle.values():
+            for connection in connections:
+                self._discard(connection)
+
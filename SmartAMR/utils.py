@@ -1,10 +1,13 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 from pathlib import Path
 from typing import List, Tuple, Dict,  Union
 
 import numpy as np
 import pandas as pd
 
-from Bio import SeqIO
+from SmartAMR.fasta import FastaIndex
+from SmartAMR.features_index import FeatureIndex
 
 METADATA = 'PATRIC_genomes_AMR.txt'
 SP_GENES_ROOT = '.PATRIC.spgene.tab'
@@ -23,11 +26,22 @@ def extract_AMR_genes_names(file_path: str = None, gene_type: str = 'Antibiotic
     return df['gene'].tolist()
 
 
-def extract_genes_positions(file_path: str = None, genome_id: str = None, gene_name: str | List = None) -> Union[Tuple[str, int, int], Dict[str, Tuple[str, int, int]]]:
+def extract_genes_positions(file_path: str = None, genome_id: str = None, gene_name: str | List = None, index: FeatureIndex = None) -> Union[Tuple[str, int, int], Dict[str, Tuple[str, int, int]]]:
     """Extract the genomic coordinates of a given gene name in XXXX.PATRIC.features.tab or XXXX.PATRIC.gff
         Equivalent to `grep gene_name XXXX.PATRIC.features.tab XXXX.gff`
+        When a FeatureIndex is given, the coordinates are looked up in the index (the genome is (re-)indexed first if its
+        features file is new or changed) and the features file is not read. Genes with several copies return their first copy.
     """
 
+    if index is not None:
+        # add_genome only reads the features file when its mtime changed
+        index.add_genome(file_path, genome_id)
+
+        genes: List[str] = [gene_name] if isinstance(gene_name, str) else gene_name
+        copies: Dict[str, List[Tuple[str, int, int, str]]] = index.lookup(genome_id, genes)
+        value_dict: dict = {gene: (accession, start, end) for gene, [(accession, start, end, _), *_] in copies.items()}
+
+        return value_dict[gene_name] if isinstance(gene_name, str) else value_dict
 
     data_path: Path = Path.joinpath(Path(file_path), Path(genome_id + FEATURES_ROOT))
     df: pd.DataFrame = pd.read_csv(data_path, sep = '\t')
@@ -40,47 +54,148 @@ def extract_genes_positions(file_path: str = None, genome_id: str = None, gene_n
     
     elif isinstance(gene_name, list):
         
-        value: pd.Series = df[df['gene'].isin(gene_name)]
-        value_dict: dict = {k: (v[1]['accession'], v[1]['start'], v[1]['end']) for k, v in zip(gene_name, value.iterrows())}
+        value: pd.DataFrame = df[df['gene'].isin(gene_name)].drop_duplicates(subset = 'gene')
+        found: dict = {row.gene: (row.accession, row.start, row.end) for row in value.itertuples(index = False)}
+        value_dict: dict = {gene: found[gene] for gene in gene_name if gene in found}
 
         return value_dict
 
-def extract_gene_sequence(file_path: str = None, genome_id: str = None, gene_name: str | List[str] = None) -> Dict[str, Tuple[str, str]]:
+def extract_gene_sequence(file_path: str = None, genome_id: str = None, gene_name: str | List[str] = None, index: FeatureIndex = None) -> Dict[str, Tuple[str, str]]:
     """
     Extract gene sequence from a genome given a genome_id and genomic interval coordinates.
+    The contigs are read through a `.fai` index of the genome (built once and kept next to the `.fna`),
+    the coordinates through `index` if it is given (see extract_genes_positions).
     """
 
     genome_file: Path = Path.joinpath(Path(file_path), Path(genome_id + '.fna'))
 
     if isinstance(gene_name, str):
+        infos: Dict[str, Tuple[str, int, int]] = {gene_name: extract_genes_positions(file_path=file_path, genome_id=genome_id, gene_name=gene_name, index=index)}
 
-        contig, start, stop = extract_genes_positions(file_path=file_path, genome_id=genome_id, gene_name=gene_name)
+    elif isinstance(gene_name, list):
+        infos: Dict[str, Tuple[str, int, int]] = extract_genes_positions(file_path=file_path, genome_id=genome_id, gene_name=gene_name, index=index)
 
-        for seq_record in SeqIO.parse(genome_file, "fasta"):
+    sequences_dict: Dict[str, Tuple[str, str]] = {}
 
-            if seq_record.id == contig:
-                sequence: str = str(seq_record.seq[start:stop].upper())
-    
-        return {gene_name: (seq_record.id, sequence)} 
-    
+    with FastaIndex(genome_file) as genome:
+        for gene, (contig, start, stop) in infos.items():
+            sequences_dict[gene] = (contig, genome.fetch(contig, start, stop).upper())
 
-    elif isinstance(gene_name, list):
+    return sequences_dict
 
-        sequences_dict = {} # Placeholder
-        infos = extract_genes_positions(file_path=file_path, genome_id=genome_id, gene_name=gene_name)
-        genes = infos.keys()
-        contigs = [info[0] for info in infos.values()]
-        starts = [info[1] for info in infos.values()]
-        stops = [info[2] for info in infos.values()]
 
-        for idx, gene in enumerate(genes):
-            for seq_record in SeqIO.parse(genome_file, "fasta"):
+def _extract_genome_AMR_genes(args: Tuple[str, str, str]) -> Tuple[str, List[dict], str | None]:
+    """Worker of extract_AMR_genes_batch: spgene -> features -> sequences for one genome, each file read once."""
 
-                if seq_record.id == contigs[idx]:
-                    sequence: str = str(seq_record.seq[starts[idx]: stops[idx]]).upper()
+    file_path, genome_id, gene_type = args
 
-            sequences_dict[gene] = (contigs[idx], sequence)
+    try:
+        spgenes: pd.DataFrame = pd.read_csv(Path.joinpath(Path(file_path), Path(genome_id + SP_GENES_ROOT)), sep = '\t')
+        spgenes = spgenes[spgenes['property'] == gene_type]
 
-        return sequences_dict
+        features: pd.DataFrame = pd.read_csv(Path.joinpath(Path(file_path), Path(genome_id + FEATURES_ROOT)), sep = '\t')
+        if 'patric_id' in spgenes.columns and 'patric_id' in features.columns:
+            # Many AMR rows have a blank gene name, the features are matched on their patric_id
+            amr: pd.DataFrame = spgenes[['patric_id', 'gene']].dropna(subset = ['patric_id']).drop_duplicates(subset = 'patric_id')
+            features = features.merge(amr.rename(columns = {'gene': 'spgene_gene'}), on = 'patric_id', how = 'inner')
+            gene_names: pd.Series = features['gene'] if 'gene' in features.columns else features['spgene_gene']
+            features['gene'] = gene_names.fillna(features['spgene_gene']).fillna(features['patric_id'])
+        else:
+            features = features[features['gene'].isin(spgenes['gene'].dropna())]
 
+        records: List[dict] = []
+        with FastaIndex(Path.joinpath(Path(file_path), Path(genome_id + '.fna'))) as genome:
+            for feature in features.itertuples(index=False):
+                start, end = int(feature.start), int(feature.end)
+                strand = getattr(feature, 'strand', None)
+                records.append({
+                    'genome_id': genome_id,
+                    'gene': feature.gene,
+                    'contig': feature.accession,
+                    'start': start,
+                    'end': end,
+                    'strand': strand if isinstance(strand, str) else None,
+                    'sequence': genome.fetch(feature.accession, start, end).upper(),
+                })
+
+        return genome_id, records, None
+
+    except Exception as e:
+        return genome_id, [], f"{type(e).__name__}: {e}"
+
+
+def extract_AMR_genes_batch(file_path: str = None, genomes: List[str] | pd.DataFrame = None, output: str = None,
+                            gene_type: str = 'Antibiotic Resistance', workers: int = None, chunksize: int = 4) -> pd.DataFrame:
+    """
+    Extract the AMR gene sequences of many genomes into a single FASTA or Parquet file.
+
+    Each genome is processed in a worker process (spgene -> features -> sequences, every file
+    read once) and the results are streamed to `output` in the order of `genomes`. All the
+    copies of a gene are kept. Genomes that fail are recorded and returned, not raised.
+
+    Parameters
+    ----------
+    file_path : str, optional
+        Directory of the BV-BRC genome files, by default None
+    genomes : List[str] | pd.DataFrame, optional
+        Genome IDs, or a metadata frame with a 'genome_id' column (e.g. from filter.filter_dataset), by default None
+    output : str, optional
+        Output path, Parquet if it ends with '.parquet', FASTA otherwise, by default None
+    gene_type : str, optional
+        Property of the speciality genes to extract, by default 'Antibiotic Resistance'
+    workers : int, optional
+        Number of worker processes, by default None (number of CPUs)
+    chunksize : int, optional
+        Number of genomes sent to a worker at once, by default 4
+
+    Returns
+    -------
+    pd.DataFrame
+        Failed genomes with their error message ('genome_id', 'error')
+    """
 
+    if isinstance(genomes, pd.DataFrame):
+        genomes = genomes['genome_id'].astype(str).unique().tolist()
+
+    output_path: Path = Path(output)
+    parquet: bool = output_path.suffix == '.parquet'
+    failures: List[Tuple[str, str]] = []
+    buffer: List[dict] = []
+    writer = None
+
+    def flush() -> None:
+        nonlocal writer
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema([('genome_id', pa.string()), ('gene', pa.string()), ('contig', pa.string()), ('start', pa.int64()),
+                            ('end', pa.int64()), ('strand', pa.string()), ('sequence', pa.string())])
+        table = pa.Table.from_pylist(buffer, schema = schema)
+        if writer is None:
+            writer = pq.ParquetWriter(output_path, table.schema)
+        writer.write_table(table)
+        buffer.clear()
+
+    jobs = ((file_path, genome_id, gene_type) for genome_id in genomes)
+
+    with ProcessPoolExecutor(max_workers = workers) as executor, open(output_path, 'w') if not parquet else nullcontext() as fasta:
+        for genome_id, records, error in executor.map(_extract_genome_AMR_genes, jobs, chunksize = chunksize):
+            if error is not None:
+                print(f"Error of extraction: {genome_id} - {error}")
+                failures.append((genome_id, error))
+                continue
+
+            if parquet:
+                buffer.extend(records)
+                if len(buffer) >= 10_000:
+                    flush()
+            else:
+                for record in records:
+                    fasta.write(f">{record['genome_id']}|{record['gene']}|{record['contig']}:{record['start']}-{record['end']}\n{record['sequence']}\n")
+
+    if parquet:
+        if buffer or writer is None:
+            flush()
+        writer.close()
+
+    return pd.DataFrame(failures, columns = ['genome_id', 'error'])
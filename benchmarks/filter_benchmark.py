@@ -0,0 +1,64 @@
+"""Compare peak RSS and wall time of the eager and the streaming metadata filters.
+
+Usage:
+    python benchmarks/filter_benchmark.py PATRIC_genomes_AMR.txt [--chunksize 100000]
+
+Each mode runs in a fresh process so that its peak resident memory is measured alone.
+"""
+import argparse
+import multiprocessing as mp
+import os
+import resource
+import sys
+import tempfile
+from time import perf_counter
+
+PREDICATES = {"resistant_phenotype": {"Resistant", "Susceptible"}}
+
+
+def _eager(data: str, output: str, chunksize: int) -> int:
+    from SmartAMR.filter import filter_dataset
+
+    df = filter_dataset(data, cache = False)
+    df = df[df["resistant_phenotype"].isin(PREDICATES["resistant_phenotype"])]
+    df.to_csv(output, sep = "\t", index = False)
+    return len(df)
+
+
+def _streaming(data: str, output: str, chunksize: int) -> int:
+    from SmartAMR.filter import write_filtered_dataset
+
+    return write_filtered_dataset(data, output, predicates = PREDICATES, chunksize = chunksize)
+
+
+def _run(mode, data: str, output: str, chunksize: int, queue: mp.Queue) -> None:
+    start = perf_counter()
+    n_rows = mode(data, output, chunksize)
+    elapsed = perf_counter() - start
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    queue.put((n_rows, elapsed, peak))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("data", help = "tab-separated AMR metadata file")
+    parser.add_argument("--chunksize", type = int, default = 100_000)
+    args = parser.parse_args()
+
+    context = mp.get_context("spawn")
+    print(f"{'mode':<10} {'rows':>10} {'wall (s)':>10} {'peak RSS (MB)':>14}")
+
+    for name, mode in (("eager", _eager), ("streaming", _streaming)):
+        with tempfile.TemporaryDirectory() as tmp:
+            queue = context.Queue()
+            process = context.Process(target = _run, args = (mode, args.data, os.path.join(tmp, "out.tsv"), args.chunksize, queue))
+            process.start()
+            n_rows, elapsed, peak = queue.get()
+            process.join()
+
+        print(f"{name:<10} {n_rows:>10} {elapsed:>10.2f} {peak / 1e6:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
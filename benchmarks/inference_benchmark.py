@@ -0,0 +1,83 @@
+"""Compare the Keras AMR prediction model with its numpy export, unquantized and quantized.
+
+Usage:
+    python benchmarks/inference_benchmark.py [--n 2048] [--length 1000] [--units 128] [--batch 256]
+
+A model with the architecture of the prototypes (random weights unless --weights is given) is
+exported with each quantization, its scores are checked against model.predict, then the
+per-sequence latency (one sequence per call, as in the prototype generation loop) and the
+batch throughput are reported.
+"""
+import argparse
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+import keras
+import numpy as np
+
+from SmartAMR.encoding import NUCLEOTIDES
+from SmartAMR.inference import QUANTIZATIONS, AMRScorer, check_parity, export_classifier
+
+# Largest expected score difference with the Keras model per quantization
+TOLERANCES = {'none': 1e-4, 'float16': 5e-3, 'int8': 5e-2}
+
+
+def build_model(length: int, units: int, embedding_dim: int = 64) -> keras.Model:
+    """AMR prediction model of prototype.py."""
+
+    inputs = keras.Input(shape = (length,), name = 'input_amr')
+    embedded = keras.layers.Embedding(input_dim = len(NUCLEOTIDES), output_dim = embedding_dim)(inputs)
+    hidden = keras.layers.LSTM(units = units)(embedded)
+    outputs = keras.layers.Dense(1, activation = 'sigmoid', name = 'output_amr')(hidden)
+    return keras.Model(inputs, outputs)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type = int, default = 2048, help = "number of sequences scored")
+    parser.add_argument("--length", type = int, default = 1000)
+    parser.add_argument("--units", type = int, default = 128)
+    parser.add_argument("--batch", type = int, default = 256)
+    parser.add_argument("--single", type = int, default = 10, help = "number of one-sequence calls timed")
+    parser.add_argument("--weights", type = Path, help = "trained weights of the model (.weights.h5)")
+    parser.add_argument("--seed", type = int, default = 0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    keras.utils.set_random_seed(args.seed)
+    model = build_model(args.length, args.units)
+    if args.weights:
+        model.load_weights(args.weights)
+
+    sequences = ["".join(rng.choice(list(NUCLEOTIDES), size = rng.integers(args.length // 2, args.length + 1))) for _ in range(args.n)]
+    tokens = AMRScorer.from_keras(model).encode(sequences)
+
+    start = perf_counter()
+    for i in range(args.single):
+        model.predict(tokens[i:i + 1], verbose = 0)
+    keras_latency = (perf_counter() - start) / args.single
+    start = perf_counter()
+    model.predict(tokens, batch_size = args.batch, verbose = 0)
+    keras_throughput = args.n / (perf_counter() - start)
+    print(f"{'keras':>8} {'':>10} {keras_latency * 1e3:>8.1f} ms/seq {keras_throughput:>10,.0f} seq/s")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for quantize in QUANTIZATIONS:
+            path = export_classifier(model, Path(tmp) / f"amr_{quantize}.npz", quantize = quantize)
+            scorer = AMRScorer.load(path, batch_size = args.batch)
+            difference = check_parity(model, scorer, sequences, atol = TOLERANCES[quantize])
+
+            start = perf_counter()
+            for i in range(args.single):
+                scorer.score_encoded(tokens[i:i + 1])
+            latency = (perf_counter() - start) / args.single
+            start = perf_counter()
+            scorer.score_encoded(tokens)
+            throughput = args.n / (perf_counter() - start)
+            print(f"{quantize:>8} {path.stat().st_size / 1e3:>7.0f} kB {latency * 1e3:>8.1f} ms/seq {throughput:>10,.0f} seq/s"
+                  f"   max |diff| {difference:.1e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Compare the per-position loops of mutation_penalty_tf / codon_usage_reward_tf (prototype_2.py)
+with the vectorized SmartAMR.losses versions, over increasing sequence lengths.
+
+Usage:
+    python benchmarks/loss_benchmark.py [--tokens 65536] [--lengths 99 300 999 3000] [--repeats 20]
+
+The number of bases per step is fixed (batch = tokens // length), so the work is the same at
+every length and only the per-position overhead differs: the loops grow with the length,
+the vectorized versions stay flat. Both versions are compiled with tf.function and checked
+to match on each length before their step times (loss value and gradient) are reported.
+"""
+import argparse
+from time import perf_counter
+
+import numpy as np
+import tensorflow as tf
+
+from SmartAMR.encoding import CODONS
+from SmartAMR.losses import codon_usage_reward, mutation_penalty
+from SmartAMR.sampler import mutation_transition_matrix
+
+
+def _loop_mutation_penalty(y_true, y_pred, mutation_probs):
+    """mutation_penalty_tf of prototype_2.py, one gather per position."""
+
+    penalty = tf.zeros(tf.shape(y_true)[0])
+    for i in tf.range(tf.shape(y_true)[1]):
+        true_indices = tf.argmax(y_true[:, i, :], axis = -1)
+        pred_indices = tf.argmax(y_pred[:, i, :], axis = -1)
+        probs = tf.gather_nd(mutation_probs, tf.stack([true_indices, pred_indices], axis = 1))
+        penalty += 1.0 - probs
+    return penalty
+
+
+def _loop_codon_usage_reward(y_true, codon_usage_tensor):
+    """codon_usage_reward_tf of prototype_2.py, one gather per codon."""
+
+    reward = tf.zeros(tf.shape(y_true)[0])
+    for i in tf.range(0, tf.shape(y_true)[1] - 2, 3):
+        bases = tf.argmax(y_true[:, i:i + 3, :], axis = -1, output_type = tf.int32)
+        reward += tf.gather(codon_usage_tensor, 16 * bases[:, 0] + 4 * bases[:, 1] + bases[:, 2])
+    return reward
+
+
+def _time(step, *args, repeats: int) -> float:
+    step(*args)  # trace
+    start = perf_counter()
+    for _ in range(repeats):
+        step(*args)[0].numpy()
+    return (perf_counter() - start) / repeats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type = int, default = 65536, help = "bases per step, batch * length")
+    parser.add_argument("--lengths", type = int, nargs = "+", default = [99, 300, 999, 3000])
+    parser.add_argument("--repeats", type = int, default = 20)
+    parser.add_argument("--seed", type = int, default = 0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    mutation_rates = {("A", "G"): 2.0, ("C", "T"): 2.0, ("A", "C"): 0.5, ("A", "T"): 0.5, ("C", "G"): 0.5, ("G", "T"): 0.5}
+    total_rate = sum(mutation_rates.values())
+    matrix = tf.constant(mutation_transition_matrix({k: v / total_rate for k, v in mutation_rates.items()}), dtype = tf.float32)
+    usage = tf.constant(rng.dirichlet(np.ones(len(CODONS))), dtype = tf.float32)
+
+    def make_step(penalty_fn, reward_fn):
+        @tf.function
+        def step(y_true, logits):
+            with tf.GradientTape() as tape:
+                tape.watch(logits)
+                y_pred = tf.nn.softmax(logits)
+                penalty = penalty_fn(y_true, y_pred)
+                reward = reward_fn(y_pred)
+                loss = tf.reduce_mean(penalty - reward)
+            return penalty, reward, tape.gradient(loss, logits)
+        return step
+
+    loop_step = make_step(lambda t, p: _loop_mutation_penalty(t, p, matrix), lambda p: _loop_codon_usage_reward(p, usage))
+    hard_step = make_step(lambda t, p: mutation_penalty(t, p, matrix, hard = True), lambda p: codon_usage_reward(p, usage))
+    soft_step = make_step(lambda t, p: mutation_penalty(t, p, matrix), lambda p: codon_usage_reward(p, usage, hard = False))
+
+    print(f"{'length':>8} {'batch':>6} {'loop (ms)':>10} {'vectorized (ms)':>16} {'soft (ms)':>10} {'speed-up':>9}")
+    for length in args.lengths:
+        batch = max(1, args.tokens // length)
+        y_true = tf.one_hot(rng.integers(0, 4, size = (batch, length)), 4)
+        logits = tf.constant(rng.normal(size = (batch, length, 4)), dtype = tf.float32)
+
+        # The loops sum over positions, the vectorized versions average
+        loop_penalty, loop_reward, _ = loop_step(y_true, logits)
+        penalty, reward, _ = hard_step(y_true, logits)
+        np.testing.assert_allclose(loop_penalty.numpy(), penalty.numpy() * length, rtol = 1e-4)
+        np.testing.assert_allclose(loop_reward.numpy(), reward.numpy() * (length // 3), rtol = 1e-4)
+
+        loop_time = _time(loop_step, y_true, logits, repeats = args.repeats)
+        hard_time = _time(hard_step, y_true, logits, repeats = args.repeats)
+        soft_time = _time(soft_step, y_true, logits, repeats = args.repeats)
+        print(f"{length:>8} {batch:>6} {loop_time * 1e3:>10.2f} {hard_time * 1e3:>16.2f} {soft_time * 1e3:>10.2f} {loop_time / hard_time:>8.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Compare the per-base biasing loop of the prototype with the precomputed ConstrainedSampler tables.
+
+Usage:
+    python benchmarks/sampler_benchmark.py [--batch 1024] [--steps 300]
+
+Both biasings are run on the same random probabilities and sequences, their results are
+checked to match before the per-base times are reported.
+"""
+import argparse
+from time import perf_counter
+
+import numpy as np
+
+from SmartAMR.encoding import NUCLEOTIDES
+from SmartAMR.sampler import ConstrainedSampler
+
+REVERSE_NUCLEOTIDES = dict(enumerate(NUCLEOTIDES))
+
+
+def _loop_bias(probabilities, generated, codon_usage, canonical_codons, mutation_probabilities):
+    """Biasing step of generate_sequence_constrained (prototype.py), for one sequence."""
+
+    current_base = generated[-1]
+    next_probs = np.zeros_like(probabilities)
+    for j, next_base in REVERSE_NUCLEOTIDES.items():
+        mutation = tuple(sorted((current_base, next_base)))
+        next_probs[j] = probabilities[j] * mutation_probabilities.get(mutation, 1.0)
+
+    if len(generated) >= 2 and (len(generated) + 1) % 3 == 0:
+        potential_codon = "".join(generated[-2:])
+        biased_probs = np.zeros_like(next_probs)
+        for j, next_base in REVERSE_NUCLEOTIDES.items():
+            potential_full_codon = potential_codon + next_base
+            bias = codon_usage.get(potential_full_codon, 1e-6)
+            if potential_full_codon not in canonical_codons:
+                bias *= 0.1
+            biased_probs[j] = next_probs[j] * bias
+        next_probs = biased_probs / np.sum(biased_probs) if np.sum(biased_probs) > 0 else next_probs
+
+    return next_probs / np.sum(next_probs) if np.sum(next_probs) > 0 else probabilities
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch", type = int, default = 1024, help = "number of sequences biased together")
+    parser.add_argument("--steps", type = int, default = 300, help = "number of positions")
+    parser.add_argument("--seed", type = int, default = 0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    codons = [a + b + c for a in NUCLEOTIDES for b in NUCLEOTIDES for c in NUCLEOTIDES]
+    codon_usage = dict(zip(codons, rng.dirichlet(np.ones(len(codons)))))
+    canonical_codons = set(codons) - {"TAA", "TAG", "TGA"}
+    mutation_rates = {("A", "G"): 2.0, ("C", "T"): 2.0, ("A", "C"): 0.5, ("A", "T"): 0.5, ("C", "G"): 0.5, ("G", "T"): 0.5}
+    total_rate = sum(mutation_rates.values())
+    mutation_probabilities = {k: v / total_rate for k, v in mutation_rates.items()}
+
+    bases = rng.integers(0, 4, size = (args.batch, args.steps))
+    probabilities = rng.dirichlet(np.ones(4), size = (args.steps, args.batch))
+    sequences = ["".join(NUCLEOTIDES[b] for b in row) for row in bases]
+
+    start = perf_counter()
+    sampler = ConstrainedSampler.from_dicts(codon_usage, canonical_codons, mutation_probabilities)
+    build = perf_counter() - start
+
+    start = perf_counter()
+    loop = [
+        np.stack([_loop_bias(probabilities[t, i], sequences[i][:t + 1], codon_usage, canonical_codons, mutation_probabilities)
+                  for i in range(args.batch)])
+        for t in range(args.steps)
+    ]
+    loop_time = perf_counter() - start
+
+    start = perf_counter()
+    tables = [sampler.bias(probabilities[t], bases, t) for t in range(args.steps)]
+    table_time = perf_counter() - start
+
+    error = max(np.abs(a - b).max() for a, b in zip(loop, tables))
+    if error > 1e-9:
+        raise SystemExit(f"Biased probabilities differ by {error:.3g}")
+
+    n_bases = args.batch * args.steps
+    print(f"tables built in {build * 1e3:.2f} ms, max abs difference {error:.2g}")
+    print(f"{'mode':<10} {'wall (s)':>10} {'us / base':>10}")
+    print(f"{'loop':<10} {loop_time:>10.3f} {loop_time / n_bases * 1e6:>10.3f}")
+    print(f"{'tables':<10} {table_time:>10.3f} {table_time / n_bases * 1e6:>10.3f}")
+    print(f"speed-up x{loop_time / table_time:.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Recall@k and query throughput of the IVF similarity index against the exact (brute force) search.
+
+Usage:
+    python benchmarks/similarity_benchmark.py [--n 50000] [--dim 960] [--lists 256] [--metric cosine]
+    python benchmarks/similarity_benchmark.py --store web_interface/data/embeddings/phageDB
+
+Without --store the vectors are drawn around random cluster centers, as proteome
+embeddings of related phages. Recall@k is the share of the exact k nearest neighbours
+found by the approximate search.
+"""
+import argparse
+from time import perf_counter
+
+import numpy as np
+
+from SmartAMR.similarity import SimilarityIndex
+
+
+def _recall(exact: np.ndarray, approximate: np.ndarray) -> float:
+    hits = sum(len(np.intersect1d(e[e >= 0], a[a >= 0])) for e, a in zip(exact, approximate))
+    return hits / max(int((exact >= 0).sum()), 1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--store", help = "EmbeddingStore directory, instead of synthetic vectors")
+    parser.add_argument("--n", type = int, default = 50_000, help = "number of synthetic vectors")
+    parser.add_argument("--dim", type = int, default = 960, help = "size of the synthetic vectors")
+    parser.add_argument("--noise", type = float, default = 2.0, help = "spread of the synthetic vectors around their cluster center")
+    parser.add_argument("--queries", type = int, default = 500)
+    parser.add_argument("--k", type = int, default = 10)
+    parser.add_argument("--lists", type = int, default = 256)
+    parser.add_argument("--probes", type = int, nargs = "+", default = [1, 4, 8, 16, 32])
+    parser.add_argument("--metric", choices = ("cosine", "l2"), default = "cosine")
+    parser.add_argument("--backend", choices = ("numpy", "faiss"), default = "numpy")
+    parser.add_argument("--seed", type = int, default = 0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.store:
+        from SmartAMR.embedding_store import EmbeddingStore
+
+        ids, vectors = EmbeddingStore(args.store).matrix()
+        vectors = np.asarray(vectors, dtype = np.float32)
+    else:
+        centers = (rng.normal(size = (max(args.n // 100, 1), args.dim)) / np.sqrt(args.dim)).astype(np.float32)
+        vectors = centers[rng.integers(0, len(centers), args.n)] + args.noise / np.sqrt(args.dim) * rng.normal(size = (args.n, args.dim)).astype(np.float32)
+        ids = [str(i) for i in range(args.n)]
+
+    queries = vectors[rng.choice(len(vectors), min(args.queries, len(vectors)), replace = False)]
+    queries = queries + 0.1 * args.noise / np.sqrt(args.dim) * rng.normal(size = queries.shape).astype(np.float32)
+
+    exact = SimilarityIndex(metric = args.metric, backend = args.backend).fit(ids, vectors)
+    start = perf_counter()
+    exact_rows, _ = exact.search_rows(queries, args.k)
+    exact_time = perf_counter() - start
+
+    start = perf_counter()
+    ivf = SimilarityIndex(metric = args.metric, n_lists = args.lists, backend = args.backend).fit(ids, vectors)
+    build_time = perf_counter() - start
+
+    print(f"{len(vectors)} vectors of size {vectors.shape[1]}, {len(queries)} queries, k = {args.k}, metric {args.metric}, backend {args.backend}")
+    print(f"IVF with {args.lists} lists built in {build_time:.2f} s")
+    print(f"{'search':<12} {'recall@k':>9} {'queries/s':>10}")
+    print(f"{'exact':<12} {1.0:>9.3f} {len(queries) / exact_time:>10.0f}")
+
+    # Compare on ids, the IVF index reorders its rows by list
+    id_position = {key: i for i, key in enumerate(exact.ids)}
+    for n_probe in args.probes:
+        ivf.n_probe = n_probe
+        if ivf._faiss_index is not None:
+            ivf._faiss_index.nprobe = n_probe
+        start = perf_counter()
+        rows, _ = ivf.search_rows(queries, args.k)
+        elapsed = perf_counter() - start
+        positions = np.array([[id_position[ivf.ids[r]] if r >= 0 else -1 for r in row] for row in rows])
+        print(f"{'ivf/' + str(n_probe):<12} {_recall(exact_rows, positions):>9.3f} {len(queries) / elapsed:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,10 @@ from tensorflow.keras.callbacks import EarlyStopping
 import numpy as np
 import random
 
+from SmartAMR.encoding import encode_batch, VOCAB_SIZE
+from SmartAMR.generation import BatchedGenerator
+from SmartAMR.sampler import ConstrainedSampler
+
 # --- 1. Define Parameters ---
 seq_length = 1000  # Length of input/output sequences
 embedding_dim = 64  # Dimensionality of the nucleotide embeddings
@@ -20,7 +24,7 @@ patience = 3       # For EarlyStopping
 
 # --- 2. Define Nucleotide and Codon Mappings, Mutation Rates ---
 nucleotides = {'A': 0, 'C': 1, 'G': 2, 'T': 3}
-reverse_nucleotides = {0: 'A', 1: 'C', 2: 'G': 3, 3: 'T'}
+reverse_nucleotides = {0: 'A', 1: 'C', 2: 'G', 3: 'T'}
 
 # Example codon usage table for E. coli (replace with your species)
 codon_usage = {
@@ -44,15 +48,8 @@ total_rate = sum(mutation_rates.values())
 mutation_probabilities = {k: v / total_rate for k, v in mutation_rates.items()}
 
 def encode_sequence(seq, length):
-    encoded = [nucleotides.get(base, 0) for base in seq]
-    if len(encoded) < length:
-        encoded += [0] * (length - len(encoded))
-    elif len(encoded) > length:
-        encoded = encoded[:length]
-    return np.array(encoded)
-
-def decode_sequence(encoded_seq):
-    return "".join([reverse_nucleotides.get(i, 'N') for i in encoded_seq])
+    # Padding stays 'A' (0) so that targets fit in num_nucleotides classes, ambiguous bases get their own code (4)
+    return encode_batch([seq], length, pad_value=0)[0]
 
 # --- 3. Prepare Dummy Training Data for Generative Model ---
 # Replace this with your actual data loading from PATRIC
@@ -61,13 +58,14 @@ amr_gene_sequences_gen = [
     "CGTACGATCGATCGATCGATCGATCGATCGATCGATC" * 10,
     "GCTAGCTAGCTAGCTAGCTAGCTAGCTAGCTAGCTA" * 10,
 ]
-encoded_sequences_gen = np.array([encode_sequence(seq, seq_length) for seq in amr_gene_sequences_gen])
+encoded_sequences_gen = encode_batch(amr_gene_sequences_gen, seq_length, pad_value=0)
 X_train_gen = encoded_sequences_gen[:, :-1]
-y_train_gen_one_hot = tf.keras.utils.to_categorical(np.expand_dims(encoded_sequences_gen[:, 1:], axis=-1), num_classes=num_nucleotides)
+# tf.one_hot of an ambiguous base (4, out of the num_nucleotides classes) is a zero vector, it does not count in the loss
+y_train_gen_one_hot = tf.one_hot(encoded_sequences_gen[:, 1:].astype(np.int32), depth=num_nucleotides)
 
 # --- 4. Build and Train the Generative LSTM Model ---
 input_seq_gen = Input(shape=(seq_length - 1,), name='input_gen')
-embedding_gen = Embedding(input_dim=num_nucleotides, output_dim=embedding_dim)(input_seq_gen)
+embedding_gen = Embedding(input_dim=VOCAB_SIZE, output_dim=embedding_dim)(input_seq_gen)
 lstm_gen = LSTM(units=lstm_units_gen, return_sequences=True)(embedding_gen)
 output_probs_gen = TimeDistributed(Dense(units=num_nucleotides, activation='softmax'), name='output_gen')(lstm_gen)
 generative_model = Model(inputs=input_seq_gen, outputs=output_probs_gen)
@@ -123,13 +121,13 @@ def generate_sequence_constrained(model, seed_sequence, length, codon_usage, can
 # Dummy data for AMR prediction - replace with your actual data
 amr_gene_sequences_amr_pos = [generate_sequence("ATGC", seq_length) for _ in range(100)]
 amr_gene_sequences_amr_neg = [generate_sequence("CGTA", seq_length) for _ in range(100)]
-encoded_sequences_amr_pos = np.array([encode_sequence(seq, seq_length) for seq in amr_gene_sequences_amr_pos])
-encoded_sequences_amr_neg = np.array([encode_sequence(seq, seq_length) for seq in amr_gene_sequences_amr_neg])
+encoded_sequences_amr_pos = encode_batch(amr_gene_sequences_amr_pos, seq_length, pad_value=0)
+encoded_sequences_amr_neg = encode_batch(amr_gene_sequences_amr_neg, seq_length, pad_value=0)
 X_train_amr = np.vstack([encoded_sequences_amr_pos, encoded_sequences_amr_neg])
 y_train_amr = np.array([1] * 100 + [0] * 100)
 
 input_seq_amr = Input(shape=(seq_length,), name='input_amr')
-embedding_amr = Embedding(input_dim=num_nucleotides, output_dim=embedding_dim)(input_seq_amr)
+embedding_amr = Embedding(input_dim=VOCAB_SIZE, output_dim=embedding_dim)(input_seq_amr)
 lstm_amr = LSTM(units=lstm_units_amr)(embedding_amr)
 output_amr = Dense(1, activation='sigmoid', name='output_amr')(lstm_amr)
 amr_prediction_model = Model(inputs=input_seq_amr, outputs=output_amr)
@@ -151,10 +149,10 @@ print("AMR prediction model training finished.")
 print("\nGenerating and evaluating constrained mutant sequences...")
 seed = amr_gene_sequences_gen[0][:50]
 num_generated = 5
-for i in range(num_generated):
-    mutant_sequence = generate_sequence_constrained(
-        generative_model, seed, seq_length, codon_usage, canonical_codons, mutation_probabilities
-    )
-    encoded_mutant = np.expand_dims(encode_sequence(mutant_sequence, seq_length), axis=0)
-    amr_prediction = amr_prediction_model.predict(encoded_mutant)[0][0]
-    print(f"Generated Mutant {i + 1}: {mutant_sequence[:20]}..., Predicted AMR Likelihood: {amr_prediction:.4f}")
\ No newline at end of file
+# Batched, stateful equivalent of generate_sequence_constrained: one LSTM step per base for all the mutants
+sampler = ConstrainedSampler.from_dicts(codon_usage, canonical_codons, mutation_probabilities)
+generator = BatchedGenerator.from_keras(generative_model, sampler)
+mutant_sequences = generator.generate(seed, seq_length, n_samples=num_generated)
+amr_predictions = amr_prediction_model.predict(encode_batch(mutant_sequences, seq_length, pad_value=0))[:, 0]
+for i, (mutant_sequence, amr_prediction) in enumerate(zip(mutant_sequences, amr_predictions)):
+    print(f"Generated Mutant {i + 1}: {mutant_sequence[:20]}..., Predicted AMR Likelihood: {amr_prediction:.4f}")
@@ -6,6 +6,8 @@ from tensorflow.keras.callbacks import EarlyStopping
 import numpy as np
 import random
 
+from SmartAMR.encoding import encode_batch, VOCAB_SIZE
+
 # --- 1. Define Parameters ---
 seq_length = 1000  # Length of input/output sequences
 embedding_dim = 64  # Dimensionality of the nucleotide embeddings
@@ -44,15 +46,8 @@ total_rate = sum(mutation_rates.values())
 mutation_probabilities = {k: v / total_rate for k, v in mutation_rates.items()}
 
 def encode_sequence(seq, length):
-    encoded = [nucleotides.get(base, 0) for base in seq]
-    if len(encoded) < length:
-        encoded += [0] * (length - len(encoded))
-    elif len(encoded) > length:
-        encoded = encoded[:length]
-    return np.array(encoded)
-
-def decode_sequence(encoded_seq):
-    return "".join([reverse_nucleotides.get(i, 'N') for i in encoded_seq])
+    # Padding stays 'A' (0) so that targets fit in num_nucleotides classes, ambiguous bases get their own code (4)
+    return encode_batch([seq], length, pad_value=0)[0]
 
 # --- 3. Prepare Dummy Training Data for Generative Model ---
 # Replace this with your actual data loading from PATRIC
@@ -61,17 +56,18 @@ amr_gene_sequences_gen = [
     "CGTACGATCGATCGATCGATCGATCGATCGATCGATC" * 10,
     "GCTAGCTAGCTAGCTAGCTAGCTAGCTAGCTAGCTA" * 10,
 ]
-encoded_sequences_gen = np.array([encode_sequence(seq, seq_length) for seq in amr_gene_sequences_gen])
+encoded_sequences_gen = encode_batch(amr_gene_sequences_gen, seq_length, pad_value=0)
 
 
 print(encoded_sequences_gen)
 
 X_train_gen = encoded_sequences_gen[:, :-1]
-y_train_gen_one_hot = tf.keras.utils.to_categorical(np.expand_dims(encoded_sequences_gen[:, 1:], axis=-1), num_classes=num_nucleotides)
+# tf.one_hot of an ambiguous base (4, out of the num_nucleotides classes) is a zero vector, it does not count in the loss
+y_train_gen_one_hot = tf.one_hot(encoded_sequences_gen[:, 1:].astype(np.int32), depth=num_nucleotides)
 
 # # --- 4. Build and Train the Generative LSTM Model ---
 input_seq_gen = Input(shape=(seq_length - 1,), name='input_gen')
-embedding_gen = Embedding(input_dim=num_nucleotides, output_dim=embedding_dim)(input_seq_gen)
+embedding_gen = Embedding(input_dim=VOCAB_SIZE, output_dim=embedding_dim)(input_seq_gen)
 lstm_gen = LSTM(units=lstm_units_gen, return_sequences=True)(embedding_gen)
 output_probs_gen = TimeDistributed(Dense(units=num_nucleotides, activation='softmax'), name='output_gen')(lstm_gen)
 generative_model = Model(inputs=input_seq_gen, outputs=output_probs_gen)
@@ -0,0 +1,130 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from SmartAMR.codon_store import CodonTableStore, usage_vector
+from SmartAMR.encoding import CODONS
+from SmartAMR.scrapper import CodonTable
+
+FIXTURES: Path = Path(__file__).parent / 'fixtures'
+KAZUSA_PAGE: Path = FIXTURES / 'kazusa_83333.html'
+
+
+@pytest.fixture
+def html_content() -> str:
+    return KAZUSA_PAGE.read_text()
+
+
+def test_parse_html(html_content):
+    codon_table = CodonTable('')
+    codon_table.parse_html('83333', html_content)
+
+    assert codon_table.taxon_id == '83333'
+    assert len(codon_table.table) == 64
+    assert codon_table.table['UUU'] == 22.1
+    assert codon_table.table['CUG'] == 48.4
+    assert codon_table.table['UAG'] == 0.3
+
+
+def test_parse_html_replace_uracil(html_content):
+    codon_table = CodonTable('')
+    codon_table.parse_html('83333', html_content, replace_uracil = True)
+
+    assert sorted(codon_table.table) == sorted(CODONS)
+    assert codon_table.table['TTT'] == 22.1
+    assert codon_table.table['ATG'] == 26.4
+
+
+def test_parse_html_without_table():
+    with pytest.raises(ValueError):
+        CodonTable('').parse_html('0', '<HTML><BODY>No such species</BODY></HTML>')
+
+
+def test_usage_vector_codon_order():
+    vector = usage_vector({'UUU': 1.0, 'GGG': 2.0})
+
+    assert vector.shape == (64,)
+    assert vector[CODONS.index('TTT')] == 1.0
+    assert vector[CODONS.index('GGG')] == 2.0
+    assert np.isnan(vector).sum() == 62
+
+
+def test_import_html(tmp_path, html_content):
+    (tmp_path / '83333.html').write_text(html_content)
+    (tmp_path / '1.html').write_text('<HTML></HTML>')
+
+    store = CodonTableStore(tmp_path / 'codon_tables.npz')
+    errors = store.import_html(tmp_path)
+
+    assert list(errors) == ['1']
+    assert store.taxon_ids == ['83333']
+    assert store.get('83333')['TTT'] == pytest.approx(22.1)
+
+
+def test_load_many_round_trip(tmp_path, html_content):
+    store = CodonTableStore.in_directory(tmp_path)
+    store.add_html('83333', html_content)
+    store.add('562', {'ATG': 25.0, 'TAA': 2.5})
+    pending = store.load_many(['562', '83333'])
+    store.save()
+
+    reloaded = CodonTableStore.in_directory(tmp_path)
+    usage = reloaded.load_many(['562', '83333'])
+
+    assert reloaded.taxon_ids == ['83333', '562']
+    assert usage.shape == (2, 64) and usage.dtype == np.float32
+    np.testing.assert_array_equal(usage, pending)
+    np.testing.assert_allclose(usage[1, CODONS.index('TTT')], 22.1, rtol = 1e-6)
+    assert usage[0, CODONS.index('ATG')] == 25.0
+    assert np.isnan(usage[0, CODONS.index('TTT')])
+    np.testing.assert_array_equal(reloaded.to_array(), usage[::-1])
+
+
+def test_load_many_pending_replaces_saved(tmp_path):
+    store = CodonTableStore.in_directory(tmp_path)
+    store.add('562', {'ATG': 25.0})
+    store.save()
+
+    store.add('562', {'ATG': 30.0})
+    assert store.load_many(['562'])[0, CODONS.index('ATG')] == 30.0
+    store.save()
+
+    assert len(store) == 1
+    assert CodonTableStore.in_directory(tmp_path).load_many(['562'])[0, CODONS.index('ATG')] == 30.0
+
+
+def test_load_many_missing_taxon(tmp_path):
+    store = CodonTableStore.in_directory(tmp_path)
+    store.add('562', {'ATG': 25.0})
+
+    with pytest.raises(KeyError):
+        store.load_many(['562', '83333'])
+
+
+def test_lru_cache(tmp_path):
+    store = CodonTableStore.in_directory(tmp_path, cache_size = 2)
+    for taxon_id, usage in (('1', 1.0), ('2', 2.0), ('3', 3.0)):
+        store.add(taxon_id, {'ATG': usage})
+
+    first = store.get('1')
+    assert store.get('1') is first
+    store.get('2')
+    store.get('1')  # '2' is now the least recently used
+    store.get('3')
+
+    assert list(store._cache) == ['1', '3']
+    assert store.get('1') is first
+    assert store.get('2') == {'ATG': 2.0}
+    assert list(store._cache) == ['1', '2']
+
+
+def test_add_invalidates_cache(tmp_path):
+    store = CodonTableStore.in_directory(tmp_path)
+    store.add('562', {'ATG': 25.0})
+    assert store.get('562') == {'ATG': 25.0}
+
+    store.add('562', {'ATG': 30.0})
+
+    assert store.get('562') == {'ATG': 30.0}
+    assert store.codon_table('562').table == {'ATG': 30.0}
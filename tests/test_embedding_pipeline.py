@@ -0,0 +1,57 @@
+import pytest
+
+from SmartAMR.embedding_pipeline import AMINO_ACIDS, DONE_FILENAME, DoneManifest, KmerEmbedder, embed_proteomes, make_embedder
+
+
+@pytest.fixture
+def proteomes(tmp_path):
+    directory = tmp_path / 'proteomes'
+    directory.mkdir()
+    for i in range(3):
+        (directory / f"phage_{i}.faa").write_text(f">p{i}_1\nMKVLAAGIVGLLA\n>p{i}_2\nMSTNPKPQRKTKRNTNRRPQDVKFPGG*\n")
+    return directory
+
+
+def _done(outdir, embedder):
+    manifest = DoneManifest(outdir / DONE_FILENAME)
+    done = manifest.done(embedder)
+    manifest.close()
+    return done
+
+
+def test_embedder_names():
+    assert make_embedder('kmer').name == make_embedder('kmer2').name == KmerEmbedder().name == 'kmer'
+    assert make_embedder('kmer3').name == 'kmer3'
+    assert make_embedder('esmc_300m').name == 'esmc_300m'
+    assert KmerEmbedder(alphabet = 'ACGT').name != 'kmer'
+
+
+def test_manifest_records_given_embedder(proteomes, tmp_path, capsys):
+    outdir = tmp_path / 'embeddings'
+
+    errors, _ = embed_proteomes(proteomes, outdir, embedder = KmerEmbedder(k = 1), workers = 1)
+    assert errors == {}
+    assert set(_done(outdir, 'kmer1')) == {'phage_0', 'phage_1', 'phage_2'}
+    assert _done(outdir, 'kmer') == {}
+
+    # Another embedder of the same size is not the one of the manifest, every proteome is embedded again
+    capsys.readouterr()
+    reversed_embedder = KmerEmbedder(k = 1, alphabet = AMINO_ACIDS[::-1])
+    embed_proteomes(proteomes, outdir, embedder = reversed_embedder, workers = 1)
+    assert "0 proteomes already embedded, 3 to embed" in capsys.readouterr().out
+    assert _done(outdir, 'kmer1') == {}
+
+    (proteomes / 'phage_3.faa').write_text(">p3_1\nMKV\n")
+    embed_proteomes(proteomes, outdir, embedder = reversed_embedder, workers = 1)
+    assert "3 proteomes already embedded, 1 to embed" in capsys.readouterr().out
+
+
+def test_unnamed_embedder_needs_a_name(proteomes, tmp_path):
+    embedder = KmerEmbedder()
+
+    with pytest.raises(ValueError):
+        embed_proteomes(proteomes, tmp_path / 'embeddings', embedder = embedder.__call__, workers = 1)
+
+    errors, _ = embed_proteomes(proteomes, tmp_path / 'embeddings', embedder = embedder.__call__, embedder_name = 'kmer', workers = 1)
+    assert errors == {}
+    assert len(_done(tmp_path / 'embeddings', 'kmer')) == 3
@@ -0,0 +1,86 @@
+import numpy as np
+
+from SmartAMR.embedding_pipeline import KmerEmbedder
+from SmartAMR.embedding_store import EmbeddingStore
+
+
+def _write_proteomes(directory, n):
+    rng = np.random.default_rng(0)
+    directory.mkdir()
+    for i in range(n):
+        records = [f">protein_{j}\n{''.join(rng.choice(list('ACDEFGHIKLMNPQRSTVWY'), size = 50))}\n" for j in range(3)]
+        (directory / f"proteome_{i:03d}.faa").write_text(''.join(records))
+
+
+def test_add_directory_writes_one_segment(tmp_path):
+    _write_proteomes(tmp_path / 'fasta', 20)
+    store = EmbeddingStore(tmp_path / 'store', dtype = 'float32')
+
+    errors = store.add_directory(tmp_path / 'fasta', KmerEmbedder())
+
+    assert errors == {}
+    assert len(store) == 20 and len(store._segments) == 1
+    assert np.allclose(store.get('proteome_000').sum(), 1.0)
+
+    # A new proteome only: one more segment, the others are skipped
+    (tmp_path / 'fasta' / 'proteome_new.faa').write_text('>protein\nMKVLA\n')
+    store.add_directory(tmp_path / 'fasta', KmerEmbedder())
+    assert len(store) == 21 and [segment['n'] for segment in store._segments] == [20, 1]
+
+
+def test_add_directory_segment_size(tmp_path):
+    _write_proteomes(tmp_path / 'fasta', 10)
+    store = EmbeddingStore(tmp_path / 'store', max_segments = None)
+
+    store.add_directory(tmp_path / 'fasta', KmerEmbedder(), segment_size = 4)
+
+    # Segments of 4, 4 and 2 proteomes, the first two merged once the second one is written
+    assert [segment['n'] for segment in store._segments] == [8, 2]
+
+
+def test_segments_are_merged(tmp_path):
+    rng = np.random.default_rng(0)
+    store = EmbeddingStore(tmp_path, dtype = 'float32', max_segments = 4)
+    expected = {}
+
+    for i in range(300):
+        ids = [f"id_{j}" for j in rng.integers(0, 100, size = 3)]
+        embeddings = rng.random((3, 8)).astype(np.float32)
+        store.add(ids, embeddings)
+        expected.update(zip(ids, embeddings))
+        assert len(store._segments) <= 4
+
+    reopened = EmbeddingStore(tmp_path)
+    for current in (store, reopened):
+        assert set(current.ids) == set(expected)
+        for key, embedding in expected.items():
+            np.testing.assert_array_equal(current.get(key), embedding)
+
+    files = {path.name for path in tmp_path.iterdir()}
+    assert len(files) == 2 * len(store._segments) + 1
+
+
+def test_refresh_loads_new_segments(tmp_path):
+    writer = EmbeddingStore(tmp_path, dtype = 'float32')
+    writer.add(['a', 'b'], np.eye(2, dtype = np.float32))
+    reader = EmbeddingStore(tmp_path)
+    first = reader._matrices[0]
+
+    writer.add(['c'], np.ones((1, 2), dtype = np.float32))
+
+    assert reader.refresh()
+    assert reader._matrices[0] is first
+    assert reader.ids == ['a', 'b', 'c']
+    assert not reader.refresh()
+
+
+def test_compact(tmp_path):
+    store = EmbeddingStore(tmp_path, dtype = 'float32', max_segments = None)
+    store.add(['a', 'b'], np.zeros((2, 2), dtype = np.float32))
+    store.add(['a'], np.ones((1, 2), dtype = np.float32))
+
+    store.compact()
+
+    assert [segment['n'] for segment in store._segments] == [2]
+    np.testing.assert_array_equal(store.get('a'), [1, 1])
+    np.testing.assert_array_equal(store.get('b'), [0, 0])
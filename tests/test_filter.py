@@ -0,0 +1,47 @@
+import pandas as pd
+import pytest
+
+from SmartAMR.filter import filter_dataset
+
+COLUMNS = [None, ['antibiotic'], ['genome_id', 'antibiotic'], ['taxon_id', 'resistant_phenotype', 'measurement_value']]
+
+
+@pytest.fixture
+def metadata(tmp_path):
+    path = tmp_path / 'PATRIC_genomes_AMR.txt'
+    pd.DataFrame({
+        'genome_id': ['562.1', '562.2', '562.2', '287.10', '287.10', '1280.3'],
+        'genome_name': ['Escherichia coli A', 'Escherichia coli B', 'Escherichia coli B', 'Pseudomonas aeruginosa', 'Pseudomonas aeruginosa', 'Staphylococcus aureus'],
+        'taxon_id': [562, 562, 562, 287, 287, 1280],
+        'antibiotic': ['ampicillin', 'ampicillin', 'ciprofloxacin', 'ampicillin', 'ciprofloxacin', 'ampicillin'],
+        'resistant_phenotype': ['Resistant', None, 'Susceptible', 'Resistant', None, 'Resistant'],
+        'measurement_value': [32.0, 8.0, None, 64.0, 0.5, 16.0],
+    }).to_csv(path, sep = '\t', index = False)
+    return path
+
+
+@pytest.mark.parametrize('columns', COLUMNS)
+def test_filter_dataset_paths_agree(metadata, columns):
+    direct = filter_dataset(metadata, columns = columns)
+    cached = filter_dataset(metadata, columns = columns, cache = True)
+
+    pd.testing.assert_frame_equal(direct, cached)
+    assert len(direct) == 4
+    assert list(direct.columns) == (columns or list(pd.read_csv(metadata, sep = '\t', nrows = 0).columns))
+
+
+def test_filter_dataset_dtypes(metadata):
+    df = filter_dataset(metadata)
+
+    assert df['genome_id'].tolist() == ['562.1', '562.2', '287.10', '1280.3']
+    assert df['taxon_id'].tolist() == ['562', '562', '287', '1280']
+    assert isinstance(df['antibiotic'].dtype, pd.CategoricalDtype)
+    assert df['resistant_phenotype'].notna().all()
+
+
+@pytest.mark.parametrize('cache', [False, True])
+def test_filter_dataset_unknown_column(metadata, cache):
+    with pytest.raises(ValueError):
+        filter_dataset(metadata, columns = ['genome_id', 'mic'], cache = cache)
+    with pytest.raises(ValueError):
+        filter_dataset(metadata, filter_field = 'mic', cache = cache)
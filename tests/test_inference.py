@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+keras = pytest.importorskip('keras')
+
+from SmartAMR.encoding import NUCLEOTIDES
+from SmartAMR.inference import AMRScorer, export_classifier
+
+SEQ_LENGTH = 60
+# Largest score difference with model.predict per quantization
+TOLERANCES = {'none': 1e-5, 'float16': 5e-3, 'int8': 5e-2}
+
+
+@pytest.fixture(scope = 'module')
+def model():
+    """Embedding -> LSTM -> Dense classifier of the prototypes, with random weights"""
+
+    keras.utils.set_random_seed(0)
+    inputs = keras.Input(shape = (SEQ_LENGTH,))
+    embedded = keras.layers.Embedding(input_dim = len(NUCLEOTIDES), output_dim = 8)(inputs)
+    hidden = keras.layers.LSTM(units = 16)(embedded)
+    outputs = keras.layers.Dense(1, activation = 'sigmoid')(hidden)
+    return keras.Model(inputs, outputs)
+
+
+@pytest.fixture(scope = 'module')
+def sequences():
+    rng = np.random.default_rng(0)
+    # Shorter sequences are padded, longer ones truncated, some have ambiguous bases
+    lengths = rng.integers(1, SEQ_LENGTH + 20, size = 100)
+    sequences = [''.join(rng.choice(list(NUCLEOTIDES), size = length)) for length in lengths]
+    sequences[:5] = ['N' * 10, 'ACGTN' * 4, 'A', 'acgt' * 10, 'T' * SEQ_LENGTH]
+    return sequences
+
+
+@pytest.mark.parametrize('quantize', list(TOLERANCES))
+def test_exported_scores_match_keras(model, sequences, tmp_path, quantize):
+    path = export_classifier(model, tmp_path / f"amr_{quantize}.npz", quantize = quantize)
+    scorer = AMRScorer.load(path, batch_size = 32)
+
+    scores = scorer.score(sequences)
+    expected = model.predict(scorer.encode(sequences), verbose = 0)[:, 0]
+
+    assert scores.shape == (len(sequences),)
+    np.testing.assert_allclose(scores, expected, atol = TOLERANCES[quantize], rtol = 0)
+
+
+def test_batches_do_not_change_scores(model, sequences):
+    scores = AMRScorer.from_keras(model, batch_size = 7).score(sequences)
+
+    np.testing.assert_allclose(scores, AMRScorer.from_keras(model, batch_size = 256).score(sequences), atol = 1e-6)
+    np.testing.assert_allclose(scores[:1], AMRScorer.from_keras(model).score(sequences[:1]), atol = 1e-6)
+
+
+def test_linear_activation(sequences):
+    keras.utils.set_random_seed(1)
+    inputs = keras.Input(shape = (SEQ_LENGTH,))
+    hidden = keras.layers.LSTM(units = 8, activation = 'linear')(keras.layers.Embedding(len(NUCLEOTIDES), 4)(inputs))
+    model = keras.Model(inputs, keras.layers.Dense(1, activation = 'sigmoid')(hidden))
+    scorer = AMRScorer.from_keras(model)
+
+    np.testing.assert_allclose(scorer.score(sequences), model.predict(scorer.encode(sequences), verbose = 0)[:, 0], atol = 1e-5)
@@ -0,0 +1,205 @@
+import os
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from time import monotonic, sleep
+from typing import List
+
+import pytest
+
+from SmartAMR.manifest import COMPLETE, MISSING, DownloadManifest
+from SmartAMR.scrapper import GlobalDownloader, MetadataUpdater
+
+GENOME_IDS: List[str] = ['511145.12', '287.5706', '1280.1']
+KINDS: List[str] = ['contig', 'protein']
+
+
+def _genome_tree(root: Path) -> dict:
+    """genomes/<id>/<id>.fna and <id>.PATRIC.faa, the protein file of the last genome missing"""
+
+    files: dict = {}
+    for i, genome_id in enumerate(GENOME_IDS):
+        directory: Path = root / 'genomes' / genome_id
+        directory.mkdir(parents = True)
+        contents: dict = {f"{genome_id}.fna": f">{genome_id}\n" + 'ACGT' * (1000 * (i + 1)) + '\n'}
+        if genome_id != GENOME_IDS[-1]:
+            contents[f"{genome_id}.PATRIC.faa"] = f">{genome_id}\n" + 'MKV' * (500 * (i + 1)) + '\n'
+        for name, content in contents.items():
+            (directory / name).write_text(content)
+            files[name] = content.encode()
+
+    return files
+
+
+class _RecordingHandler(SimpleHTTPRequestHandler):
+    """Keep-alive file server recording the start of every request and the number of requests in progress"""
+
+    protocol_version = 'HTTP/1.1'
+    delay: float = 0.0
+
+    def parse_request(self):
+        # Called once the request line is read, a keep-alive connection waits for it in handle_one_request
+        self.started = monotonic()
+        with self.server.lock:
+            self.server.active += 1
+            self.server.max_active = max(self.server.max_active, self.server.active)
+        sleep(self.delay)
+        return super().parse_request()
+
+    def handle_one_request(self):
+        self.started = None
+        try:
+            super().handle_one_request()
+        finally:
+            if self.started is not None:
+                with self.server.lock:
+                    self.server.active -= 1
+                    self.server.requests.append((self.started, self.command, self.path))
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def http_server(tmp_path):
+    files: dict = _genome_tree(tmp_path / 'remote')
+    server = ThreadingHTTPServer(('127.0.0.1', 0), partial(_RecordingHandler, directory = str(tmp_path / 'remote')))
+    server.daemon_threads = True
+    server.lock, server.active, server.max_active, server.requests = threading.Lock(), 0, 0, []
+    server.files = files
+    thread = threading.Thread(target = server.serve_forever, daemon = True)
+    thread.start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def outdir(tmp_path) -> Path:
+    path: Path = tmp_path / 'local'
+    path.mkdir()
+    return path
+
+
+def _base_url(server) -> str:
+    return f"http://127.0.0.1:{server.server_address[1]}/genomes/"
+
+
+def test_download_many_report(http_server, outdir):
+    downloader = GlobalDownloader(outdir, wait = 0, base_url = _base_url(http_server), retries = 0)
+    report = downloader.download_many(GENOME_IDS, kinds = KINDS, workers = 4)
+
+    expected: dict = http_server.files
+    assert report.n_files == len(expected) == 5
+    assert report.n_failed == 1 and report.n_skipped == 0
+    assert report.failures[0][0] == f"{GENOME_IDS[-1]}.PATRIC.faa"
+    assert report.n_bytes == sum(len(content) for content in expected.values())
+    for name, content in expected.items():
+        assert (outdir / name).read_bytes() == content
+
+    assert report.elapsed > 0
+    assert report.files_per_s == pytest.approx(report.n_files / report.elapsed)
+    assert report.mb_per_s == pytest.approx(report.n_bytes / 1e6 / report.elapsed)
+    # One pooled connection per request (HEAD then GET per file), most of them reused
+    assert report.connections_opened + report.connections_reused == len(http_server.requests)
+    assert 1 <= report.connections_opened <= 4 + report.n_failed
+    assert report.connections_reused > 0
+    assert str(report).startswith(f"5 files (1 failed, 0 skipped), {report.n_bytes / 1e6:.2f} MB")
+
+    assert downloader.manifest.get(GENOME_IDS[0], 'fna').status == COMPLETE
+    assert downloader.manifest.get(GENOME_IDS[-1], 'PATRIC.faa').status == MISSING
+
+
+def test_download_many_skips_done_files(http_server, outdir):
+    GlobalDownloader(outdir, wait = 0, base_url = _base_url(http_server), retries = 0).download_many(GENOME_IDS, kinds = KINDS)
+    n_requests: int = len(http_server.requests)
+
+    report = GlobalDownloader(outdir, wait = 0, base_url = _base_url(http_server), retries = 0).download_many(GENOME_IDS, kinds = KINDS)
+
+    assert (report.n_files, report.n_failed, report.n_skipped) == (0, 0, 6)
+    assert len(http_server.requests) == n_requests
+
+
+def test_download_many_rate_limit(http_server, outdir):
+    wait: float = 0.2
+    downloader = GlobalDownloader(outdir, wait = wait, base_url = _base_url(http_server), retries = 0)
+    report = downloader.download_many(GENOME_IDS, kinds = ['contig'], workers = 4)
+
+    assert report.n_files == len(GENOME_IDS)
+    # Each file starts with a HEAD request, whatever the number of workers they start `wait` apart
+    starts: List[float] = sorted(start for start, command, _ in http_server.requests if command == 'HEAD')
+    assert len(starts) == len(GENOME_IDS)
+    assert min(b - a for a, b in zip(starts, starts[1:])) >= wait - 0.05
+    assert report.elapsed >= wait * (len(GENOME_IDS) - 1)
+
+
+def test_download_many_max_per_host(http_server, outdir):
+    _RecordingHandler.delay = 0.05
+    try:
+        downloader = GlobalDownloader(outdir, wait = 0, max_per_host = 1, base_url = _base_url(http_server), retries = 0)
+        report = downloader.download_many(GENOME_IDS, kinds = ['contig'], workers = 4)
+    finally:
+        _RecordingHandler.delay = 0.0
+
+    assert report.n_files == len(GENOME_IDS)
+    assert http_server.max_active == 1
+
+
+def test_download_many_ftp(tmp_path, outdir):
+    pytest.importorskip('pyftpdlib')
+    from pyftpdlib.authorizers import DummyAuthorizer
+    from pyftpdlib.handlers import FTPHandler
+    from pyftpdlib.servers import ThreadedFTPServer
+
+    files: dict = _genome_tree(tmp_path / 'remote')
+    authorizer = DummyAuthorizer()
+    authorizer.add_anonymous(str(tmp_path / 'remote'))
+    handler = type('Handler', (FTPHandler,), {'authorizer': authorizer})
+    server = ThreadedFTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target = server.serve_forever, kwargs = {'timeout': 0.1}, daemon = True)
+    thread.start()
+
+    try:
+        downloader = GlobalDownloader(outdir, wait = 0, base_url = f"ftp://127.0.0.1:{server.address[1]}/genomes/", retries = 0)
+        report = downloader.download_many(GENOME_IDS, kinds = KINDS, workers = 2)
+        downloader.transport.close()
+    finally:
+        server.close_all()
+
+    assert (report.n_files, report.n_failed) == (5, 1)
+    assert report.n_bytes == sum(len(content) for content in files.values())
+    assert report.connections_reused > 0
+    assert downloader.manifest.get(GENOME_IDS[-1], 'PATRIC.faa').status == MISSING
+
+
+def _write_metadata(path: Path, rows: List[str]) -> None:
+    path.parent.mkdir(parents = True, exist_ok = True)
+    path.write_text('genome_id\tantibiotic\tresistant_phenotype\n' + ''.join(f"{row}\n" for row in rows))
+
+
+def test_metadata_updater(http_server, outdir):
+    remote: Path = Path(http_server.RequestHandlerClass.keywords['directory']) / 'RELEASE_NOTES' / 'PATRIC_genomes_AMR.txt'
+    _write_metadata(remote, ['562.1\tampicillin\tResistant'])
+    updater = MetadataUpdater(outdir, wait = 0)
+    updater.base_url = f"http://127.0.0.1:{http_server.server_address[1]}/"
+
+    delta = updater()
+    assert delta['change'].tolist() == ['added'] and updater.new_genome_ids() == ['562.1']
+    assert updater() is None
+
+    # The release is checked by verify, and kept out of the genome manifest
+    assert updater.manifest.verify(outdir) == []
+    assert updater.manifest.get(*updater.key).status == COMPLETE
+    assert DownloadManifest.in_directory(outdir).entries() == []
+    assert updater() is None
+
+    _write_metadata(remote, ['562.1\tampicillin\tResistant', '287.5\tampicillin\tSusceptible'])
+    assert updater()['change'].tolist() == ['added'] and updater.new_genome_ids() == ['287.5']
+
+    # Same content, new modification time: downloaded again, but no genome is new
+    os.utime(remote, (remote.stat().st_atime, remote.stat().st_mtime + 10))
+    assert updater() is None
+    assert updater.new_genome_ids() == []
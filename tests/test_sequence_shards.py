@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from SmartAMR.encoding import encode_batch
+from SmartAMR.sequence_shards import SequenceShards, count_records, shards_from_fasta
+
+
+def _write_fasta(path, n, seed):
+    rng = np.random.default_rng(seed)
+    sequences = [''.join(rng.choice(list('ACGT'), size = int(rng.integers(20, 40)))) for _ in range(n)]
+    # Sequences wrapped over several lines, as in the BV-BRC files
+    path.write_text(''.join(f">{path.stem}_{i}\n{sequence[:15]}\n{sequence[15:]}\n" for i, sequence in enumerate(sequences)))
+    return sequences
+
+
+def test_count_records(tmp_path):
+    _write_fasta(tmp_path / 'genes.fasta', 17, seed = 0)
+
+    assert count_records(tmp_path / 'genes.fasta') == 17
+
+
+def test_label_ratio_per_shard(tmp_path):
+    _write_fasta(tmp_path / 'amr.fasta', 200, seed = 0)
+    _write_fasta(tmp_path / 'other.fasta', 4000, seed = 1)
+
+    shards = shards_from_fasta([tmp_path / 'amr.fasta', tmp_path / 'other.fasta'], tmp_path / 'shards', 32, labels = [1, 0], shard_size = 400)
+
+    assert len(shards) == 4200 and len(shards.shards) == 11
+    ratios = [shards.read_block(s, 0, int(n))[1].mean() for s, n in enumerate(shards.sizes)]
+    # 200 / 4200 = 0.048, i.e. 19 positives per shard of 400 (standard deviation about 4)
+    assert all(0.0125 <= ratio <= 0.0875 for ratio in ratios[:-1])
+    assert sum(shards.read_block(s, 0, int(n))[1].sum() for s, n in enumerate(shards.sizes)) == 200
+
+
+def test_records_round_trip(tmp_path):
+    amr = _write_fasta(tmp_path / 'amr.fasta', 30, seed = 0)
+    other = _write_fasta(tmp_path / 'other.fasta', 50, seed = 1)
+
+    shards = shards_from_fasta([tmp_path / 'amr.fasta', tmp_path / 'other.fasta'], tmp_path / 'shards', 32, labels = [1, 0], shard_size = 32)
+    reopened = SequenceShards(tmp_path / 'shards')
+    codes, labels = zip(*(reopened.read_block(s, 0, int(n)) for s, n in enumerate(shards.sizes)))
+    codes, labels = np.concatenate(codes), np.concatenate(labels)
+
+    # Each file keeps its record order
+    np.testing.assert_array_equal(codes[labels == 1], encode_batch(amr, length = 32))
+    np.testing.assert_array_equal(codes[labels == 0], encode_batch(other, length = 32))
+
+
+def test_labels_per_file(tmp_path):
+    _write_fasta(tmp_path / 'amr.fasta', 3, seed = 0)
+
+    with pytest.raises(ValueError):
+        shards_from_fasta([tmp_path / 'amr.fasta'], tmp_path / 'shards', 32, labels = [1, 0])
@@ -6,15 +6,99 @@ from main import *
 import pandas as pd
 import numpy as np
 from Bio import Align
+from SmartAMR.embedding_store import EmbeddingStore
+from SmartAMR.similarity import SimilarityIndex
+from serving import MicroBatcher, ModelRegistry
 
 import os
 from Bio.PDB import PDBList
 
 BACTERIADB = 'bacteriaDB.fa'
 PHAGEDB = 'phageDB.fa'
+TOP_K = 100  # default number of pairs returned by a one-vs-database evaluation
+BLOCK_SIZE = 1024  # records scored per model call
+
+EMBEDDINGS_PATH = './data/embeddings'
+
+# pair model: 'dummy' or 'package.module:factory' (factory(path) -> object with predict_pairs(bacteria_sequences, phage_sequences))
+MODEL = os.environ.get('SMARTAMR_MODEL', 'dummy')
+MODEL_PATH = os.environ.get('SMARTAMR_MODEL_PATH')
+MAX_BATCH_SIZE = int(os.environ.get('SMARTAMR_MAX_BATCH_SIZE', 256))  # pairs per forward pass
+MAX_WAIT_MS = float(os.environ.get('SMARTAMR_MAX_WAIT_MS', 5))  # wait for more pairs before a forward pass
+
+# the weights are loaded once, the pairs of concurrent requests are scored together
+REGISTRY = ModelRegistry()
+REGISTRY.load('pairs', MODEL, MODEL_PATH)
+BATCHER = MicroBatcher(REGISTRY.get('pairs').predict_pairs, MAX_BATCH_SIZE, MAX_WAIT_MS)
+set_batcher(BATCHER)
+
+# name -> (offset, length) indexes, built once so that a lookup is a single seek and read
+load_index(BACTERIADB)
+load_index(PHAGEDB)
+
+# precomputed embedding stores (built offline with SmartAMR.embedding_store), memory-mapped once
+EMBEDDINGS = {
+    database: EmbeddingStore(f"{EMBEDDINGS_PATH}/{database.split('.')[0]}")
+    for database in (BACTERIADB, PHAGEDB)
+    if os.path.isdir(f"{EMBEDDINGS_PATH}/{database.split('.')[0]}")
+}
+
+# similarity indexes over the stores, read from <database>.index.npz when it was built offline
+SIMILARITY = {
+    database: SimilarityIndex.load(f"{EMBEDDINGS_PATH}/{database.split('.')[0]}.index.npz")
+    if os.path.isfile(f"{EMBEDDINGS_PATH}/{database.split('.')[0]}.index.npz")
+    else SimilarityIndex.from_store(store)
+    for database, store in EMBEDDINGS.items()
+    if len(store) > 0
+}
 
 app = Flask(__name__)
 
+def parse_int(value, name, minimum):
+    """value (JSON number or query string) as an int >= minimum, a ValueError with a message for the client otherwise"""
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(f"{name} must be an integer, got {value!r}")
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be an integer, got {value!r}")
+    if number < minimum:
+        raise ValueError(f"{name} must be >= {minimum}, got {number}")
+    return number
+
+def parse_float(value, name):
+    """value as a finite float, a ValueError with a message for the client otherwise"""
+    if isinstance(value, bool):
+        raise ValueError(f"{name} must be a number, got {value!r}")
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a number, got {value!r}")
+    if not np.isfinite(number):
+        raise ValueError(f"{name} must be finite, got {value!r}")
+    return number
+
+def parse_embedding(value, dim):
+    """value (one embedding or a list of embeddings) as a float32 (n, dim) matrix, a ValueError with a message for the client otherwise"""
+    try:
+        queries = np.array(value)
+    except (TypeError, ValueError):
+        queries = None
+    # Neither strings nor booleans, which numpy would cast to floats
+    if queries is None or queries.ndim not in (1, 2) or (queries.size and queries.dtype.kind not in 'iuf'):
+        raise ValueError("embedding must be a list of numbers or a list of lists of numbers of the same length")
+    if queries.size == 0:
+        raise ValueError("embedding must not be empty")
+    queries = np.atleast_2d(queries).astype(np.float32)
+    if not np.isfinite(queries).all():
+        raise ValueError("embedding values must be finite")
+    if dim is not None and queries.shape[1] != dim:
+        raise ValueError(f"embedding must have {dim} values, got {queries.shape[1]}")
+    return queries
+
+def bad_request(error):
+    return jsonify({'status': 'error', 'message': str(error), 'data': None}), 400
+
 @app.route('/')
 
 def hello():
@@ -28,6 +112,14 @@ def evaluate_phage_bacteria():
     bacteriaData = payload['bacteria']
     phageData = payload['phage']
 
+    try:
+        top_k = payload.get('top_k', TOP_K)
+        top_k = None if top_k is None else parse_int(top_k, 'top_k', 1)
+        threshold = payload.get('threshold')
+        threshold = None if threshold is None else parse_float(threshold, 'threshold')
+    except ValueError as e:
+        return bad_request(e)
+
     results = {}
     k = 1
 
@@ -46,23 +138,79 @@ def evaluate_phage_bacteria():
         }
         k += 1
 
-    # if only one or the other sequence is provided, we iterate over the complementary database to produce an array of results
+    # if only one or the other sequence is provided, the complementary database is scored by blocks
+    # and only the top_k pairs above the optional threshold are returned, best first
     else:
         if len(bacteriaData['sequence']) > 0:
-            for name, sequence in parseDB(PHAGEDB):
+            for name, score in rank_against_database(bacteriaData['sequence'], PHAGEDB, 'bacteria', top_k, threshold, BLOCK_SIZE):
                 results[k] = {
                     'bacteria':bacteriaData['name'],
                     'phage':name,
-                    'evaluation': evaluate_sequences(bacteriaData['sequence'], sequence)
+                    'evaluation': score
                 }
                 k += 1
         if len(phageData['name']) > 0:
-            for name, sequence in parseDB(BACTERIADB):
+            for name, score in rank_against_database(phageData['sequence'], BACTERIADB, 'phage', top_k, threshold, BLOCK_SIZE):
                 results[k] = {
                     'bacteria':name,
                     'phage':phageData['name'],
-                    'evaluation': evaluate_sequences(sequence, phageData['sequence'])
+                    'evaluation': score
                 }
                 k += 1
 
-    return jsonify({'status': 'ok', 'data': results})
\ No newline at end of file
+    return jsonify({'status': 'ok', 'data': results})
+
+@app.route('/api/embedding/', methods=['POST'])
+@cross_origin()
+def get_embedding():
+    payload = request.get_json()
+    database = BACTERIADB if payload.get('database') == 'bacteria' else PHAGEDB
+    store = EMBEDDINGS.get(database)
+
+    if store is None or payload['name'] not in store:
+        return jsonify({'status': 'not found', 'data': None}), 404
+
+    return jsonify({'status': 'ok', 'data': store.get(payload['name']).tolist()})
+
+@app.route('/api/similar/', methods=['POST'])
+@cross_origin()
+def get_similar():
+    """Closest records of a database to a named record or to embeddings, e.g. the known phages closest to a new phage"""
+    payload = request.get_json()
+    database = BACTERIADB if payload.get('database') == 'bacteria' else PHAGEDB
+    try:
+        k = parse_int(payload.get('k', 10), 'k', 1)
+    except ValueError as e:
+        return bad_request(e)
+    searched = k
+    index = SIMILARITY.get(database)
+
+    if index is None:
+        return jsonify({'status': 'no index', 'data': None}), 404
+
+    if 'embedding' in payload:
+        try:
+            queries = parse_embedding(payload['embedding'], None if index.vectors is None else index.vectors.shape[1])
+        except ValueError as e:
+            return bad_request(e)
+    elif payload.get('name') in EMBEDDINGS[database]:
+        queries = EMBEDDINGS[database].get(payload['name'])[None, :]
+        searched = k + 1  # the record itself is found first
+    else:
+        return jsonify({'status': 'not found', 'data': None}), 404
+
+    results = []
+    for neighbours in index.search(queries, searched):
+        results.append([{'name': name, 'distance': distance} for name, distance in neighbours if name != payload.get('name')][:k])
+
+    return jsonify({'status': 'ok', 'metric': index.metric, 'data': results})
+
+@app.route('/api/batching/', methods=['GET'])
+@cross_origin()
+def get_batching_stats():
+    """Batch sizes and per-batch timings of the pair model"""
+    try:
+        last = parse_int(request.args.get('last', 20), 'last', 0)
+    except ValueError as e:
+        return bad_request(e)
+    return jsonify({'status': 'ok', 'model': MODEL, 'data': BATCHER.stats(last)})
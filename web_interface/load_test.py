@@ -0,0 +1,79 @@
+# load_test.py
+"""Concurrent requests to /api/evaluate/, then the batching stats of the server.
+
+Usage (in the web_interface folder):
+    python load_test.py [--requests 2000] [--concurrency 64] [--max-batch-size 256] [--max-wait-ms 5]
+    python load_test.py --url http://127.0.0.1:5000 --requests 2000
+
+Without --url, the app is started in this process with the dummy model (SMARTAMR_MODEL=dummy)
+on a free port. Each request gives both sequences, so it scores one pair.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+import numpy as np
+
+
+def post(url, payload):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(), headers={'Content-Type': 'application/json'})
+    start = perf_counter()
+    with urllib.request.urlopen(request) as response:
+        json.load(response)
+    return perf_counter() - start
+
+
+def start_local_server(max_batch_size, max_wait_ms):
+    """Starts the app with the dummy model in a background thread, returns its url"""
+    os.environ.setdefault('SMARTAMR_MODEL', 'dummy')
+    os.environ['SMARTAMR_MAX_BATCH_SIZE'] = str(max_batch_size)
+    os.environ['SMARTAMR_MAX_WAIT_MS'] = str(max_wait_ms)
+    from werkzeug.serving import make_server
+    from app import app
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)  # no line per request
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="running server, by default the app is started in this process")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--length", type=int, default=500, help="length of the random sequences")
+    parser.add_argument("--max-batch-size", type=int, default=256)
+    parser.add_argument("--max-wait-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    url = args.url or start_local_server(args.max_batch_size, args.max_wait_ms)
+    rng = random.Random(0)
+    payloads = [{'bacteria': {'name': f"bacteria_{i}", 'sequence': ''.join(rng.choices('ACDEFGHIKLMNPQRSTVWY', k=args.length))},
+                 'phage': {'name': f"phage_{i}", 'sequence': ''.join(rng.choices('ACDEFGHIKLMNPQRSTVWY', k=args.length))}}
+                for i in range(args.requests)]
+
+    post(f"{url}/api/evaluate/", payloads[0])  # warm-up
+    start = perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        latencies = np.array(list(executor.map(lambda payload: post(f"{url}/api/evaluate/", payload), payloads))) * 1000
+    elapsed = perf_counter() - start
+
+    with urllib.request.urlopen(f"{url}/api/batching/?last=0") as response:
+        stats = json.load(response)['data']
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}: {args.requests / elapsed:,.0f} req/s, "
+          f"latency p50 {np.percentile(latencies, 50):.1f} ms, p95 {np.percentile(latencies, 95):.1f} ms, p99 {np.percentile(latencies, 99):.1f} ms")
+    print(f"{stats['n_batches']} batches of {stats['mean_batch_size']:.1f} pairs on average (max {stats['max_batch_size']}, "
+          f"wait {stats['max_wait_ms']:g} ms), forward pass {stats['mean_compute_ms']:.1f} ms (p95 {stats['p95_compute_ms']:.1f} ms), "
+          f"queue {stats['mean_queue_ms']:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,51 +1,130 @@
 ### Main python script for data generation
-# TODO: connect evaluate_sequences to model to AI algorithm
 import sys
+import heapq
 import pandas as pd
+import numpy as np
 import random
 
 DATABASE_PATH = './data'
 
+# micro-batching scorer of the pairs (serving.MicroBatcher), set once at app startup with set_batcher
+BATCHER = None
+
+def set_batcher(batcher):
+  global BATCHER
+  BATCHER = batcher
+
 def evaluate_sequences(bacteria_sequence, phage_sequence):
-  # TODO input into the model here
   """Coucou c'est là qu'il faut modifier et retourner un string ou un nombre"""
+  if BATCHER is not None:
+    return float(BATCHER.score([bacteria_sequence], [phage_sequence])[0])
+  # no model loaded
   binary = [1, 0]
   return random.choice(binary)
 
+def evaluate_sequences_batch(bacteria_sequences, phage_sequences):
+  """Scores a block of (bacteria, phage) pairs at once, returns an array of len(bacteria_sequences) scores"""
+  if BATCHER is not None:
+    return BATCHER.score(bacteria_sequences, phage_sequences)
+  # no model loaded
+  return np.random.randint(0, 2, size=len(bacteria_sequences)).astype(float)
+
+def iter_blocks(database, block_size=1024):
+  """Streams the records of a database as blocks of (names, sequences)"""
+  names, sequences = [], []
+  for name, sequence in parseDB(database):
+    names.append(name)
+    sequences.append(sequence)
+    if len(names) == block_size:
+      yield names, sequences
+      names, sequences = [], []
+  if names:
+    yield names, sequences
+
+def rank_against_database(sequence, database, query='bacteria', top_k=100, threshold=None, block_size=1024):
+  """Scores one sequence against every record of a database, one model call per block
+
+  query is the side of the given sequence ('bacteria' or 'phage'), the records of the database
+  are the other side. Returns the top_k (name, score) pairs with a score >= threshold, best first
+  (all of them if top_k is None).
+  """
+  best = []  # min-heap of (score, -position, name), the worst kept pair on top
+  position = 0
+  for names, sequences in iter_blocks(database, block_size):
+    queries = [sequence] * len(sequences)
+    if query == 'bacteria':
+      scores = evaluate_sequences_batch(queries, sequences)
+    else:
+      scores = evaluate_sequences_batch(sequences, queries)
+    scores = np.asarray(scores, dtype=float)
+
+    keep = np.arange(len(scores)) if threshold is None else np.flatnonzero(scores >= threshold)
+    if top_k is not None and len(keep) > top_k:
+      # only the block top_k can enter the running ranking, ties broken by database order
+      keep = keep[np.lexsort((keep, -scores[keep]))[:top_k]]
+    for i in keep:
+      item = (float(scores[i]), -(position + i), names[i])
+      if top_k is None or len(best) < top_k:
+        heapq.heappush(best, item)
+      elif item > best[0]:
+        heapq.heapreplace(best, item)
+    position += len(scores)
+
+  return [(name, score) for score, _, name in sorted(best, reverse=True)]
+
+# name -> [(offset, length), ...] of the sequence lines of each record, per database
+DB_INDEXES = {}
+_STRIP = str.maketrans('', '', '\r\n')
+
 def parseDB(database):
-  with open(f"{DATABASE_PATH}/{database}") as fasta:
-    current_prot = ""
-    current_name = ""
-    for line in fasta.readlines():
+  """Streams the (name, sequence) records of a database, the lines of a sequence are joined once"""
+  with open(f"{DATABASE_PATH}/{database}", buffering=1 << 20) as fasta:
+    current_name = None
+    chunks = []
+    for line in fasta:
       if line[0] == ">":
-        if len(current_prot) > 0:
-            yield current_name, current_prot
-        current_name = line[1:].replace('\n', '')
-        current_prot = ""
+        if current_name is not None and chunks:
+          yield current_name, "".join(chunks)
+        current_name = line[1:].rstrip('\r\n')
+        chunks = []
       else:
-          current_prot += line.replace('\n', '')
-    yield current_name, current_prot
+        chunks.append(line.rstrip('\r\n'))
+    if current_name is not None:
+      yield current_name, "".join(chunks)
+
+def index_database(database):
+  """Scans a database once and returns name -> [(offset, length), ...] of the sequence lines of each record"""
+  index = {}
+  with open(f"{DATABASE_PATH}/{database}", 'rb', buffering=1 << 20) as fasta:
+    offset = 0
+    current_name = None
+    start = 0
+    for line in fasta:
+      if line[:1] == b">":
+        if current_name is not None:
+          index.setdefault(current_name, []).append((start, offset - start))
+        current_name = line[1:].rstrip(b'\r\n').decode()
+        start = offset + len(line)
+      offset += len(line)
+    if current_name is not None:
+      index.setdefault(current_name, []).append((start, offset - start))
+  return index
+
+def load_index(database):
+  """Builds the index of a database, done once at app startup"""
+  DB_INDEXES[database] = index_database(database)
+  return DB_INDEXES[database]
 
 def retrieve_prots(name, database):
   """Retrieves proteic sequence in the database"""
+  index = DB_INDEXES.get(database)
+  if index is None:
+    index = load_index(database)
   proteic_sequences = []
-  with open(f"{DATABASE_PATH}/{database}") as fasta:
-    save_prot = False
-    current_prot = ""
-    for line in fasta.readlines():
-      if line[0] == ">":
-        if line[1:].replace('\n','') == name:
-          save_prot = True
-        else:
-          if save_prot:
-            proteic_sequences.append(current_prot)
-            current_prot = ""
-          save_prot = False
-      else:
-        if save_prot:
-          current_prot += line.replace('\n', '')
-    if save_prot:
-      proteic_sequences.append(current_prot)
-    return proteic_sequences
-
-
+  records = index.get(name, [])
+  if records:
+    with open(f"{DATABASE_PATH}/{database}", 'rb') as fasta:
+      for offset, length in records:
+        fasta.seek(offset)
+        proteic_sequences.append(fasta.read(length).decode().translate(_STRIP))
+  return proteic_sequences
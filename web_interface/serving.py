@@ -0,0 +1,176 @@
+# serving.py
+# Model registry and micro-batching of the (bacteria, phage) pairs scored by the API
+
+import importlib
+import queue
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import asdict, dataclass
+from time import perf_counter, sleep
+
+import numpy as np
+
+
+class DummyPairModel:
+    """Stand-in pair model for load tests: deterministic scores in [0, 1), and a forward pass
+    costing latency_ms per call plus per_pair_ms per pair, as a batched CPU model would"""
+
+    def __init__(self, latency_ms=2.0, per_pair_ms=0.02):
+        self.latency_ms = latency_ms
+        self.per_pair_ms = per_pair_ms
+
+    def predict_pairs(self, bacteria_sequences, phage_sequences):
+        sleep((self.latency_ms + self.per_pair_ms * len(bacteria_sequences)) / 1000)
+        return np.array([zlib.crc32(f"{bacteria}|{phage}".encode()) / 2 ** 32
+                         for bacteria, phage in zip(bacteria_sequences, phage_sequences)])
+
+
+def _import_factory(spec):
+    """'package.module:factory' -> factory"""
+    module, _, attribute = spec.partition(':')
+    if not attribute:
+        raise ValueError(f"Unknown model {spec}, expected one of {sorted(MODEL_LOADERS)} or 'package.module:factory'")
+    return getattr(importlib.import_module(module), attribute)
+
+
+# model kind -> loader(path, **kwargs), the loaded model has predict_pairs(bacteria_sequences, phage_sequences) -> scores
+MODEL_LOADERS = {
+    'dummy': lambda path=None, **kwargs: DummyPairModel(**kwargs),
+}
+
+
+class ModelRegistry:
+    """Models loaded once at startup, by name"""
+
+    def __init__(self):
+        self._models = {}
+        self._specs = {}
+        self._lock = threading.Lock()
+
+    def load(self, name, spec='dummy', path=None, **kwargs):
+        """Loads the weights at path with the loader of spec ('dummy' or 'package.module:factory'),
+        a model already loaded under name with the same spec and path is returned as is"""
+        with self._lock:
+            if self._specs.get(name) == (spec, path) and not kwargs:
+                return self._models[name]
+            loader = MODEL_LOADERS.get(spec) or _import_factory(spec)
+            self._models[name] = loader(path, **kwargs)
+            self._specs[name] = (spec, path)
+            return self._models[name]
+
+    def get(self, name):
+        if name not in self._models:
+            raise KeyError(f"No model {name}, loaded models: {sorted(self._models)}")
+        return self._models[name]
+
+    def names(self):
+        return sorted(self._models)
+
+
+@dataclass
+class BatchTiming:
+    size: int
+    queue_ms: float  # wait of the oldest pair of the batch before the forward pass
+    compute_ms: float
+
+
+class MicroBatcher:
+    """Coalesces the pairs submitted by concurrent requests into batched forward passes
+
+    A background thread takes the first waiting pair, then collects more pairs until
+    max_batch_size pairs or max_wait_ms after the arrival of the first one, and scores them
+    with a single predict call. The timings of the last batches are kept for stats().
+    """
+
+    def __init__(self, predict, max_batch_size=256, max_wait_ms=5.0, history=1000):
+        self.predict = predict
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.timings = deque(maxlen=history)
+
+        self._queue = queue.SimpleQueue()
+        self._totals = {'n_batches': 0, 'n_pairs': 0, 'compute_ms': 0.0, 'queue_ms': 0.0}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, bacteria_sequence, phage_sequence):
+        """Future of the score of one pair"""
+        future = Future()
+        self._queue.put((bacteria_sequence, phage_sequence, future, perf_counter()))
+        return future
+
+    def score(self, bacteria_sequences, phage_sequences, timeout=None):
+        """Scores of pairs, blocking until their batches are done"""
+        futures = [self.submit(bacteria, phage) for bacteria, phage in zip(bacteria_sequences, phage_sequences)]
+        return np.array([future.result(timeout) for future in futures], dtype=float)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def stats(self, last=20):
+        """Totals since startup, and the timings of the last batches"""
+        with self._lock:
+            totals = dict(self._totals)
+            recent = list(self.timings)
+        n_batches = max(totals['n_batches'], 1)
+        compute = np.array([timing.compute_ms for timing in recent]) if recent else np.zeros(1)
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'n_batches': totals['n_batches'],
+            'n_pairs': totals['n_pairs'],
+            'mean_batch_size': totals['n_pairs'] / n_batches,
+            'mean_compute_ms': totals['compute_ms'] / n_batches,
+            'mean_queue_ms': totals['queue_ms'] / n_batches,
+            'p95_compute_ms': float(np.percentile(compute, 95)),
+            'pending': self._queue.qsize(),
+            'last_batches': [asdict(timing) for timing in recent[max(len(recent) - last, 0):]],
+        }
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = first[3] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # stop after this batch
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+
+            start = perf_counter()
+            try:
+                scores = self.predict([item[0] for item in batch], [item[1] for item in batch])
+                if len(scores) != len(batch):
+                    raise ValueError(f"The model returned {len(scores)} scores for {len(batch)} pairs")
+                for item, score in zip(batch, scores):
+                    item[2].set_result(float(score))
+            except Exception as e:
+                print(f"Error of batch of {len(batch)} pairs: {e}")
+                for item in batch:
+                    if not item[2].done():
+                        item[2].set_exception(e)
+            end = perf_counter()
+
+            timing = BatchTiming(len(batch), (start - first[3]) * 1000, (end - start) * 1000)
+            with self._lock:
+                self.timings.append(timing)
+                self._totals['n_batches'] += 1
+                self._totals['n_pairs'] += timing.size
+                self._totals['compute_ms'] += timing.compute_ms
+                self._totals['queue_ms'] += timing.queue_ms